@@ -0,0 +1,237 @@
+"""
+Benchmark chromoo's own evaluation overhead, with the synthetic cadet-cli in
+this directory instead of CADET (see benchmarks/cadet-cli).
+
+For every case and nproc, a fixed batch of random individuals is evaluated
+through ChromooProblem (worker pool, template patching, loading, post
+processing, scoring; no evaluation store) and reported as:
+    - evals/s: throughput over the batch, and efficiency = throughput / ideal,
+      where ideal = nproc / mean time spent in cadet-cli
+    - idle: fraction of idle cores over the batch, 1 - worker time / (nproc x wall)
+    - overhead: per-evaluation time outside cadet-cli (median, p90), from the
+      phase timings (see chromoo/timing.py)
+    - startup: time to start the worker pool
+    - stand-in: time cadet-cli takes without sleeping (python and h5py
+      startup, writing the outputs), part of the cadet phase
+    - memory: peak RSS of the main process and of the largest worker
+    - failed: evaluations that failed for good (see --fail, failurePolicy.py)
+    - with --pin: evaluations and median cadet-cli time per CPU slot (see chromoo/affinity.py)
+
+Cases, built from the examples:
+    - outlet1d: 1D column, outlet chromatogram (examples/10k-mono-1d-p2)
+    - bulk2d: 2D polydisperse column, bulk concentration per radial zone (examples/Averaged-AC-bulk)
+    - poly2d: same column, solid phase mass summed over all 20 particle types (post_mass_solid_all_partypes)
+
+The fake outputs don't match the reference data; the scores are meaningless,
+only their shapes matter.
+
+With --warmup, another batch is evaluated first, so that the scheduler can
+predict the runtimes (see chromoo/scheduler.py). Compare --order fifo and
+longest_first with a --spread.
+
+    python benchmarks/run.py --cases outlet1d bulk2d --nproc 1 2 4 --evaluations 32 --sleep 0.2
+    python benchmarks/run.py --cases outlet1d --nproc 4 --sleep 0.2 --spread 4 --warmup 32 --order fifo longest_first
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+BENCHMARKS = Path(__file__).resolve().parent
+EXAMPLES = BENCHMARKS.parent / 'examples'
+
+# The cadet-cli path is resolved when chromoo.cadetSimulation is imported
+os.environ['PATH'] = f"{BENCHMARKS}{os.pathsep}{os.environ.get('PATH', '')}"
+sys.path.insert(0, str(BENCHMARKS.parent))
+
+from addict import Dict
+
+from chromoo import ChromooProblem, ConfigHandler
+from chromoo.log import Logger
+
+def radial_objectives(name, path, reference, n=5):
+    """ One objective per radial zone, averaged along the column """
+    return [ {
+        'name': f'{name}{zone}',
+        'filename': str(reference / f'radial_shell_integrate_time_scalar_0_{zone}_new.csv'),
+        'path': path,
+        'take': [2, zone],
+        'combine_data_axis': 1,
+        } for zone in range(n) ]
+
+def dispersion_parameters(unit, length, paths=('col_dispersion',)):
+    return [ {
+        'name': path,
+        'type': 'vector',
+        'length': length,
+        'path': f'input.model.{unit}.{path}',
+        'min_value': 1.0e-12,
+        'max_value': 1.0e-4,
+        } for path in paths ]
+
+CASES = {
+    'outlet1d': {
+        'filename': str(EXAMPLES / '10k-mono-1d-p2' / '10k-mono.mono1d.yaml'),
+        'parameters': dispersion_parameters('unit_002', 1),
+        'objectives': [ {
+            'name': 'outlet',
+            'filename': str(EXAMPLES / '10k-mono-1d-p2' / 'chromatogram-corrected.csv'),
+            'path': 'output.solution.unit_003.solution_outlet_comp_000',
+            } ],
+    },
+    'bulk2d': {
+        'filename': str(EXAMPLES / 'Averaged-AC-bulk' / 'long.poly2d.yaml'),
+        'parameters': dispersion_parameters('unit_002', 5, ('col_dispersion', 'col_dispersion_radial')),
+        'objectives': radial_objectives('bulk', 'output.solution.unit_002.solution_bulk', EXAMPLES / 'Averaged-AC-bulk' / 'reference'),
+    },
+    'poly2d': {
+        'filename': str(EXAMPLES / 'Averaged-AC-bulk' / 'long.poly2d.yaml'),
+        'parameters': dispersion_parameters('unit_002', 5, ('col_dispersion', 'col_dispersion_radial')),
+        'objectives': radial_objectives('solid', 'output.post.unit_002.post_mass_solid_all_partypes', EXAMPLES / 'Averaged-AC-bulk' / 'reference'),
+    },
+}
+
+def load_case(name, nproc):
+    config = ConfigHandler()
+    config.config = Dict({ **CASES[name], 'nproc': nproc, 'transforms': {'parameters': 'lognorm'} })
+    config.load()
+    config.construct_simulation()
+    return config
+
+def peak_rss(pid='self') -> float:
+    """ Peak resident set size of a process in MB (Linux) """
+    with open(f'/proc/{pid}/status') as fp:
+        for line in fp:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024
+    return float('nan')
+
+def standin_time(template, tempdir, repeats=3) -> float:
+    """ Median time of the fake cadet-cli on a copy of the template, without sleeping """
+    filename = Path(tempdir) / 'standin.h5'
+    times = []
+    for _ in range(repeats):
+        shutil.copyfile(template, filename)
+        start = time.perf_counter()
+        subprocess.run([shutil.which('cadet-cli'), str(filename)], check=True, env={ **os.environ, 'CHROMOO_FAKE_CADET_SLEEP': '0', 'CHROMOO_FAKE_CADET_FAIL': '0' })
+        times.append(time.perf_counter() - start)
+    filename.unlink()
+    return float(np.median(times))
+
+def benchmark(name, nproc, n_evaluations, tempdir, seed, order='longest_first', warmup=0, resources=None):
+    config = load_case(name, nproc)
+    problem = ChromooProblem(config.simulation, config.parameters, config.objectives, nproc=nproc, tempdir=tempdir, transform=config.parameter_transform, evaluation_store='', patch_template=config.patch_template, failures={ **config.failures, 'log': str(Path(tempdir) / 'failures.jsonl') }, scheduler={ **config.scheduler, 'order': order }, resources={ **config.resources, **(resources or {}) })
+
+    rng = np.random.default_rng(seed)
+    X = rng.random((n_evaluations, problem.n_var))
+
+    try:
+        start = time.perf_counter()
+        problem.pool.start()
+        startup = time.perf_counter() - start
+        standin = standin_time(problem.pool.templates[None], tempdir)
+
+        if warmup:
+            problem.simulate(rng.random((warmup, problem.n_var)))
+            problem.metrics.collect(0)
+
+        start = time.perf_counter()
+        F = problem.simulate(X)
+        wall = time.perf_counter() - start
+
+        workers = [ process.pid for process in problem.pool._pool._pool ]
+        worker_rss = max(peak_rss(pid) for pid in workers)
+    finally:
+        problem.close()
+
+    rows = problem.metrics.collect(0)
+    cadet = np.array([ row['cadet'] for row in rows ])
+    overhead = np.array([ row['total'] - row['cadet'] for row in rows ])
+    busy = sum(row['total'] - row['transfer'] - row['score'] for row in rows)
+
+    throughput = n_evaluations / wall
+    ideal = nproc / cadet.mean()
+
+    return {
+        'case': name,
+        'nproc': nproc,
+        'order': order,
+        'evaluations': n_evaluations,
+        'wall': wall,
+        'evals_per_s': throughput,
+        'efficiency': throughput / ideal,
+        'idle': 1 - busy / (nproc * wall),
+        'cadet_median': float(np.median(cadet)),
+        'overhead_median': float(np.median(overhead)),
+        'overhead_p90': float(np.percentile(overhead, 90)),
+        'phases': { phase: float(np.median([ row[phase] for row in rows ])) for phase in rows[0] if phase not in ('generation', 'pid', 'slot', 'x') },
+        'startup': startup,
+        'standin': standin,
+        'main_rss_mb': peak_rss(),
+        'worker_rss_mb': worker_rss,
+        'failed': int(problem.failures.failed(F).sum()),
+        'slots': { slot: [ row['cadet'] for row in rows if row['slot'] == slot ] for slot in sorted(set(row['slot'] for row in rows if row['slot'] is not None)) },
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', nargs='+', default=list(CASES), choices=list(CASES))
+    parser.add_argument('--nproc', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--evaluations', type=int, default=32, help='evaluations per case and nproc')
+    parser.add_argument('--sleep', type=float, default=0.1, help='seconds per fake simulation')
+    parser.add_argument('--spread', type=float, default=0.0, help='parameter dependent extra time, as a multiple of --sleep')
+    parser.add_argument('--fail', type=float, default=0.0, help='fraction of parameter sets that fail')
+    parser.add_argument('--fail-reltol', type=float, default=float('inf'), help='failing parameter sets succeed with a reltol of at least this (after retries)')
+    parser.add_argument('--order', nargs='+', default=['longest_first'], choices=['longest_first', 'fifo'], help='dispatch order of the scheduler')
+    parser.add_argument('--warmup', type=int, default=0, help='evaluations to train the runtime prediction on, before the measured batch')
+    parser.add_argument('--cores', type=int, default=0, help='cores to split between processes and CADET threads (resources.cores), 0 for the available ones')
+    parser.add_argument('--adaptive', action='store_true', help='split the cores adaptively between processes and CADET threads (resources.adaptive)')
+    parser.add_argument('--pin', action='store_true', help='pin the evaluations to CPU slots (resources.pin)')
+    parser.add_argument('--thread-scaling', type=float, default=0.0, help='the stand-in runs nthreads**SCALING times faster')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', default=None, help='also write the results to this file')
+    args = parser.parse_args()
+
+    os.environ['CHROMOO_FAKE_CADET_SLEEP'] = str(args.sleep)
+    os.environ['CHROMOO_FAKE_CADET_SPREAD'] = str(args.spread)
+    os.environ['CHROMOO_FAKE_CADET_FAIL'] = str(args.fail)
+    os.environ['CHROMOO_FAKE_CADET_FAIL_RELTOL'] = str(args.fail_reltol)
+    os.environ['CHROMOO_FAKE_CADET_THREAD_SCALING'] = str(args.thread_scaling)
+    resources = { 'cores': args.cores, 'adaptive': args.adaptive, 'pin': args.pin }
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='chromoo-bench-') as tempdir:
+        for name in args.cases:
+            for nproc in args.nproc:
+                for order in args.order:
+                    Logger().info(f"Benchmarking {name} with nproc = {nproc}, order = {order}")
+                    results.append(benchmark(name, nproc, args.evaluations, Path(tempdir), args.seed, order, args.warmup, resources))
+
+    print(f"\n{len(os.sched_getaffinity(0))} CPUs available. cadet-cli is the synthetic stand-in, sleeping {args.sleep} s (+ up to {args.spread:g}x parameter dependent).")
+    print(f"{'case':>10} {'nproc':>5} {'order':>13} {'evals/s':>8} {'effic.':>7} {'idle':>6} {'cadet [s]':>9} {'stand-in [s]':>12} {'overhead [s]':>13} {'p90 [s]':>8} {'startup [s]':>11} {'main [MB]':>9} {'worker [MB]':>11} {'failed':>6}")
+    for r in results:
+        print(f"{r['case']:>10} {r['nproc']:>5} {r['order']:>13} {r['evals_per_s']:>8.2f} {r['efficiency']:>7.1%} {r['idle']:>6.1%} {r['cadet_median']:>9.3f} {r['standin']:>12.3f} {r['overhead_median']:>13.3f} {r['overhead_p90']:>8.3f} {r['startup']:>11.2f} {r['main_rss_mb']:>9.0f} {r['worker_rss_mb']:>11.0f} {r['failed']:>6}")
+
+    print("\nMedian phase times [s]:")
+    for r in results:
+        print(f"{r['case']:>10} {r['nproc']:>5} {r['order']:>13} " + ", ".join(f"{phase} {value:.3g}" for phase, value in r['phases'].items() if value > 0))
+
+    if args.pin:
+        print("\nPer CPU slot (evaluations, median cadet [s]):")
+        for r in results:
+            print(f"{r['case']:>10} {r['nproc']:>5} {r['order']:>13} " + ", ".join(f"{slot}: {len(cadet)}, {np.median(cadet):.3g}" for slot, cadet in r['slots'].items()))
+
+    if args.json:
+        with open(args.json, 'w') as fp:
+            json.dump(results, fp, indent=2)
+
+if __name__ == '__main__':
+    main()
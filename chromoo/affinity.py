@@ -0,0 +1,133 @@
+"""
+Affinity
+
+Optional pinning of the simulations to disjoint CPU sets, so that cadet-cli
+doesn't float across sockets (resources.pin).
+
+The CPUs this process may run on are grouped by NUMA node (from
+/sys/devices/system/node/node*/cpulist, a single node if that isn't
+available) and split into one slot per worker: slots are spread over the
+nodes in proportion to their CPUs, and every slot gets a contiguous share of
+the CPUs of its node (whole nodes, with fewer workers than nodes).
+
+Every task is given a free slot when it is dispatched, and the worker pins
+itself to the slot's CPUs before running cadet-cli, which inherits them. A
+task with more CADET threads than its slot has CPUs (see ResourceAllocator)
+also takes free slots of the same node, then of the others, as long as
+there are any. Only if all slots are taken (e.g. by discarded duplicates),
+a task may run on all CPUs.
+"""
+
+import os
+import threading
+from pathlib import Path
+
+from chromoo.log import Logger
+
+NODES = Path('/sys/devices/system/node')
+
+def parse_cpulist(text) -> list:
+    """ CPUs of a sysfs cpulist, e.g. '0-3,8-11' """
+    cpus = []
+    for part in text.strip().split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            cpus.extend(range(int(first), int(last) + 1))
+        elif part:
+            cpus.append(int(part))
+    return cpus
+
+def format_cpulist(cpus) -> str:
+    """ Inverse of parse_cpulist() """
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ','.join(f'{first}-{last}' if last > first else f'{first}' for first, last in ranges)
+
+def numa_nodes(allowed=None, root=NODES) -> list:
+    """ The allowed CPUs, grouped by NUMA node """
+    allowed = set(os.sched_getaffinity(0) if allowed is None else allowed)
+    nodes = []
+    for node in sorted(root.glob('node[0-9]*'), key=lambda path: int(path.name[4:])):
+        try:
+            cpus = [ cpu for cpu in parse_cpulist((node / 'cpulist').read_text()) if cpu in allowed ]
+        except (OSError, ValueError):
+            continue
+        if cpus:
+            nodes.append(cpus)
+
+    # Without sysfs (or with CPUs it doesn't list), the rest is one node
+    rest = sorted(allowed - set(cpu for cpus in nodes for cpu in cpus))
+    if rest:
+        nodes.append(rest)
+    return nodes
+
+def partition(nodes, nslots) -> list:
+    """ Split the CPUs of nodes into nslots (node, cpus) slots, disjoint unless there are more slots than CPUs """
+    if nslots < len(nodes):
+        # Whole nodes per slot
+        return [ (slot, [ cpu for cpus in nodes[slot::nslots] for cpu in cpus ]) for slot in range(nslots) ]
+
+    total = sum(len(cpus) for cpus in nodes)
+
+    # Slots per node in proportion to its CPUs (largest remainder), at least one CPU each where possible
+    shares = [ nslots * len(cpus) / total for cpus in nodes ]
+    counts = [ int(share) for share in shares ]
+    for node in sorted(range(len(nodes)), key=lambda n: counts[n] - shares[n])[:nslots - sum(counts)]:
+        counts[node] += 1
+
+    slots = []
+    for node, (cpus, count) in enumerate(zip(nodes, counts)):
+        for i in range(count):
+            if count <= len(cpus):
+                share = cpus[i * len(cpus) // count:(i + 1) * len(cpus) // count]
+            else:
+                share = [ cpus[i % len(cpus)] ]
+            slots.append((node, share))
+    return slots
+
+class CpuSlots:
+    """ Thread-safe assignment of the slots of partition() to tasks """
+
+    def __init__(self, nslots, cores=0):
+        nodes = numa_nodes()
+        if cores:
+            # Keep the first cores CPUs, in node order
+            nodes = [ cpus[:max(cores - sum(len(c) for c in nodes[:n]), 0)] for n, cpus in enumerate(nodes) ]
+            nodes = [ cpus for cpus in nodes if cpus ]
+        self.slots = partition(nodes, nslots)
+        self.all = sorted(cpu for cpus in nodes for cpu in cpus)
+        self.free = list(range(len(self.slots)))
+        self.lock = threading.Lock()
+
+        if nslots > len(self.all):
+            Logger().warn(f"Pinning {nslots} workers to {len(self.all)} CPUs, the slots share CPUs.")
+
+    def describe(self) -> str:
+        return ', '.join(f"{slot}: node {node} cpus {format_cpulist(cpus)}" for slot, (node, cpus) in enumerate(self.slots))
+
+    def acquire(self, threads=1):
+        """ Take a free slot, and more of them for more threads. Returns (slot ids, CPUs), ids are empty if none were free. """
+        with self.lock:
+            if not self.free:
+                return [], self.all
+            first = self.free.pop(0)
+            node = self.slots[first][0]
+            ids, cpus = [first], list(self.slots[first][1])
+
+            # Same node first
+            for slot in sorted(self.free, key=lambda slot: self.slots[slot][0] != node):
+                if len(cpus) >= (threads or 1):
+                    break
+                self.free.remove(slot)
+                ids.append(slot)
+                cpus.extend(self.slots[slot][1])
+            return ids, sorted(set(cpus))
+
+    def release(self, ids):
+        with self.lock:
+            self.free.extend(ids)
+            self.free.sort()
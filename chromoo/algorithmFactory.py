@@ -1,41 +1,60 @@
 """
     AlgorithmFactory
 
+    Reference directions are cached on disk, see refdirs.py.
+    algorithm.survival: fast selects the vectorized survival, see survival.py.
+
+    Supported modes:
+        - generational: every generation is evaluated as a whole (default)
+        - steady_state: candidates are evaluated asynchronously, and survival
+          is run on every n_offsprings completed evaluations (see SteadyStateDriver)
 """
+from chromoo.refdirs import reference_directions
+from chromoo.survival import get_survival
+
 class AlgorithmFactory:
 
     def __init__(self, algorithm_config: dict):
         if algorithm_config.get('name') == 'unsga3':
             from pymoo.algorithms.moo.unsga3 import UNSGA3
-            from pymoo.factory import get_reference_directions
             from pymoo.operators.sampling.rnd import FloatRandomSampling
 
             pop_size = algorithm_config.get('pop_size', 100)
             numRefDirs = pop_size
             dimensions = algorithm_config.get('n_obj')
-            ref_dirs = get_reference_directions("energy", dimensions, numRefDirs, seed=204)
+            ref_dirs = reference_directions(algorithm_config.get('ref_dirs', 'energy'), dimensions, numRefDirs, seed=204, threshold=algorithm_config.get('ref_dirs_threshold', 10))
 
             init_pop = algorithm_config.get('init_pop', [])
             sampling =  FloatRandomSampling() if init_pop == [] else init_pop
 
-            self.algo = UNSGA3(pop_size=pop_size, ref_dirs=ref_dirs, sampling=sampling)
+            survival = get_survival(algorithm_config.get('survival', 'default'), ref_dirs)
+
+            self.algo = UNSGA3(pop_size=pop_size, ref_dirs=ref_dirs, sampling=sampling, survival=survival, **self.mode_kwargs(algorithm_config))
         elif algorithm_config.get('name') == 'nsga3':
             from pymoo.algorithms.moo.nsga3 import NSGA3
-            from pymoo.factory import get_reference_directions
             from pymoo.operators.sampling.rnd import FloatRandomSampling
 
             pop_size = algorithm_config.get('pop_size', 100)
             numRefDirs = pop_size
             dimensions = algorithm_config.get('n_obj')
-            ref_dirs = get_reference_directions("energy", dimensions, numRefDirs, seed=204)
+            ref_dirs = reference_directions(algorithm_config.get('ref_dirs', 'energy'), dimensions, numRefDirs, seed=204, threshold=algorithm_config.get('ref_dirs_threshold', 10))
 
             init_pop = algorithm_config.get('init_pop', [])
             sampling =  FloatRandomSampling() if init_pop == [] else init_pop
 
-            self.algo = NSGA3(pop_size=pop_size, ref_dirs=ref_dirs, sampling=sampling)
+            survival = get_survival(algorithm_config.get('survival', 'default'), ref_dirs)
+
+            self.algo = NSGA3(pop_size=pop_size, ref_dirs=ref_dirs, sampling=sampling, survival=survival, **self.mode_kwargs(algorithm_config))
         else:
             raise(RuntimeError("Invalid algorithm!"))
 
+    @staticmethod
+    def mode_kwargs(algorithm_config: dict) -> dict:
+        """ Extra algorithm arguments required by the execution mode """
+        if algorithm_config.get('mode', 'generational') == 'steady_state':
+            return {'n_offsprings': algorithm_config.get('n_offsprings', 1)}
+        return {}
+
     def get_algorithm(self):
         return self.algo
             
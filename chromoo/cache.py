@@ -1,7 +1,7 @@
 from chromoo.plotter import Plotter, Subplotter
 import numpy as np
-import pandas as pd
 from chromoo.transforms import transform_array
+from chromoo.history import History
 
 import csv
 import os
@@ -18,12 +18,18 @@ class Cache:
         self.opt_Xs = []
         self.opt_Fs = []
 
-        self.populations = pd.DataFrame(columns=['generation'] + config.parameter_names + config.objective_names)
-        self.last_pop    = pd.DataFrame(columns=['generation'] + config.parameter_names + config.objective_names)
+        # With a fidelity schedule, population rows carry the fidelity level they were scored at
+        self.fidelity_column = ['fidelity'] if config.fidelity is not None else []
+        self.level = None
+
+        # All evaluated populations, appended per generation
+        self.history = History('history', config.parameter_names + config.objective_names + self.fidelity_column)
 
         self.best_combined_per_gen = []
         self.best_combined_ever = []
 
+        self.generations = []
+
         self.parameters = config.parameters
         self.objectives = config.objectives
 
@@ -56,19 +62,46 @@ class Cache:
         self.pop_Fs.append(algorithm.pop.get('F'))
         self.opt_Fs.append(algorithm.opt.get('F'))
 
+        # Index of the fidelity level of the scores, len(levels) for the full simulation
+        fidelity = getattr(algorithm.problem, 'fidelity', None)
+        self.level = fidelity.index if fidelity is not None else None
 
-        self.last_pop[self.parameter_names] = transform_array(algorithm.pop.get('X'), self.par_min_values, self.par_max_values, self.parameter_transform, mode='inverse')
-        self.last_pop[self.objective_names] = algorithm.pop.get('F')
-        self.last_pop['generation'] = algorithm.n_gen
-        
-        # self.populations = self.populations.append(self.last_pop)
-        self.populations = pd.concat([self.populations, self.last_pop])
-
-        self.populations.to_pickle('populations')
+        self.generations.append(algorithm.n_gen)
+        self.update_best_scores(coarse=fidelity is not None and not fidelity.is_full)
         # self.pops.append(transform_population(algorithm.pop, self.par_min_values, self.par_max_values, self.parameter_transform, 'inverse'))
         # self.opts.append(transform_population(algorithm.opt, self.par_min_values, self.par_max_values, self.parameter_transform, 'inverse'))
     #
     
+    def checkpoint_state(self) -> dict:
+        """ The per-generation lists, with the population history by reference (see checkpoint.py) """
+        return {
+            'opt_Xs': self.opt_Xs,
+            'opt_Fs': self.opt_Fs,
+            'best_combined_per_gen': self.best_combined_per_gen,
+            'best_combined_ever': self.best_combined_ever,
+            'generations': self.generations,
+            'history': str(self.history.directory),
+        }
+
+    def restore_state(self, state:dict, n_gen:int):
+        """ Restore from checkpoint_state(), reloading the population history up to generation n_gen """
+        self.opt_Xs = state['opt_Xs']
+        self.opt_Fs = state['opt_Fs']
+        self.best_combined_per_gen = state['best_combined_per_gen']
+        self.best_combined_ever = state['best_combined_ever']
+        self.generations = state.get('generations', [])
+
+        # Rows are appended per generation from here on
+        self.write_best_combined_per_gen()
+
+        if state.get('history') is None:
+            return
+
+        self.history.truncate(n_gen)
+        for _, block in self.history.blocks():
+            self.pop_Xs.append(np.array(block[:, :self.n_par]))
+            self.pop_Fs.append(np.array(block[:, self.n_par:self.n_par + self.n_obj]))
+
     def initialize(self):
         try: 
             os.remove('opts.csv')
@@ -136,22 +169,66 @@ class Cache:
         plot.save(f"ALL.png")
         plot.close()
 
-    def write_opts(self):
+    def fidelity_columns(self, n, level=None):
+        """ The fidelity column for n rows (of the last generation's level by default), (n, 0) without a fidelity schedule """
+        return np.full((n, len(self.fidelity_column)), self.level if level is None else level, dtype=float)
+
+    def write_opts(self, opt_X=None, opt_F=None, level=None):
         """ Write the last generation's opts solution to a csv file """
         # TODO: Use pandas or something
+        opt_X = self.opt_Xs[-1] if opt_X is None else opt_X
+        opt_F = self.opt_Fs[-1] if opt_F is None else opt_F
         with open('opts.csv', 'w') as fp:
             writer = csv.writer(fp)
-            writer.writerow(self.parameter_names + self.objective_names)
-            writer.writerows(map(lambda x,f: np.append(x,f) , self.opt_Xs[-1], self.opt_Fs[-1]))
+            writer.writerow(self.parameter_names + self.objective_names + self.fidelity_column)
+            writer.writerows(np.hstack([opt_X, opt_F, self.fidelity_columns(len(opt_X), level)]))
+
+    def update_opts(self, algorithm, writer=None, level=None):
+        """ Replace the last generation's opts by algorithm.opt, e.g. after re-scoring the front at the end of the run, and rewrite opts.csv """
+        self.opt_Xs[-1] = transform_array(algorithm.opt.get('X'), self.par_min_values, self.par_max_values, self.parameter_transform, mode='inverse')
+        self.opt_Fs[-1] = algorithm.opt.get('F')
+        if level is not None:
+            self.level = level
+
+        args = (self.opt_Xs[-1], self.opt_Fs[-1], self.level)
+        if writer is None:
+            self.write_opts(*args)
+        else:
+            writer.submit('opts', self.write_opts, *args)
 
-    def write_best_combined_per_gen(self):
-        """ Write to CSV the best combined score per generation """
-        with open('best_combined_per_gen.csv', 'a') as fp:
+    def write_best_combined_per_gen(self, best_combined_per_gen=None):
+        """ Write to CSV the best combined score per generation, without the coarse fidelity generations """
+        best_combined_per_gen = self.best_combined_per_gen if best_combined_per_gen is None else best_combined_per_gen
+        with open('best_combined_per_gen.csv', 'w') as fp:
             writer = csv.writer(fp)
-            writer.writerow([self.best_combined_per_gen[-1]])
+            writer.writerows([best] for best in best_combined_per_gen if not np.isnan(best))
 
-    def write(self):
-        self.write_opts()
+    def append_best_combined(self, best):
+        """ Append the best combined score of a generation to the CSV """
+        if np.isnan(best):
+            return
+        with open('best_combined_per_gen.csv', 'a') as fp:
+            csv.writer(fp).writerow([best])
+
+    def write(self, writer=None):
+        """
+        Write the outputs of the last generation: synchronously, or as tasks on
+        a BackgroundWriter. The arguments are snapshots, so the writer never
+        sees later generations' data. Whole-file outputs are keyed so that
+        pending ones are coalesced, history blocks and best scores are
+        appended in order.
+        """
+        tasks = [
+            (None, self.history.append, (self.generations[-1], np.hstack([self.pop_Xs[-1], self.pop_Fs[-1], self.fidelity_columns(len(self.pop_Xs[-1]))]))),
+            ('opts', self.write_opts, (self.opt_Xs[-1], self.opt_Fs[-1], self.level)),
+            (None, self.append_best_combined, (self.best_combined_per_gen[-1],)),
+        ]
+
+        for key, func, args in tasks:
+            if writer is None:
+                func(*args)
+            else:
+                writer.submit(key, func, *args)
 
     def update_scatter_plot(self):
         """ Update the objectives_vs_parameters scatter plots """
@@ -171,11 +248,13 @@ class Cache:
 
         return min_index, means
 
-    def update_best_scores(self):
+    def update_best_scores(self, coarse=False):
+        """ Coarse fidelity scores aren't comparable to the full ones, they are recorded as NaN and skipped """
         index,means = self.find_best_score(generation_index=-1)
 
-        self.best_combined_per_gen.append(means[index])
-        self.best_combined_ever.append(np.min(self.best_combined_per_gen))
+        self.best_combined_per_gen.append(np.nan if coarse else means[index])
+        best = [ best for best in self.best_combined_per_gen if not np.isnan(best) ]
+        self.best_combined_ever.append(np.min(best) if best else np.nan)
 
     def plot_best_scores(self):
         plot_best_generational = Plotter(
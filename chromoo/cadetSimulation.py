@@ -1,12 +1,17 @@
 from addict import Dict
 from cadet import Cadet
-from chromoo.utils import deep_get, keystring_todict, readChromatogram, readArray, pairwise
+from cadet.cadet import recursively_load
+from chromoo.utils import deep_get, keystring_todict, readChromatogram, readArray, pairwise, clone_file
 from pathlib import Path
 from ruamel.yaml import YAML
 from typing import Any
 from typing import TypeVar, Callable, Any, Optional
 
 from chromoo.scores import scores_dict
+from chromoo.parameter import ParameterPlan
+from chromoo.objective import evaluate_population
+from chromoo.fidelity import prolong_outputs
+from chromoo.timing import Timings
 
 import multiprocessing as mp
 
@@ -16,12 +21,123 @@ import random
 import string
 import numpy as np
 import subprocess
+import signal
+import time
+import h5py
+import fnmatch
 
 T = TypeVar("T")
 
 cadetpath = subprocess.run(['which', 'cadet-cli'], capture_output=True, text=True ).stdout.strip()
 Cadet.cadet_path = cadetpath
 
+def h5_path(path:str) -> str:
+    """ 
+    Convert a dot-separated simulation path into the dataset path in a CADET h5 file.
+    Groups are stored as-is, and dataset names are uppercased (see Cadet.transform).
+    """
+    keys = path.split('.')
+    return '/' + '/'.join(keys[:-1] + [keys[-1].upper()])
+
+def h5_normalized(tree) -> Dict:
+    """ 
+    Copy of a simulation tree as it reads back from a CADET h5 file (see
+    cadet's recursively_save/recursively_load): strings as bytes, lists and
+    numbers as numpy arrays and scalars.
+    """
+    normalized = Dict()
+    for key, item in tree.items():
+        if isinstance(item, dict):
+            normalized[key] = h5_normalized(item)
+        elif isinstance(item, str):
+            normalized[key] = item.encode('ascii')
+        elif isinstance(item, (list, tuple)) and item and all(isinstance(i, str) for i in item):
+            normalized[key] = np.array([ i.encode('ascii') for i in item ])
+        else:
+            normalized[key] = np.array(item)[()]
+    return normalized
+
+# Kinds of unit solution data, as in input.return.unit_XXX.write_solution_<kind>
+# Longer names first, so that e.g. 'column_outlet' matches before 'column'
+SOLUTION_KINDS = ['column_outlet', 'column_inlet', 'column', 'outlet', 'inlet', 'bulk', 'particle', 'solid', 'flux', 'volume']
+
+def solution_kind(name:str) -> Optional[str]:
+    """ Return the kind of solution data for a dataset name like solution_outlet_comp_000 """
+    for kind in SOLUTION_KINDS:
+        if name.startswith(f'solution_{kind}'):
+            return kind
+    return None
+
+def requires(*outputs):
+    """ 
+    Declare the unit solution datasets (fnmatch patterns, e.g. 'solution_bulk') 
+    that a post_* routine reads, so that only those are loaded after a run.
+    """
+    def decorator(func):
+        func.requires = outputs
+        return func
+    return decorator
+
+class SimulationFailure(RuntimeError):
+    """ A cadet-cli run that exited with an error """
+    def __init__(self, filename, returncode=None, stderr=''):
+        super().__init__("Simulation Failure")
+        self.filename = str(filename)
+        self.returncode = returncode
+        self.stderr = stderr
+
+class SimulationTimeout(SimulationFailure):
+    """ A cadet-cli run that exceeded its time budget and was killed """
+
+class SimulationCancelled(RuntimeError):
+    """ A cadet-cli run that was killed because its result is no longer needed """
+
+def run_cadet_cli(filename, timeout:Optional[float]=None, cancelled:Optional[Callable[[], bool]]=None, poll:float=0.5) -> subprocess.CompletedProcess:
+    """
+    Run cadet-cli on a simulation file in its own process group, so that on a
+    timeout, a cancellation (cancelled() is checked every poll seconds) or an
+    interruption of the caller, the whole group is killed, including anything
+    cadet-cli started.
+    Raises SimulationTimeout, SimulationCancelled, or subprocess.CalledProcessError on failure.
+    """
+    args = [Cadet.cadet_path, str(filename)]
+    deadline = None if timeout is None else time.monotonic() + timeout
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+    try:
+        while True:
+            waits = [ poll ] if cancelled is not None else []
+            if deadline is not None:
+                waits.append(max(deadline - time.monotonic(), 0))
+            wait = min(waits) if waits else None
+            try:
+                stdout, stderr = process.communicate(timeout=wait)
+                break
+            except subprocess.TimeoutExpired:
+                if deadline is not None and time.monotonic() >= deadline:
+                    os.killpg(process.pid, signal.SIGKILL)
+                    stdout, stderr = process.communicate()
+                    raise SimulationTimeout(filename, None, f"Killed after exceeding the time budget of {timeout:.3g} s. " + stderr.decode('utf-8', 'replace').strip())
+                if cancelled is not None and cancelled():
+                    os.killpg(process.pid, signal.SIGKILL)
+                    process.communicate()
+                    raise SimulationCancelled(f"{filename} was cancelled")
+    except (SimulationTimeout, SimulationCancelled):
+        raise
+    except BaseException:
+        # E.g. KeyboardInterrupt or the worker being terminated: the new session doesn't get our signals
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+        raise
+
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args, stdout, stderr)
+    return subprocess.CompletedProcess(args, process.returncode, stdout, stderr)
+
+def parameter_paths(parameters) -> list:
+    """ All simulation paths that are modified by update_parameters() """
+    plan = parameters if isinstance(parameters, ParameterPlan) else ParameterPlan(parameters)
+    return list(dict.fromkeys(plan.paths))
+
 class CadetSimulation(Cadet): 
     def get(self, path:str, vartype:Callable[[Any],T]=Any, default=None, choices=[]) -> T: 
         """ Returns the value of a dot-separated path in the simulation data """
@@ -30,11 +146,12 @@ class CadetSimulation(Cadet):
     def set(self, path:str, value:Any):
         """ Set a value in the simulation data at a given dot-separated path """
         dic = self.root
+        keys = path.split('.')
 
-        for key in path.split('.'):
+        for key in keys[:-1]:
             dic = dic[key]
 
-        dic = value
+        dic[keys[-1]] = value
 
     def take(self, path:str, indices, axis:int): 
         """ Take data at indices on axis of an n-dimensional array """
@@ -73,6 +190,54 @@ class CadetSimulation(Cadet):
             raise NotImplementedError
 
 
+    def estimate_output_size(self) -> int:
+        """ Rough size (bytes) of the solution data CADET will write, based on return flags and get_shape_pre() """
+        nbytes = 0
+        for unit in self.units:
+            UNIT = self.root.input.model[unit]
+            flags = self.root.input['return'][unit]
+            for kind in ['outlet', 'inlet', 'bulk', 'particle', 'solid', 'flux']:
+                if not flags.get(f'write_solution_{kind}'):
+                    continue
+                if kind in ['bulk', 'particle', 'solid', 'flux'] and not UNIT.discretization.ncol:
+                    continue
+                path_kind = 'bulk' if kind == 'flux' else 'outlet' if kind == 'inlet' else kind
+                shape = self.get_shape_pre(f'output.solution.{unit}.solution_{path_kind}')
+                ncomp = UNIT.ncomp or 1
+                if kind in ['outlet', 'inlet']:
+                    shape = (*shape, ncomp, UNIT.ports or 1)
+                nbytes += 8 * int(np.prod(shape))
+        return nbytes
+
+    @property
+    def units(self) -> list:
+        """ Names of all units in the model, e.g. ['unit_000', 'unit_001'] """
+        return sorted(key for key in self.root.input.model.keys() if re.fullmatch(r'unit_\d+', key))
+
+    def prune_return_flags(self, paths) -> None:
+        """ 
+        Rewrite input.return so that CADET only writes the unit solution data
+        needed for the given output paths (see required_output_paths()).
+        Sensitivities, derivatives and unneeded solutions are switched off.
+        """
+        needed = {}
+        for path in paths:
+            units = re.findall(r'unit_\d+', path)
+            if not units:
+                continue
+            unit = units[0]
+            kind = solution_kind(path.split('.')[-1].replace(f'_{unit}', ''))
+            if kind:
+                needed.setdefault(unit, set()).add(kind)
+
+        for unit in self.units:
+            flags = self.root.input['return'][unit]
+            for key in list(flags.keys()):
+                if key.startswith('write_sens_') or key.startswith('write_soldot_') or key == 'write_solution_last':
+                    flags[key] = 0
+            for kind in SOLUTION_KINDS:
+                flags[f'write_solution_{kind}'] = int(kind in needed.get(unit, set()))
+
     def load_file(self, fname: str) -> None: 
         """ Load a simulation from either h5 or yaml file """
         ext = Path(fname).suffix
@@ -101,39 +266,69 @@ class CadetSimulation(Cadet):
     def update_parameters(self, x, parameters): 
         """
         Update parameters with values in x.
+        parameters may be a list of Parameter or a compiled ParameterPlan.
         """
-        prev_len = 0
-        for p in parameters:
-            cur_len = p.length
-
-            if p.type == 'element' :
-                arr = self.root
-                for key in p.path.split('.'):
-                    arr = arr[key]
-                value = x[prev_len : prev_len + cur_len]
-                for idx_len,idx_arr in zip(range(cur_len), p.index):
-                    arr[idx_arr] = value[idx_len]
-                cur_dict = keystring_todict(p.path, arr)
-
-                ## NOTE: Hack to copy flowrate values within the connections matrix
-                if p.copy_to_path: 
-                    arr2 = self.root
-                    for key in p.copy_to_path.split('.'):
-                        arr2 = arr2[key]
-                    for idx_len,idx_copy_list in zip(range(cur_len), p.copy_to_index):
-                        for idx_copy in idx_copy_list: 
-                            arr2[idx_copy] = value[idx_len]
-                    cur_dict.update(keystring_todict(p.copy_to_path, arr2))
+        plan = parameters if isinstance(parameters, ParameterPlan) else ParameterPlan(parameters)
+        plan.apply(self.root, x)
 
-            else:
-                cur_dict = keystring_todict(p.path, x[prev_len : prev_len + cur_len])
+    def normalize_inputs(self):
+        """ Convert the inputs to the types a load() returns, e.g. bytes instead of str, see load_outputs() """
+        self.root.input = h5_normalized(self.root.input)
 
-                ## NOTE: Don't need this, so commented for safety, but written for generality
-                # if p.copy_to_path: 
-                #     cur_dict.update(keystring_todict(p.copy_to_path, x[prev_len : prev_len + cur_len]))
+    def load_outputs(self, paths, keep_inputs=False):
+        """ 
+        Load only the output datasets matching the given dot-separated paths.
+        The last key may be an fnmatch pattern. The inputs are kept from
+        memory with keep_inputs (they must have been normalized, see
+        normalize_inputs()), and reloaded from the file otherwise, to keep the
+        types consistent with a full load().
+        """
+        with h5py.File(self.filename, 'r') as h5file:
+            root = Dict()
+
+            if keep_inputs:
+                root.input = self.root.input
+            elif 'input' in h5file:
+                root.input = recursively_load(h5file, '/input/', self.inverse_transform, None)
+
+            for path in paths:
+                keys = path.split('.')
+                group = h5file.get('/'.join(keys[:-1]))
+                if not isinstance(group, h5py.Group):
+                    continue
+
+                for name, item in group.items():
+                    key = self.inverse_transform(name)
+                    if isinstance(item, h5py.Dataset) and fnmatch.fnmatchcase(key, keys[-1]):
+                        node = root
+                        for k in keys[:-1]:
+                            node = node[k]
+                        node[key] = item[()]
+
+        self.root = root
+
+    def save_template(self, filename):
+        """ Write the full simulation to filename, to be used as a template by patch_from_template() """
+        self.filename = filename
+        self.save()
 
-            self.root.update(cur_dict)
-            prev_len += p.length
+    def patch_from_template(self, template, paths):
+        """ 
+        Create the simulation file by cloning a template file (see save_template), 
+        and rewriting only the datasets at the given dot-separated paths.
+        """
+        clone_file(template, self.filename)
+
+        with h5py.File(self.filename, 'r+') as h5file:
+            for path in paths:
+                dataset = h5_path(path)
+                value = self.get(path)
+                if isinstance(value, str):
+                    value = value.encode('ascii')
+                # Recreate rather than overwrite: shape or dtype may differ from the template
+                if dataset in h5file:
+                    del h5file[dataset]
+                h5file[dataset] = np.array(value)
 
     def save_run_load(self, overwrite=True):
         p = Path(self.filename)
@@ -154,7 +349,7 @@ class CadetSimulation(Cadet):
 
         self.load()
 
-    def run_with_parameters(self, x, parameters, name:Optional[str]=None, tempdir:Path=Path('temp'), store:bool=False): 
+    def run_with_parameters(self, x, parameters, name:Optional[str]=None, tempdir:Path=Path('temp'), store:bool=False, template:Optional[Path]=None, load_paths:Optional[list]=None, timings:Optional[Timings]=None, patch_paths:Optional[list]=None, timeout:Optional[float]=None, cancelled:Optional[Callable[[], bool]]=None, keep_inputs:bool=False): 
         """ 
         Run the simulation with a given set of parameters. 
             -> x: parameter values
@@ -166,28 +361,55 @@ class CadetSimulation(Cadet):
                   - path: str # input.model.unit_002.col_dispersion
                   - min_value: float 
                   - max_value: float
+            -> template: h5 file written by save_template() from the same simulation. 
+               If given, it is cloned and only the parameter datasets are rewritten instead of saving the full simulation.
+            -> load_paths: only load these outputs after the run (see load_outputs). Loads everything if None.
+            -> keep_inputs: keep the (normalized) inputs in memory instead of reloading them with load_paths
+            -> timings: records the update/save/cadet/load phases (see timing.py)
+            -> patch_paths: other paths that differ from the template (e.g. relaxed tolerances, see failurePolicy.py)
+            -> timeout: time budget for cadet-cli in seconds, None for no limit
+            -> cancelled: cadet-cli is killed when this returns True (see run_cadet_cli)
+        Raises SimulationFailure if cadet-cli fails, SimulationTimeout if it is killed for exceeding the budget.
         """
+        timings = timings if timings is not None else Timings()
 
         if name:
             self.filename = tempdir.joinpath(name + '.h5')
         else:
             self.filename = tempdir.joinpath('temp' + ''.join(random.choices(string.ascii_uppercase + string.ascii_lowercase + string.digits, k=6)) + '.h5')
 
-        self.update_parameters(x, parameters)
+        with timings.phase('update'):
+            self.update_parameters(x, parameters)
 
-        self.save()
+        with timings.phase('save'):
+            if template:
+                self.patch_from_template(template, parameter_paths(parameters) + list(patch_paths or []))
+            else:
+                self.save()
 
         try:
-            self.run(check=True)
+            with timings.phase('cadet'):
+                if Cadet.is_file:
+                    run_cadet_cli(self.filename, timeout, cancelled)
+                else:
+                    self.run(timeout=timeout, check=True)
         except subprocess.CalledProcessError as error:
-            print(f"{self.filename} failed: {error.stderr.decode('utf-8').strip()}")
-            print(f"Parameters: {x}\n")
-            raise(RuntimeError("Simulation Failure"))
-
-        self.load()
+            if not store:
+                os.remove(self.filename)
+            raise SimulationFailure(self.filename, error.returncode, (error.stderr or b'').decode('utf-8', 'replace').strip()) from error
+        except (SimulationTimeout, SimulationCancelled):
+            if not store:
+                os.remove(self.filename)
+            raise
+
+        with timings.phase('load'):
+            if load_paths is None:
+                self.load()
+            else:
+                self.load_outputs(load_paths, keep_inputs)
 
-        if not store:
-            os.remove(self.filename)
+            if not store:
+                os.remove(self.filename)
 
     def combine_port_breakthroughs(self, unit:int, comp:int=0, switch:int=0): 
 
@@ -225,6 +447,7 @@ class CadetSimulation(Cadet):
 
         return np.sum(solutions.T * flowrates, axis=1) / sum(flowrates)
 
+    @requires('solution_bulk')
     def post_mass_bulk(self, unit:int): 
         """
         Return array of internal mass (num. moles) calculated as 
@@ -245,6 +468,7 @@ class CadetSimulation(Cadet):
         # Potentially relevant: https://github.com/mewwts/addict/issues/136
         self.root.output.post[f'unit_{unit:03d}'].post_mass_bulk = mass_bulk 
 
+    @requires('solution_particle')
     def post_mass_par(self, unit:int): 
         """
         Return array of internal mass (num. moles) calculated as 
@@ -281,6 +505,7 @@ class CadetSimulation(Cadet):
         # Potentially relevant: https://github.com/mewwts/addict/issues/136
         self.root.output.post[f'unit_{unit:03d}'].post_mass_par = mass_particle
 
+    @requires('solution_solid')
     def post_mass_solid(self, unit:int): 
         """
         Return array of internal mass (num. moles) calculated as 
@@ -317,6 +542,7 @@ class CadetSimulation(Cadet):
         # Potentially relevant: https://github.com/mewwts/addict/issues/136
         self.root.output.post[f'unit_{unit:03d}'].post_mass_solid = mass_solid
 
+    @requires('solution_bulk', 'solution_particle', 'solution_solid')
     def post_mass_total(self, unit:int): 
         """
         Return array of internal mass (num. moles) calculated as 
@@ -379,6 +605,7 @@ class CadetSimulation(Cadet):
         self.root.output.post[f'unit_{unit:03d}'].post_mass_par = mass_particle
         self.root.output.post[f'unit_{unit:03d}'].post_mass_solid = mass_solid
 
+    @requires('solution_solid_partype_*')
     def post_mass_solid_all_partypes(self, unit:int):
         """ For polydisperse cases """
         UNIT = self.root.input.model[f'unit_{unit:03d}']
@@ -399,10 +626,10 @@ class CadetSimulation(Cadet):
             sol_solid = UNIT_OUT[key].squeeze()
 
             if len(UNIT.par_type_volfrac) == npartype:
-                vol_solid = self.get_vol_array(unit, 'solid') * UNIT.par_type_volfrac[ind]
+                vol_solid = self.get_vol_array(unit, 'solid', ind) * UNIT.par_type_volfrac[ind]
             elif len(UNIT.par_type_volfrac) == nrad * npartype:
                 par_type_volfrac = np.reshape(UNIT.par_type_volfrac, (nrad,npartype))
-                vol_solid = self.get_vol_array(unit, 'solid') * par_type_volfrac[:,ind]
+                vol_solid = self.get_vol_array(unit, 'solid', ind) * par_type_volfrac[:,ind]
             else:
                 raise NotImplementedError
 
@@ -430,6 +657,7 @@ class CadetSimulation(Cadet):
         # np.sum(list(map(lambda key: UNIT_OUT[key], keys)), axis=0)
         self.root.output.post[f'unit_{unit:03d}'].post_mass_solid_all_partypes = np.sum(result, axis=0)
 
+    @requires('solution_particle_partype_*')
     def post_mass_par_all_partypes(self, unit:int):
         """ For polydisperse cases """
         UNIT = self.root.input.model[f'unit_{unit:03d}']
@@ -449,10 +677,10 @@ class CadetSimulation(Cadet):
             sol_par = UNIT_OUT[key].squeeze()
 
             if len(UNIT.par_type_volfrac) == npartype:
-                vol_par = self.get_vol_array(unit, 'particle') * UNIT.par_type_volfrac[ind]
+                vol_par = self.get_vol_array(unit, 'particle', ind) * UNIT.par_type_volfrac[ind]
             elif len(UNIT.par_type_volfrac) == nrad * npartype:
                 par_type_volfrac = np.reshape(UNIT.par_type_volfrac, (nrad,npartype))
-                vol_par = self.get_vol_array(unit, 'particle') * par_type_volfrac[:,ind]
+                vol_par = self.get_vol_array(unit, 'particle', ind) * par_type_volfrac[:,ind]
             else:
                 raise NotImplementedError
 
@@ -507,10 +735,11 @@ class CadetSimulation(Cadet):
 
         return np.array(vol_rad)
 
-    def get_vol_array(self, unit:int, output_type:str): 
+    def get_vol_array(self, unit:int, output_type:str, partype:Optional[int]=None): 
         """ 
         Return an array of shape (ncol, nrad) but squeezed, containing volumes of each discretization volume by type. 
         output_type can be 'bulk', 'particle', 'solid', or 'total'
+        partype selects the par_porosity of one particle type, if it is given per type
         """
         UNIT = self.root.input.model[f'unit_{unit:03d}']
 
@@ -521,6 +750,8 @@ class CadetSimulation(Cadet):
         # WARNING: if else to make it work for DPFRs
         col_porosity = np.array(UNIT.col_porosity) if UNIT.col_porosity is not None else 1.0
         par_porosity = np.array(UNIT.par_porosity) if UNIT.par_porosity is not None else 1.0
+        if partype is not None and par_porosity.size > 1:
+            par_porosity = par_porosity[partype]
 
         col_radius = UNIT.col_radius or np.sqrt(UNIT.cross_section_area / (np.pi))
 
@@ -544,12 +775,48 @@ class CadetSimulation(Cadet):
 
         return vol_arr.squeeze()
 
-def new_run_and_eval(x, sim, parameters, objectives, name:Optional[str]=None, tempdir:Path=Path('temp'), store:bool=False): 
+def required_output_paths(objectives) -> list:
+    """ 
+    Output paths needed to evaluate the objectives. For postprocessed paths
+    (output.post.unit_XXX.post_*), these are the solution datasets that the
+    post routine declares with @requires.
     """
-    Run simulation -> Postprocess -> Evaluate objective scores
+    paths = []
+    for obj_path in sorted(set(obj.path for obj in objectives)):
+        path_split = obj_path.split('.')
+        if path_split[1] == 'post':
+            routine = CadetSimulation.__dict__[path_split[3]]
+            paths.extend(f"output.solution.{path_split[2]}.{output}" for output in routine.requires)
+        else:
+            paths.append(obj_path)
+    return paths
+
+def new_run_and_process(x, sim, parameters, objectives, name:Optional[str]=None, tempdir:Path=Path('temp'), store:bool=False, template:Optional[Path]=None, full_sim=None, timings:Optional[Timings]=None, patch_paths:Optional[list]=None, timeout:Optional[float]=None, cancelled:Optional[Callable[[], bool]]=None, nthreads:Optional[int]=None, normalized:bool=False) -> list: 
     """
-    simulation = CadetSimulation(sim.root)
-    simulation.run_with_parameters(x, parameters, name, tempdir, store)
+    Run simulation -> Postprocess -> Process objective arrays (Objective.process())
+
+    If sim is a coarsened copy of full_sim (see fidelity.py), the objective
+    datasets are prolonged onto the discretization of full_sim first.
+
+    nthreads overrides input.solver.nthreads of sim (see resources.py).
+    normalized tells that the inputs of sim were normalized (see
+    CadetSimulation.normalize_inputs()), so only the outputs are read back.
+
+    The processed arrays are scored afterwards, for a whole population at
+    once, by evaluate_population().
+
+    Phase timings are recorded in timings, if given (see timing.py).
+    """
+    timings = timings if timings is not None else Timings()
+
+    with timings.phase('copy'):
+        simulation = CadetSimulation(sim.root)
+
+    if nthreads is not None:
+        simulation.root.input.solver.nthreads = nthreads
+        patch_paths = list(patch_paths or []) + ['input.solver.nthreads']
+
+    simulation.run_with_parameters(x, parameters, name, tempdir, store, template, load_paths=required_output_paths(objectives), timings=timings, patch_paths=patch_paths, timeout=timeout, cancelled=cancelled, keep_inputs=normalized)
 
     # NOTE: This is a custom way to store postproc data in the hierarchy 
     # Postprocessed data is stored as "output.post.unit_001.post_internal_mass" for ex.
@@ -558,12 +825,38 @@ def new_run_and_eval(x, sim, parameters, objectives, name:Optional[str]=None, te
     # Here, we run the postproc function specified. It is the responsibility of
     # the function to store the data at the right path
     obj_paths = list(set(obj.path for obj in objectives))
-    for obj_path in obj_paths:
-        path_split = obj_path.split('.')
-        if path_split[1] == 'post':
-            CadetSimulation.__dict__[path_split[3]](simulation, int(path_split[2].replace('unit_', '')))
+    with timings.phase('post'):
+        for obj_path in obj_paths:
+            path_split = obj_path.split('.')
+            if path_split[1] == 'post':
+                CadetSimulation.__dict__[path_split[3]](simulation, int(path_split[2].replace('unit_', '')))
+
+        if full_sim is not None:
+            prolong_outputs(simulation, full_sim, obj_paths)
+
+    with timings.phase('process'):
+        return [ obj.process(simulation) for obj in objectives ]
+
+def new_run_and_eval(x, sim, parameters, objectives, name:Optional[str]=None, tempdir:Path=Path('temp'), store:bool=False, memo=None, template:Optional[Path]=None, timings:Optional[Timings]=None): 
+    """
+    Run simulation -> Postprocess -> Evaluate objective scores
+
+    If an EvaluationStore is given as memo, it is consulted before running
+    CADET, and updated with the new scores afterwards.
+    """
+    if memo is not None:
+        results = memo.get(x)
+        if results is not None:
+            return results
+
+    timings = timings if timings is not None else Timings()
+
+    processed = new_run_and_process(x, sim, parameters, objectives, name, tempdir, store, template, timings=timings)
+    with timings.phase('score'):
+        results = evaluate_population(objectives, [processed])[0]
 
-    results = np.hstack(list(map(lambda obj: obj.evaluate(simulation), objectives)))
+    if memo is not None:
+        memo.put(x, results)
 
     return results
 
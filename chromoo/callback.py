@@ -1,12 +1,13 @@
 from pymoo.core.callback import Callback
 
-import asyncio
+from chromoo.writer import BackgroundWriter
 
 class ChromooCallback(Callback):
 
-    def __init__(self, cache) -> None:
+    def __init__(self, cache, writer=None) -> None:
         super().__init__()
         self.cache = cache
+        self.writer = writer if writer is not None else BackgroundWriter()
 
         self.cache.initialize()
 
@@ -15,9 +16,12 @@ class ChromooCallback(Callback):
 
         self.cache.update(algorithm)
 
-        asyncio.run(self.subcallback())
+        # Outputs are written in the background, the next generation starts right away
+        self.cache.write(self.writer)
+
+        metrics = getattr(algorithm.problem, 'metrics', None)
+        if metrics is not None:
+            rows = metrics.collect(algorithm.n_gen)
+            if rows:
+                self.writer.submit(None, metrics.write, rows)
 
-    async def subcallback(self):
-        await asyncio.gather(
-            asyncio.to_thread(self.cache.write),
-        )
@@ -0,0 +1,158 @@
+"""
+Checkpoint
+
+Lightweight checkpoints of a run. Only the state that can't be rebuilt from
+the config is stored:
+    - the algorithm (population, survival/normalization state, termination),
+      without its problem and callback
+    - the random number generator states
+    - the runtime state of the problem (surrogate, fidelity schedule)
+    - the small per-generation lists of the Cache; the population history
+      is referenced by filename, not copied
+
+The simulation template, objectives (with their reference data) and the
+worker pool are rebuilt from the config on resume.
+
+The state is pickled in the calling thread (a consistent snapshot), then
+compressed and written atomically (temporary file + rename) by a
+BackgroundWriter. If a checkpoint is still waiting to be written when the
+next one arrives, only the newer one is written.
+
+load_checkpoint() detects the format by its magic bytes: gzip, lzma, plain
+pickle, or the old np.save()'d algorithm (.npy).
+"""
+
+import gzip
+import io
+import lzma
+import os
+import pickle
+import random
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from chromoo.log import Logger
+from chromoo.writer import BackgroundWriter
+
+FORMAT_VERSION = 1
+
+COMPRESSORS = {
+    'none': lambda data: data,
+    'gzip': lambda data: gzip.compress(data, compresslevel=6),
+    'lzma': lambda data: lzma.compress(data, preset=1),
+}
+
+MAGIC = {
+    b'\x1f\x8b': gzip.decompress,
+    b'\xfd7zXZ\x00': lzma.decompress,
+}
+
+NPY_MAGIC = b'\x93NUMPY'
+
+def write_atomic(filename, data:bytes):
+    """ Write data to filename via a temporary file in the same directory, and rename it into place """
+    filename = Path(filename)
+    tmp = filename.with_name(f'.{filename.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp, filename)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+def dumps(algorithm, problem=None, cache=None) -> bytes:
+    """ Pickle the checkpoint state of a run """
+    detached = { 'problem': algorithm.problem, 'callback': algorithm.callback }
+    algorithm.problem = None
+    algorithm.callback = None
+    try:
+        state = {
+            'version': FORMAT_VERSION,
+            'algorithm': algorithm,
+            'random': { 'numpy': np.random.get_state(), 'python': random.getstate() },
+            'problem': problem.checkpoint_state() if problem is not None else None,
+            'cache': cache.checkpoint_state() if cache is not None else None,
+        }
+        return pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        algorithm.problem = detached['problem']
+        algorithm.callback = detached['callback']
+
+def loads(data:bytes):
+    """ Decompress and unpickle checkpoint data, returning (state, is_legacy) """
+    for magic, decompress in MAGIC.items():
+        if data.startswith(magic):
+            data = decompress(data)
+            break
+
+    if data.startswith(NPY_MAGIC):
+        algorithm, = np.load(io.BytesIO(data), allow_pickle=True).flatten()
+        return algorithm, True
+
+    return pickle.loads(data), False
+
+def load_checkpoint(filename, problem, callback, cache=None):
+    """
+    Restore the algorithm from a checkpoint, reattaching the given problem and
+    callback (built from the config). Old .npy checkpoints keep their own
+    pickled problem.
+    """
+    state, legacy = loads(Path(filename).read_bytes())
+
+    if legacy:
+        Logger().note(f"{filename} is an old style checkpoint, restoring its pickled problem.")
+        state.problem.nproc = problem.nproc
+        state.callback = callback
+        return state
+
+    if state.get('version') != FORMAT_VERSION:
+        Logger().die(f"Unsupported checkpoint version {state.get('version')} in {filename}.")
+
+    algorithm = state['algorithm']
+    algorithm.problem = problem
+    algorithm.callback = callback
+
+    np.random.set_state(state['random']['numpy'])
+    random.setstate(state['random']['python'])
+
+    if state['problem'] is not None:
+        problem.restore_state(state['problem'])
+    if cache is not None and state['cache'] is not None:
+        cache.restore_state(state['cache'], algorithm.n_gen)
+
+    return algorithm
+
+class Checkpointer:
+    """ Writes checkpoints on a BackgroundWriter (its own, if none is given), see the module docstring """
+
+    def __init__(self, filename='checkpoint.pkl', compression='none', writer=None):
+        self.filename = Path(filename)
+        self.compress = COMPRESSORS[compression]
+        self.owns_writer = writer is None
+        self.writer = writer if writer is not None else BackgroundWriter()
+
+    def write(self, data):
+        write_atomic(self.filename, self.compress(data))
+
+    def save(self, algorithm, problem=None, cache=None):
+        # A checkpoint that hasn't started writing yet is outdated
+        self.writer.submit('checkpoint', self.write, dumps(algorithm, problem, cache))
+
+    def close(self):
+        """ Wait for the last checkpoint to be written """
+        if self.owns_writer:
+            self.writer.close()
+        else:
+            self.writer.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
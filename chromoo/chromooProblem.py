@@ -1,16 +1,27 @@
 from pymoo.core.problem import Problem
+from pymoo.util.optimum import filter_optimum
 from itertools import chain
-from functools import partial
 
-import multiprocessing as mp
 from pathlib import Path
 from chromoo.simulation import run_and_eval
 from chromoo.transforms import transform_array
 
-from chromoo.cadetSimulation import new_run_and_eval
+from chromoo.workerPool import WorkerPool
+from chromoo.evaluationStore import EvaluationStore
+from chromoo.log import Logger
+from chromoo.parameter import ParameterPlan
+from chromoo.surrogate import SurrogateScreen
+from chromoo.fidelity import FidelitySchedule, coarsen
+from chromoo.timing import EvaluationMetrics
+from chromoo.failurePolicy import FailurePolicy
+from chromoo.timeBudget import TimeBudget
+from chromoo.scheduler import Scheduler
+from chromoo.resources import ResourceAllocator
+
+import numpy as np
 
 class ChromooProblem(Problem):
-    def __init__(self, sim, parameters, objectives, nproc=4, tempdir='temp', store_temp=False, transform='none'):
+    def __init__(self, sim, parameters, objectives, nproc=4, tempdir='temp', store_temp=False, transform='none', evaluation_store='', patch_template=True, surrogate=None, fidelity=None, failures=None, timeout=None, scheduler=None, resources=None):
         
         self.min_values = []
         self.max_values = []
@@ -24,6 +35,18 @@ class ChromooProblem(Problem):
 
         self.transform = transform
 
+        # What to do with failed simulations, see FailurePolicy
+        self.failures = FailurePolicy(**failures) if failures else FailurePolicy()
+
+        # Time budgets for cadet-cli, from the observed runtimes, see TimeBudget
+        self.budget = TimeBudget(**timeout) if timeout else TimeBudget()
+
+        # Dispatch order of the evaluations, from their predicted runtimes, see Scheduler
+        self.scheduler = Scheduler(**scheduler) if scheduler else Scheduler()
+
+        # CADET threads per evaluation, see ResourceAllocator
+        self.resources = ResourceAllocator(**resources) if resources else ResourceAllocator()
+
         if self.transform != 'none':
             xls = [0] * n_var
             xus = [1] * n_var
@@ -34,30 +57,241 @@ class ChromooProblem(Problem):
         super().__init__(
             n_var = n_var,
             n_obj = sum(o.n_obj for o in objectives), 
-            n_constr=0, 
+            n_constr=self.failures.n_constr, 
             xl=xls,
             xu=xus )
 
         self.sim = sim
         self.parameters = parameters
+        self.plan = ParameterPlan(parameters)
         self.objectives = objectives
         self.nproc = nproc
         self.store_temp = store_temp
+        self.patch_template = patch_template
 
         self.tempdir=Path(tempdir)
         self.tempdir.mkdir(exist_ok=True)
 
-    def _evaluate(self, X, out, *args, **kwargs):
-
-        with mp.Pool(self.nproc) as pool:
-            denormalized_inputs = transform_array(X, self.min_values, self.max_values, self.transform, mode='inverse')
-            out["F"] = pool.map( 
-                    partial(
-                        new_run_and_eval, 
-                        sim=self.sim, 
-                        parameters=self.parameters, 
-                        objectives=self.objectives, 
-                        name=None, 
-                        tempdir=self.tempdir, 
-                        store=self.store_temp), 
-                    denormalized_inputs)
+        self._pool = None
+
+        # Persistent memo of previous evaluations, consulted before dispatching to workers
+        self.memo = EvaluationStore(evaluation_store, sim, parameters, objectives) if evaluation_store else None
+
+        # Optional surrogate model to pre-screen offspring, see SurrogateScreen for the options
+        self.surrogate = SurrogateScreen(self.xl, self.xu, **surrogate) if surrogate else None
+
+        # Optional multi-fidelity schedule, see FidelitySchedule
+        self.fidelity = FidelitySchedule(**fidelity) if fidelity else None
+
+        # Phase timings of every evaluation, collected per generation by the callback
+        self.metrics = EvaluationMetrics()
+
+    @property
+    def pool(self) -> WorkerPool:
+        """ Persistent worker pool, (re)created on first use, e.g. after resuming from a checkpoint """
+        if self._pool is None or self._pool.nproc != self.nproc:
+            self.close()
+            variants = { index: coarsen(self.sim, level) for index, level in enumerate(self.fidelity.levels) } if self.fidelity else None
+            self._pool = WorkerPool(self.nproc, self.sim, self.plan, self.objectives, tempdir=self.tempdir, store=self.store_temp, patch_template=self.patch_template, variants=variants, metrics=self.metrics, failures=self.failures, budget=self.budget, scheduler=self.scheduler, resources=self.resources)
+        return self._pool
+
+    def close(self, terminate=False):
+        """ Shut down the worker pool, if any. terminate discards outstanding tasks (e.g. after Ctrl-C). """
+        if self._pool is not None:
+            if terminate:
+                self._pool.terminate()
+            else:
+                self._pool.close()
+            self._pool = None
+        if self.memo is not None:
+            self.memo.close()
+
+    def __getstate__(self):
+        # Worker processes can't be pickled into checkpoints
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault('_pool', None)
+        self.__dict__.setdefault('memo', None)
+        self.__dict__.setdefault('patch_template', False)
+        self.__dict__.setdefault('surrogate', None)
+        self.__dict__.setdefault('fidelity', None)
+        self.__dict__.setdefault('metrics', EvaluationMetrics())
+        self.__dict__.setdefault('failures', FailurePolicy())
+        self.__dict__.setdefault('budget', TimeBudget())
+        self.__dict__.setdefault('scheduler', Scheduler())
+        self.__dict__.setdefault('resources', ResourceAllocator())
+        if 'plan' not in self.__dict__:
+            self.plan = ParameterPlan(self.parameters)
+
+    def checkpoint_state(self) -> dict:
+        """ Runtime state that can't be rebuilt from the config, see checkpoint.py """
+        return { 'surrogate': self.surrogate, 'fidelity': self.fidelity, 'runtimes': self.budget.runtimes, 'runtime_samples': self.scheduler.predictor.samples }
+
+    def restore_state(self, state:dict):
+        """ Restore the runtime state saved by checkpoint_state() """
+        if self.surrogate is not None and state.get('surrogate') is not None:
+            self.surrogate = state['surrogate']
+        if self.fidelity is not None and state.get('fidelity') is not None:
+            self.fidelity = state['fidelity']
+        if state.get('runtimes'):
+            self.budget.runtimes = state['runtimes']
+        if state.get('runtime_samples'):
+            self.scheduler.predictor.samples = state['runtime_samples']
+
+    def denormalize(self, X):
+        """ Map X from the optimizer's space to actual parameter values """
+        return transform_array(X, self.min_values, self.max_values, self.transform, mode='inverse')
+
+    def log_memo(self):
+        """ Log and reset the evaluation store hit/miss counters """
+        if self.memo is not None:
+            Logger().info(f"Evaluation store: {self.memo.hits} hits, {self.memo.misses} misses.")
+            self.memo.reset_counters()
+
+    @property
+    def variant(self):
+        """ Simulation variant for the current fidelity level, None for the full simulation """
+        if self.fidelity is None or self.fidelity.is_full:
+            return None
+        return self.fidelity.index
+
+    def simulate(self, X, variant=None):
+        """ 
+        Return the scores for every row of X (in the optimizer's space), from
+        the evaluation store or the workers. Only full fidelity (variant=None)
+        results are stored. Failed evaluations have NaN scores, see penalize().
+        """
+        denormalized_inputs = self.denormalize(X)
+
+        if self.memo is None or variant is not None:
+            return np.array(self.pool.map(denormalized_inputs, variant=variant, features=X))
+
+        F = self.memo.get_many(denormalized_inputs)
+
+        # Only simulate unique individuals that aren't in the store yet
+        missing = {}
+        for i, f in enumerate(F):
+            if f is None:
+                missing.setdefault(self.memo.key(denormalized_inputs[i]), []).append(i)
+
+        if missing:
+            indices = [ group[0] for group in missing.values() ]
+            results = self.pool.map(denormalized_inputs[indices], features=np.asarray(X)[indices])
+            stored = ~self.failures.failed(results)
+            self.memo.put_many(denormalized_inputs[indices][stored], results[stored])
+            for group, result in zip(missing.values(), results):
+                for i in group:
+                    F[i] = result
+
+        self.log_memo()
+
+        return np.array(F)
+
+    def penalize(self, F):
+        """ Replace the NaN scores of failed evaluations, returns (F, G), see FailurePolicy.penalize() """
+        return self.failures.penalize(F)
+
+    def verify_front(self, algorithm) -> bool:
+        """
+        Simulate members of the current front that only have predicted scores,
+        replace them by their true scores and filter the front again from the
+        population, until it holds no predicted scores. Returns True if any
+        member was simulated.
+        """
+        if self.surrogate is None or algorithm is None or algorithm.opt is None:
+            return False
+
+        verified = False
+        while True:
+            unverified = [ ind for ind in algorithm.opt if np.any(ind.get('predicted')) ]
+            if not unverified:
+                return verified
+
+            X = np.array([ ind.X for ind in unverified ])
+            F = self.simulate(X, self.variant)
+            ok = ~self.failures.failed(F)
+            self.surrogate.update(X[ok], F[ok])
+
+            F, G = self.penalize(F)
+            for i, (ind, f) in enumerate(zip(unverified, F)):
+                ind.set('F', f)
+                if G is not None:
+                    ind.set('G', G[i])
+                    ind.set('CV', np.maximum(G[i], 0))
+                    ind.set('feasible', G[i] <= 0)
+                ind.set('predicted', np.array([False]))
+
+            # True scores may be dominated, and predicted ones may now enter the front
+            algorithm.opt = filter_optimum(algorithm.pop, least_infeasible=True)
+            verified = True
+
+    def rescore_front(self, algorithm) -> bool:
+        """ If the run ended on a coarse fidelity level, re-score the current front at full fidelity and filter it again. Returns True if it did. """
+        if self.variant is None or algorithm is None or algorithm.opt is None:
+            return False
+
+        opt = algorithm.opt
+        Logger().info(f"Fidelity: the run ended on level {self.fidelity.index + 1} of {len(self.fidelity.levels)}, re-scoring the {len(opt)} members of the front at full fidelity.")
+
+        F, G = self.penalize(self.simulate(opt.get('X')))
+        opt.set('F', F)
+        if G is not None:
+            opt.set('G', G, 'CV', np.maximum(G, 0), 'feasible', G <= 0)
+        if self.surrogate is not None:
+            opt.set('predicted', np.zeros((len(opt), 1), dtype=bool))
+
+        # The rest of the population still has coarse scores, only the front is filtered
+        algorithm.opt = filter_optimum(opt, least_infeasible=True)
+        return True
+
+    def step_fidelity(self, algorithm):
+        """ Step up the fidelity if the schedule says so, and re-score the current population at the new level """
+        if self.fidelity is None or not self.fidelity.step(algorithm):
+            return
+
+        pop = algorithm.pop
+        F = self.simulate(pop.get('X'), self.variant)
+        ok = ~self.failures.failed(F)
+        F, G = self.penalize(F)
+        pop.set('F', F)
+        if G is not None:
+            pop.set('G', G, 'CV', np.maximum(G, 0), 'feasible', G <= 0)
+        if self.surrogate is not None:
+            pop.set('predicted', np.zeros((len(pop), 1), dtype=bool))
+            self.surrogate.reset()
+            self.surrogate.update(pop.get('X')[ok], F[ok])
+
+        # The ideal, worst and extreme points of NSGA3's normalization are kept across generations, drop the coarse ones
+        survival = getattr(algorithm, 'survival', None)
+        if getattr(survival, 'norm', None) is not None:
+            survival.norm = type(survival.norm)(self.n_obj)
+
+    def _evaluate(self, X, out, *args, algorithm=None, **kwargs):
+        self.step_fidelity(algorithm)
+
+        if self.surrogate is None:
+            out["F"], G = self.penalize(self.simulate(X, self.variant))
+            if G is not None:
+                out["G"] = G
+            return
+
+        # Predicted scores must not survive in the front for long
+        self.verify_front(algorithm)
+
+        simulate, F_predicted = self.surrogate.screen(X)
+
+        F = np.array(F_predicted) if F_predicted is not None else np.zeros((len(X), self.n_obj))
+        F[simulate] = self.simulate(X[simulate], self.variant)
+
+        ok = simulate & ~self.failures.failed(F)
+        self.surrogate.log(ok, F[ok], F_predicted)
+        self.surrogate.update(X[ok], F[ok])
+
+        out["F"], G = self.penalize(F)
+        if G is not None:
+            out["G"] = G
+        out["predicted"] = ~simulate
@@ -18,9 +18,10 @@ from chromoo.utils import readArray, readChromatogram
 from chromoo.simulation import load_file
 
 from addict import Dict
-from chromoo.parameter import Parameter
+from chromoo.parameter import Parameter, ParameterPlan
 from chromoo.objective import Objective
-from chromoo.cadetSimulation import CadetSimulation
+from chromoo.fidelity import FidelityLevel
+from chromoo.cadetSimulation import CadetSimulation, required_output_paths
 
 from typing import Any
 
@@ -78,13 +79,29 @@ class ConfigHandler:
         self.nproc      =  self.get('nproc', vartype=int, default =4)
         self.store_temp =  self.get('store_temp', vartype=bool, default=False)
         self.temp_dir =  self.get('temp_dir', vartype=str(), default='/dev/shm/chromoo')
+        self.evaluation_store = self.get('evaluation_store', vartype=str, default='evaluations.sqlite')
+        self.patch_template = self.get('patch_template', vartype=bool, default=True)
+        self.prune_return_flags = self.get('prune_return_flags', vartype=bool, default=False)
 
         self.load_checkpoint = self.get('load_checkpoint', vartype=str, default='.', wrapper=Path)
         self.force_checkpoint_continue = self.get('force_checkpoint_continue', vartype=bool, default=False)
+        self.checkpoint = Dict()
+        # Keep saving to the checkpoint we resume from, unless told otherwise
+        resume_from = str(self.load_checkpoint) if self.load_checkpoint != Path('.') else None
+        self.checkpoint.filename = self.get('checkpoint.filename', resume_from or 'checkpoint.pkl', str)
+        if resume_from and Path(self.checkpoint.filename) != self.load_checkpoint:
+            self.logger.warn(f"Resuming from {resume_from}, but saving checkpoints to {self.checkpoint.filename}.")
+        self.checkpoint.compression = self.get('checkpoint.compression', 'none', str, ['none', 'gzip', 'lzma'])
 
         self.parameters = []
         for param in self.get('parameters', vartype=list) or []:
             self.parameters.append(Parameter(**param))
+        self.parameter_plan = ParameterPlan(self.parameters)
+
+        # Parameters fixed at a value (min_value), e.g. by `chromoo screen`
+        self.fixed_parameters = []
+        for param in self.get('fixed_parameters', [], list):
+            self.fixed_parameters.append(Parameter(**param))
 
         self.par_min_values = []
         self.par_max_values = []
@@ -120,9 +137,14 @@ class ConfigHandler:
 
         self.algorithm.name = self.get('algorithm.name', 'unsga3', str(), ['unsga3', 'nsga3'])
         self.algorithm.pop_size= self.get('algorithm.pop_size', 10, vartype=int)
-        self.algorithm.n_offsprings = self.get('algorithm.n_offsprings', self.algorithm.pop_size, vartype=int)
+        self.algorithm.mode = self.get('algorithm.mode', 'generational', str, ['generational', 'steady_state'])
+        # In steady_state mode, n_offsprings is the number of completed evaluations per survival step
+        self.algorithm.n_offsprings = self.get('algorithm.n_offsprings', self.algorithm.pop_size if self.algorithm.mode == 'generational' else self.nproc, vartype=int)
         self.algorithm.n_obj = self.n_obj
         self.algorithm.init_sobol = self.get('algorithm.init_sobol', False, bool)
+        self.algorithm.ref_dirs = self.get('algorithm.ref_dirs', 'energy', str, ['energy', 'das-dennis', 'auto'])
+        self.algorithm.ref_dirs_threshold = self.get('algorithm.ref_dirs_threshold', 10, int)
+        self.algorithm.survival = self.get('algorithm.survival', 'default', str, ['default', 'fast'])
 
         self.parameter_transform = self.get('transforms.parameters', 'none', str, ['none', 'lognorm', 'norm'])
         # self.objective_transform = self.get('transforms.objectives', 'none', str, ['none', 'mean', 'geometric'])
@@ -136,6 +158,59 @@ class ConfigHandler:
         self.termination.n_max_gen = self.get('termination.n_max_gen', 100, int)
         self.termination.n_max_evals = self.get('termination.n_max_evals', 1000, int)
 
+        # Failed simulations, see FailurePolicy
+        self.failures = Dict()
+        self.failures.retries = self.get('failures.retries', 2, int)
+        self.failures.relax = self.get('failures.relax', 10.0, float)
+        self.failures.mode = self.get('failures.mode', 'constraint', str, ['constraint', 'penalty', 'abort'])
+        self.failures.penalty = self.get('failures.penalty', 1e10, float)
+        self.failures.log = self.get('failures.log', 'failures.jsonl', str)
+
+        # Time budgets for cadet-cli, see TimeBudget
+        self.timeout = Dict()
+        self.timeout.seconds = self.get('timeout.seconds', 0.0, float)
+        self.timeout.factor = self.get('timeout.factor', 0.0, float)
+        self.timeout.percentile = self.get('timeout.percentile', 95.0, float)
+        self.timeout.min_samples = self.get('timeout.min_samples', 10, int)
+        self.timeout.speculate = self.get('timeout.speculate', False, bool)
+        self.timeout.speculate_factor = self.get('timeout.speculate_factor', 1.5, float)
+
+        # Dispatch order and chunking of evaluations, see Scheduler
+        self.scheduler = Dict()
+        self.scheduler.order = self.get('scheduler.order', 'longest_first', str, ['longest_first', 'fifo'])
+        self.scheduler.chunking = self.get('scheduler.chunking', True, bool)
+        self.scheduler.max_chunk = self.get('scheduler.max_chunk', 8, int)
+        self.scheduler.min_samples = self.get('scheduler.min_samples', 10, int)
+
+        # CADET threads per evaluation, see ResourceAllocator
+        self.resources = Dict()
+        self.resources.adaptive = self.get('resources.adaptive', False, bool)
+        self.resources.cores = self.get('resources.cores', 0, int)
+        self.resources.max_threads = self.get('resources.max_threads', 0, int)
+        self.resources.pin = self.get('resources.pin', False, bool)
+
+        # Surrogate-assisted pre-screening of offspring, None if disabled
+        self.surrogate = None
+        if self.get('surrogate.enabled', False, bool):
+            if self.algorithm.mode != 'generational':
+                self.logger.die('surrogate pre-screening is only supported with algorithm.mode: generational')
+            self.surrogate = Dict()
+            self.surrogate.fraction = self.get('surrogate.fraction', 0.5, float)
+            self.surrogate.n_uncertain = self.get('surrogate.n_uncertain', 1, int)
+            self.surrogate.min_samples = self.get('surrogate.min_samples', 2 * self.algorithm.pop_size, int)
+            self.surrogate.max_samples = self.get('surrogate.max_samples', 500, int)
+            self.surrogate.kappa = self.get('surrogate.kappa', 1.0, float)
+
+        # Multi-fidelity schedule, None if disabled
+        self.fidelity = None
+        if self.get('fidelity.levels', [], list):
+            if self.algorithm.mode != 'generational':
+                self.logger.die('fidelity schedules are only supported with algorithm.mode: generational')
+            self.fidelity = Dict()
+            self.fidelity.levels = [ FidelityLevel(**level) for level in self.get('fidelity.levels', [], list) ]
+            self.fidelity.stall_tol = self.get('fidelity.stall_tol', 0.0, float)
+            self.fidelity.stall_generations = self.get('fidelity.stall_generations', 3, int)
+
     def construct_simulation(self):
         self.simulation =  CadetSimulation(load_file(self.filename).root)
 
@@ -147,6 +222,26 @@ class ConfigHandler:
 
         assert all( [ obj.verify(self.simulation) for obj in self.objectives ] )
 
+        if self.fixed_parameters: 
+            fixed = ParameterPlan(self.fixed_parameters)
+            fixed.validate(self.simulation.root)
+            fixed.apply(self.simulation.root, np.concatenate([ p.min_value for p in self.fixed_parameters ]))
+
+        # Fail early on bad parameter paths, instead of inside a worker
+        self.parameter_plan.validate(self.simulation.root)
+
+        if self.prune_return_flags: 
+            if self.store_temp:
+                self.logger.note("prune_return_flags with store_temp: the stored simulations only hold the outputs of the objectives.")
+            size_before = self.simulation.estimate_output_size()
+            self.simulation.prune_return_flags(required_output_paths(self.objectives))
+            size_after = self.simulation.estimate_output_size()
+            self.logger.info(f"Pruned CADET return flags. Estimated output size per simulation: {size_before/1e6:.2f} MB -> {size_after/1e6:.2f} MB")
+
+            # Outputs stored in the original simulation file would otherwise be copied into every evaluation
+            self.simulation.root.pop('output', None)
+
+        # Overridden per evaluation with resources.adaptive
         if self.nproc > 1: 
             self.simulation.root.input.solver.nthreads = 1
         else: 
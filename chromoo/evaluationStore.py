@@ -0,0 +1,144 @@
+"""
+EvaluationStore
+
+Persistent, content-addressed store of evaluation results.
+
+Keys are hashes of the denormalized parameter vector x, namespaced by the
+parameter definitions, a hash of the simulation template (without the solver
+threads, which don't change the results) and the objective definitions
+(including their reference data). Values are the objective
+vectors F. Results are kept in an SQLite database so that they survive
+restarts and can be shared between runs of the same problem.
+"""
+
+import hashlib
+import sqlite3
+
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+def hash_tree(tree, digest=None):
+    """ Hash a nested dict of arrays/scalars/strings in a key-order independent way """
+    digest = digest or hashlib.sha256()
+    if isinstance(tree, dict):
+        for key in sorted(tree.keys(), key=str):
+            digest.update(str(key).encode())
+            hash_tree(tree[key], digest)
+    else:
+        if isinstance(tree, str):
+            tree = tree.encode()
+        if isinstance(tree, bytes):
+            digest.update(tree)
+        else:
+            array = np.asarray(tree)
+            digest.update(str(array.dtype).encode())
+            digest.update(str(array.shape).encode())
+            digest.update(array.tobytes())
+    return digest
+
+def template_hash(sim) -> str:
+    """ Hash of the simulation template inputs, except for input.solver.nthreads """
+    inputs = dict(sim.root.input)
+    if isinstance(inputs.get('solver'), dict):
+        inputs['solver'] = { key: value for key, value in inputs['solver'].items() if key != 'nthreads' }
+    return hash_tree(inputs).hexdigest()
+
+def parameters_hash(parameters) -> str:
+    """ Hash of everything that decides where x is written into the simulation """
+    digest = hashlib.sha256()
+    for p in parameters:
+        digest.update(f"{p.type}|{p.path}|{list(p.index)}|{p.length}|{p.copy_to_path}|{[ list(idx) for idx in p.copy_to_index ]}".encode())
+    return digest.hexdigest()
+
+def objectives_hash(objectives) -> str:
+    """ Hash of the objective definitions and their reference data """
+    digest = hashlib.sha256()
+    for obj in objectives:
+        digest.update(f"{obj.name}|{obj.path}|{obj.score}|{obj.take}|{obj.combine_data_axis}|{obj.sum_data_axis}|{obj.combine_scores_axis}".encode())
+        hash_tree({'x0': obj.x0, 'y0': obj.y0}, digest)
+    return digest.hexdigest()
+
+class EvaluationStore:
+
+    def __init__(self, filename, sim, parameters, objectives):
+        self.filename = Path(filename)
+
+        namespace = hashlib.sha256()
+        namespace.update(parameters_hash(parameters).encode())
+        namespace.update(template_hash(sim).encode())
+        namespace.update(objectives_hash(objectives).encode())
+        self.namespace = namespace.digest()
+
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.filename, timeout=60)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS evaluations (key TEXT PRIMARY KEY, F BLOB)")
+            self._conn.commit()
+        return self._conn
+
+    def key(self, x) -> str:
+        digest = hashlib.sha256(self.namespace)
+        digest.update(np.ascontiguousarray(x, dtype=np.float64).tobytes())
+        return digest.hexdigest()
+
+    def get(self, x) -> Optional[np.ndarray]:
+        """ Return the stored F for x, or None """
+        return self.get_many([x])[0]
+
+    def get_many(self, X) -> list:
+        """ Return a list with the stored F (or None) for every row of X """
+        keys = [ self.key(x) for x in X ]
+        found = {}
+
+        # Stay below SQLite's limit on the number of query parameters
+        unique_keys = list(set(keys))
+        for start in range(0, len(unique_keys), 500):
+            chunk = unique_keys[start:start+500]
+            rows = self.conn.execute(
+                    f"SELECT key, F FROM evaluations WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk)
+            found.update({ key: np.frombuffer(F, dtype=np.float64) for key, F in rows })
+
+        results = [ found.get(key) for key in keys ]
+
+        n_hits = sum(F is not None for F in results)
+        self.hits += n_hits
+        self.misses += len(results) - n_hits
+
+        return results
+
+    def put(self, x, F):
+        self.put_many([x], [F])
+
+    def put_many(self, X, Fs):
+        """ Store F for every row of X """
+        self.conn.executemany(
+                "INSERT OR REPLACE INTO evaluations (key, F) VALUES (?, ?)",
+                [ (self.key(x), np.ascontiguousarray(F, dtype=np.float64).tobytes()) for x, F in zip(X, Fs) ])
+        self.conn.commit()
+
+    def reset_counters(self):
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+
+    def __getstate__(self):
+        # SQLite connections can't be pickled (e.g. into checkpoints); reopened lazily
+        state = self.__dict__.copy()
+        state['_conn'] = None
+        return state
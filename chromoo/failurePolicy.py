@@ -0,0 +1,144 @@
+"""
+FailurePolicy
+
+What to do when an evaluation fails, instead of aborting the whole batch.
+
+In the worker, a failed cadet-cli run (SimulationFailure, or a
+SimulationTimeout when it exceeds its time budget) is retried up to
+`retries` times, with the time integrator tolerances (abstol, algtol, reltol)
+relaxed by a factor of `relax` per attempt. Other errors (e.g. reading or
+processing the outputs) aren't retried. Every failed attempt is returned to
+the parent with its error, stderr and parameters, and appended as a JSON line
+to the failure log.
+
+Evaluations that still fail get NaN scores from the WorkerPool, and the
+consumers replace them (see penalize()), depending on `mode`:
+    - constraint (default): every objective gets the `penalty` score, plus a
+      violated constraint (G = 1), so that NSGA3 ranks them behind all
+      feasible individuals and keeps them out of its normalization
+    - penalty: only the penalty score. NSGA3 then normalizes with the
+      penalized scores, which squashes all others towards the ideal point
+    - abort: raise, as before
+
+Failed evaluations are never stored in the evaluation store or fed to the
+surrogate. If every evaluation of a batch fails, something is wrong with the
+setup rather than the parameters, and the batch is aborted anyway.
+"""
+
+import json
+import os
+import threading
+import traceback
+from datetime import datetime
+
+import numpy as np
+
+from chromoo.cadetSimulation import SimulationFailure
+from chromoo.log import Logger
+
+TOLERANCES = ['abstol', 'algtol', 'reltol']
+
+class EvaluationFailure(RuntimeError):
+    """ An evaluation that failed after all attempts, with mode: abort """
+
+class FailurePolicy:
+
+    def __init__(self, retries=2, relax=10.0, mode='constraint', penalty=1e10, log='failures.jsonl'):
+        self.retries = retries
+        self.relax = relax
+        self.mode = mode
+        self.penalty = penalty
+        self.log = log
+        self.lock = threading.Lock()
+
+    @property
+    def n_constr(self):
+        return 1 if self.mode == 'constraint' else 0
+
+    def relaxed(self, sim, attempt):
+        """ Return (simulation, changed paths) for an attempt: the simulation itself at first, then a copy with relaxed tolerances """
+        if attempt == 0 or self.relax == 1.0:
+            return sim, []
+
+        relaxed = type(sim)(sim.root)
+        time_integrator = relaxed.root.input.solver.time_integrator
+        paths = []
+        for key in TOLERANCES:
+            if time_integrator[key]:
+                time_integrator[key] = float(time_integrator[key]) * self.relax**attempt
+                paths.append(f'input.solver.time_integrator.{key}')
+        return relaxed, paths
+
+    @staticmethod
+    def describe(x, attempt, error, relax) -> dict:
+        """ Failure log entry of one attempt """
+        return {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'pid': os.getpid(),
+            'x': [ float(v) for v in x ],
+            'attempt': attempt,
+            'relax': relax,
+            'error': type(error).__name__,
+            'message': str(error),
+            'returncode': getattr(error, 'returncode', None),
+            'stderr': getattr(error, 'stderr', None) or '',
+            'traceback': '' if isinstance(error, SimulationFailure) else traceback.format_exc(),
+        }
+
+    def evaluate(self, x, sim, run, first_attempt=0):
+        """
+        Call run(sim, patch_paths) until it succeeds, relaxing the tolerances
+        of sim after a SimulationFailure (including a SimulationTimeout).
+        first_attempt > 0 starts relaxed (e.g. a speculative duplicate, see timeBudget.py).
+        Call in the worker. Returns (result or None, list of failure log entries).
+        """
+        failures = []
+        for attempt in range(first_attempt, max(self.retries, first_attempt) + 1):
+            attempt_sim, paths = self.relaxed(sim, attempt)
+            try:
+                return run(attempt_sim, paths), failures
+            except SimulationFailure as error:
+                failures.append(self.describe(x, attempt, error, self.relax**attempt))
+            except Exception as error:
+                failures.append(self.describe(x, attempt, error, self.relax**attempt))
+                break
+        return None, failures
+
+    def record(self, failures, succeeded):
+        """ Append the failed attempts of one evaluation to the log, and warn. Call in the parent. """
+        if not failures:
+            return
+
+        with self.lock:
+            with open(self.log, 'a') as fp:
+                fp.writelines(json.dumps({ **entry, 'succeeded': succeeded }) + '\n' for entry in failures)
+
+        last = failures[-1]
+        outcome = 'succeeded with relaxed tolerances' if succeeded else 'failed'
+        Logger().warn(f"Evaluation {outcome} after {len(failures)} failed attempt(s): {last['error']}: {last['message']} {last['stderr'][-200:]}".strip())
+
+        if not succeeded and self.mode == 'abort':
+            raise EvaluationFailure(f"Simulation failed after {len(failures)} attempt(s), see {self.log}")
+
+    @staticmethod
+    def failed(F) -> np.ndarray:
+        """ Mask of the rows of F from failed evaluations """
+        return np.isnan(np.atleast_2d(F)).any(axis=1)
+
+    def penalize(self, F):
+        """ Replace the scores of failed evaluations by the penalty. Returns (F, G), G is None unless mode is constraint. """
+        F = np.array(F, dtype=float)
+        failed = self.failed(F)
+        F[failed] = self.penalty
+        G = failed.astype(float)[:, np.newaxis] if self.n_constr else None
+        return F, G
+
+    def __getstate__(self):
+        # Locks can't be pickled
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
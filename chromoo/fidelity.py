@@ -0,0 +1,196 @@
+"""
+Fidelity
+
+Multi-fidelity schedule for generational runs. Early generations are evaluated
+on coarsened copies of the simulation (fewer ncol/nrad/npar cells, relaxed
+solver tolerances), and the fidelity steps up after a given number of
+generations, or earlier if the optimization stalls. The last level is always
+the full simulation.
+
+Coarse outputs are prolonged back onto the full discretization (see
+prolong_outputs()), so that objectives compare against the reference data as
+usual. Intensive data (concentrations) is interpolated linearly between cell
+centers, extensive data (post_mass_* per cell) is redistributed by cell volume.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from chromoo.log import Logger
+
+@dataclass(init=True, repr=True, frozen=True)
+class FidelityLevel:
+    ncol: float = 1.0                   # factors applied to the discretization of every unit
+    nrad: float = 1.0
+    npar: float = 1.0
+    abstol: Optional[float] = None      # solver tolerances, unchanged if None
+    reltol: Optional[float] = None
+    generations: Optional[int] = None   # generations to spend on this level, None to only step up on stall
+
+    @property
+    def is_full(self):
+        return self.ncol == self.nrad == self.npar == 1.0 and self.abstol is None and self.reltol is None
+
+def scale(n, factor):
+    """ Scale a number of cells, keeping at least 2 cells if there were more than one """
+    if n is None or n <= 1:
+        return n
+    return max(2, int(round(n * factor)))
+
+def coarsen(sim, level: FidelityLevel):
+    """ Return a copy of sim with the discretization and tolerances of the given level """
+    coarse = type(sim)(sim.root)
+
+    for unit in coarse.units:
+        UNIT = coarse.root.input.model[unit]
+        disc = UNIT.discretization
+        if not disc.ncol:
+            continue
+
+        disc.ncol = scale(disc.ncol, level.ncol)
+
+        if disc.nrad and level.nrad != 1.0:
+            # Radial zones are tied to ports, connections and per-zone parameters; only coarsen plain 2D units
+            per_zone = [ key for key, value in UNIT.items() if key != 'discretization' and np.size(value) > 1 and np.size(value) % disc.nrad == 0 ]
+            if UNIT.ports and UNIT.ports > 1 or per_zone:
+                Logger().note(f"Fidelity: not coarsening nrad of {unit}, which has ports or per-zone values ({', '.join(per_zone) or 'ports'}).")
+            else:
+                disc.nrad = scale(disc.nrad, level.nrad)
+
+        if disc.npar and level.npar != 1.0 and not disc.par_disc_vector:
+            disc.npar = np.vectorize(lambda n: scale(n, level.npar))(disc.npar) if np.size(disc.npar) > 1 else scale(disc.npar, level.npar)
+
+    time_integrator = coarse.root.input.solver.time_integrator
+    if level.abstol is not None:
+        time_integrator.abstol = level.abstol
+    if level.reltol is not None:
+        time_integrator.reltol = level.reltol
+
+    return coarse
+
+def cell_edges(n, disc_type=None, radial=False):
+    """ Normalized cell edges on [0,1] """
+    if radial and disc_type == b'EQUIVOLUME':
+        return np.sqrt(np.linspace(0, 1, n + 1))
+    return np.linspace(0, 1, n + 1)
+
+def resample(y, axis, edges_from, edges_to, weights_from=None, weights_to=None):
+    """
+    Linear interpolation between cell centers along axis.
+    If weights (volume fractions of the cells) are given, y is extensive and is
+    interpolated as a density.
+    """
+    shape = [1] * y.ndim
+    shape[axis] = -1
+
+    if weights_from is not None:
+        y = y / weights_from.reshape(shape)
+
+    centers_from = (edges_from[1:] + edges_from[:-1]) / 2
+    centers_to = (edges_to[1:] + edges_to[:-1]) / 2
+
+    position = np.interp(centers_to, centers_from, np.arange(len(centers_from)))
+    lo = np.floor(position).astype(int)
+    hi = np.minimum(lo + 1, len(centers_from) - 1)
+    w = (position - lo).reshape(shape)
+
+    y = np.take(y, lo, axis=axis) * (1 - w) + np.take(y, hi, axis=axis) * w
+
+    if weights_to is not None:
+        y = y * weights_to.reshape(shape)
+
+    return y
+
+def prolong_outputs(sim, full_sim, paths):
+    """ Resample the datasets at paths in sim (coarse) onto the discretization of full_sim """
+    for path in paths:
+        path_split = path.split('.')
+        name = path_split[-1]
+        if len(path_split) < 3 or not path_split[2].startswith('unit_'):
+            continue
+
+        extensive = name.startswith('post_mass')
+        if not (extensive or name.startswith(('solution_bulk', 'solution_particle', 'solution_solid', 'solution_flux'))):
+            continue
+
+        unit = path_split[2]
+        disc = sim.root.input.model[unit].discretization
+        full_disc = full_sim.root.input.model[unit].discretization
+
+        y = np.asarray(sim.get(path))
+        axis = 1
+
+        # Axes after time: ncol, [nrad], [npar]
+        axes = [ ('ncol', False) ]
+        if full_disc.nrad:
+            axes.append(('nrad', True))
+        if name.startswith(('solution_particle', 'solution_solid')) and np.size(full_disc.npar) == 1:
+            axes.append(('npar', False))
+
+        for key, radial in axes:
+            n, n_full = disc[key], full_disc[key]
+            if n != n_full and y.ndim > axis and y.shape[axis] == n:
+                edges = cell_edges(n, disc.radial_disc_type, radial)
+                edges_full = cell_edges(n_full, full_disc.radial_disc_type, radial)
+                if extensive:
+                    weights = np.diff(edges**2) if radial else np.diff(edges)
+                    weights_full = np.diff(edges_full**2) if radial else np.diff(edges_full)
+                    y = resample(y, axis, edges, edges_full, weights, weights_full)
+                else:
+                    y = resample(y, axis, edges, edges_full)
+            axis += 1
+
+        sim.set(path, y)
+
+class FidelitySchedule:
+    """
+    Sequence of fidelity levels, followed by the full simulation.
+    step() advances after level.generations generations, or when the best
+    geometric mean score improved by less than stall_tol (relative) over the
+    last stall_generations generations.
+    """
+    def __init__(self, levels, stall_tol=0.0, stall_generations=3):
+        self.levels = [ level if isinstance(level, FidelityLevel) else FidelityLevel(**level) for level in levels ]
+        self.levels = [ level for level in self.levels if not level.is_full ]
+        self.stall_tol = stall_tol
+        self.stall_generations = stall_generations
+
+        self.index = 0
+        self.start_gen = 1
+        self.best = []
+
+    @property
+    def is_full(self):
+        return self.index >= len(self.levels)
+
+    @property
+    def level(self) -> Optional[FidelityLevel]:
+        """ Current level, None at full fidelity """
+        return None if self.is_full else self.levels[self.index]
+
+    def stalled(self):
+        if self.stall_tol <= 0 or len(self.best) <= self.stall_generations:
+            return False
+        previous, current = self.best[-self.stall_generations - 1], self.best[-1]
+        return (previous - current) <= self.stall_tol * abs(previous)
+
+    def step(self, algorithm) -> bool:
+        """ Call before evaluating a generation. Returns True if the fidelity stepped up. """
+        if self.is_full or algorithm is None or algorithm.opt is None:
+            return False
+
+        F = algorithm.opt.get('F')
+        self.best.append(np.min(np.abs(np.prod(F, axis=1)) ** (1.0 / F.shape[1])))
+
+        generations = algorithm.n_gen - self.start_gen
+        level = self.level
+        if (level.generations is not None and generations >= level.generations) or self.stalled():
+            self.index += 1
+            self.start_gen = algorithm.n_gen
+            self.best = []
+            Logger().info(f"Fidelity: stepping up to {'full fidelity' if self.is_full else f'level {self.index + 1} of {len(self.levels)}'} at generation {algorithm.n_gen}.")
+            return True
+
+        return False
@@ -0,0 +1,121 @@
+"""
+History
+
+Append-only store of all evaluated populations, one .npy block per
+generation plus a line per block in index.jsonl:
+
+    history/
+        columns.json            column names of the blocks
+        index.jsonl             {"generation": g, "file": "gen_000001.npy", "rows": n} per line
+        gen_000001.npy          (n, n_columns) float64 block
+
+Appending a generation writes only its own block, and the index is the
+source of truth: blocks that aren't listed in it are ignored. Appending a
+generation that is already stored (e.g. after resuming from an older
+checkpoint) first drops it and all later ones.
+
+read() loads blocks lazily (memory-mapped), with generation filtering and
+column projection.
+"""
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+class History:
+
+    def __init__(self, directory='history', columns=None):
+        """ columns: column names of the blocks, None to open an existing history read-only """
+        self.directory = Path(directory)
+        self.index_file = self.directory / 'index.jsonl'
+        self.columns_file = self.directory / 'columns.json'
+
+        if columns is None:
+            self.columns = json.loads(self.columns_file.read_text())
+            return
+
+        self.columns = list(columns)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # A history of a different problem is discarded
+        if not self.columns_file.exists() or json.loads(self.columns_file.read_text()) != self.columns:
+            self.truncate(0)
+            self.columns_file.write_text(json.dumps(self.columns))
+
+        self.last = max(self.generations(), default=0)
+
+    @staticmethod
+    def block_name(generation:int) -> str:
+        return f'gen_{generation:06d}.npy'
+
+    def index(self) -> list:
+        """ Index entries, in the order they were appended """
+        if not self.index_file.exists():
+            return []
+        with open(self.index_file) as fp:
+            return [ json.loads(line) for line in fp if line.strip() ]
+
+    def generations(self) -> list:
+        return [ entry['generation'] for entry in self.index() ]
+
+    def truncate(self, generation:int):
+        """ Drop all generations after the given one """
+        entries = self.index()
+        keep = [ entry for entry in entries if entry['generation'] <= generation ]
+        if len(keep) == len(entries) and self.index_file.exists():
+            return
+
+        tmp = self.index_file.with_suffix('.tmp')
+        with open(tmp, 'w') as fp:
+            fp.writelines(json.dumps(entry) + '\n' for entry in keep)
+        os.replace(tmp, self.index_file)
+
+        for entry in entries[len(keep):]:
+            (self.directory / entry['file']).unlink(missing_ok=True)
+
+        self.last = max((entry['generation'] for entry in keep), default=0)
+
+    def append(self, generation:int, block):
+        """ Store the rows of one generation, shape (n, len(columns)) """
+        block = np.asarray(block, dtype=float)
+        if block.ndim != 2 or block.shape[1] != len(self.columns):
+            raise ValueError(f"History block has shape {block.shape}, expected (n, {len(self.columns)})")
+
+        if generation <= self.last:
+            self.truncate(generation - 1)
+
+        name = self.block_name(generation)
+        tmp = self.directory / f'.{name}'
+        with open(tmp, 'wb') as fp:
+            np.save(fp, block)
+        os.replace(tmp, self.directory / name)
+
+        with open(self.index_file, 'a') as fp:
+            fp.write(json.dumps({'generation': generation, 'file': name, 'rows': len(block)}) + '\n')
+        self.last = generation
+
+    def blocks(self, generations=None):
+        """ Yield (generation, memory-mapped block) for the selected generations (all if None) """
+        selected = None if generations is None else set(generations)
+        for entry in self.index():
+            if selected is None or entry['generation'] in selected:
+                yield entry['generation'], np.load(self.directory / entry['file'], mmap_mode='r')
+
+    def read(self, columns=None, generations=None, with_generation=True) -> pd.DataFrame:
+        """ DataFrame of the selected columns (all if None) and generations, with a leading 'generation' column """
+        columns = self.columns if columns is None else list(columns)
+        indices = [ self.columns.index(column) for column in columns ]
+
+        parts, gens = [], []
+        for generation, block in self.blocks(generations):
+            parts.append(np.asarray(block[:, indices]))
+            gens.append(np.full(len(block), generation))
+
+        data = np.vstack(parts) if parts else np.empty((0, len(columns)))
+        df = pd.DataFrame(data, columns=columns)
+        if with_generation:
+            df.insert(0, 'generation', np.concatenate(gens) if gens else np.empty(0, dtype=int))
+        return df
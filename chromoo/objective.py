@@ -127,17 +127,22 @@ class Objective:
 
     def evaluate(self, sim): 
         """ Evaluate a simulation based on reference objective data and score function """
+        return self.evaluate_batch(self.process(sim)[np.newaxis])[0]
 
-        y0 = self.y0
-
-        y = self.process(sim)
+    def evaluate_batch(self, Y): 
+        """ 
+        Evaluate a stack of processed simulation arrays (see process()) of shape (pop, nts, ...) in one go.
+        Returns scores of shape (pop, n_obj)
+        """
+        y0 = self.y0[np.newaxis]
 
-        scores = evaluate_scores(y0, y, self.score)
+        scores = evaluate_scores(y0, Y, self.score, axis=1)
 
         if self.combine_scores_axis is not None: 
-            scores = np.average(scores, axis=self.combine_scores_axis)
+            axis = self.combine_scores_axis
+            scores = np.average(scores, axis=axis + 1 if axis >= 0 else axis)
 
-        return scores.ravel()
+        return scores.reshape(len(Y), -1)
 
     def split(self, y): 
         """
@@ -259,3 +264,11 @@ class Objective:
         fname = Path(fname).with_suffix('.csv')
 
         np.savetxt(fname, np.stack([t0, *[split_y0[i] for i in range(self.n_obj)] ],axis=1), delimiter=',')
+
+def evaluate_population(objectives, processed) -> np.ndarray: 
+    """
+    Score a population at once.
+    processed: for every individual, the list of processed arrays (Objective.process()) for every objective.
+    Returns F of shape (pop, n_obj)
+    """
+    return np.hstack([ obj.evaluate_batch(np.stack([ individual[i] for individual in processed ])) for i, obj in enumerate(objectives) ])
@@ -1,6 +1,8 @@
 from dataclasses import dataclass, field
 from typing import Literal, Any
 
+import numpy as np
+
 @dataclass(init=True, order=True, repr=True, frozen=True)
 class Parameter():
     name: str
@@ -30,3 +32,107 @@ class Parameter():
             return [ f"{self.name}[{num}]" for num in self.index ]
         else: 
             return [ self.name ]
+
+class ParameterPlan:
+    """
+    A list of parameters compiled into an update plan: the slice of x for
+    every parameter, resolved path keys, and index arrays for the 'element'
+    (and copy_to) assignments. Applying x (or a population matrix X) is then
+    a handful of vectorized numpy assignments.
+
+    Iterating over a plan yields the parameters, so it can be used wherever a
+    list of parameters is expected.
+    """
+    def __init__(self, parameters):
+        self.parameters = list(parameters)
+        self.steps = []
+
+        offset = 0
+        for p in self.parameters:
+            columns = slice(offset, offset + p.length)
+            offset += p.length
+
+            if p.type == 'element':
+                self.steps.append((p.path.split('.'), columns, np.asarray(p.index, dtype=np.intp), np.arange(p.length)))
+
+                ## NOTE: Hack to copy flowrate values within the connections matrix
+                if p.copy_to_path:
+                    copy_to_index = list(p.copy_to_index)[:p.length]
+                    targets = np.asarray([ idx for idx_list in copy_to_index for idx in idx_list ], dtype=np.intp)
+                    sources = np.repeat(np.arange(len(copy_to_index)), [ len(idx_list) for idx_list in copy_to_index ])
+                    self.steps.append((p.copy_to_path.split('.'), columns, targets, sources))
+            else:
+                self.steps.append((p.path.split('.'), columns, None, None))
+
+        self.n_var = offset
+
+    def __iter__(self):
+        return iter(self.parameters)
+
+    def __len__(self):
+        return len(self.parameters)
+
+    @property
+    def paths(self) -> list:
+        """ All simulation paths that are modified by the plan """
+        return [ '.'.join(keys) for keys, *_ in self.steps ]
+
+    @staticmethod
+    def resolve(root, keys):
+        """ Return the parent dict of the dataset at keys. Doesn't create missing keys. """
+        parent = root
+        for key in keys[:-1]:
+            if not isinstance(parent, dict) or key not in parent:
+                raise KeyError('.'.join(keys))
+            parent = parent[key]
+        return parent
+
+    def validate(self, root):
+        """ Check every path and index against a simulation template, raising ValueError on the first mismatch """
+        for keys, _, targets, _ in self.steps:
+            path = '.'.join(keys)
+            try:
+                parent = self.resolve(root, keys)
+            except KeyError:
+                raise ValueError(f"Parameter path {path} not found in simulation!")
+
+            if not isinstance(parent, dict) or keys[-1] not in parent:
+                raise ValueError(f"Parameter path {path} not found in simulation!")
+
+            if isinstance(parent[keys[-1]], dict):
+                raise ValueError(f"Parameter path {path} is a group, not a dataset!")
+
+            if targets is None:
+                continue
+
+            size = np.size(parent[keys[-1]])
+            if len(targets) and (targets.max() >= size or targets.min() < -size):
+                raise ValueError(f"Parameter index out of bounds for {path} with size {size}!")
+
+    def values(self, root, X) -> dict:
+        """
+        Return the new value of every modified dataset for every row of the
+        (n_individuals, n_var) matrix X, as {path: array(n_individuals, ...)}.
+        """
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        values = {}
+        for keys, columns, targets, sources in self.steps:
+            path = '.'.join(keys)
+            if targets is None:
+                values[path] = X[:, columns]
+            else:
+                if path not in values:
+                    parent = self.resolve(root, keys)
+                    base = np.asarray(parent[keys[-1]], dtype=float)
+                    values[path] = np.repeat(base[np.newaxis], len(X), axis=0)
+                values[path][:, targets] = X[:, columns][:, sources]
+        return values
+
+    def apply(self, root, x):
+        """ Write the parameter vector x into the simulation tree root """
+        for path, value in self.values(root, x).items():
+            keys = path.split('.')
+            parent = root
+            for key in keys[:-1]:
+                parent = parent[key]
+            parent[keys[-1]] = value[0]
@@ -3,6 +3,7 @@
 from pathlib import Path
 from chromoo.plotter import Plotter, Subplotter
 from chromoo.cadetSimulation import run_iter
+from chromoo.history import History
 import numpy as np
 import pandas as pd
 from scipy import stats
@@ -158,9 +159,18 @@ def convergence(populations, column, postdir=Path('post'), name='convergence'):
     # populations_best_score_ever_index = populations[args.mean].argmin()
     # print(populations.iloc[populations_best_score_ever_index])
 
-def load_dataframe_sort(filename, columns_to_mean, sort_by=None, rename_columns=None):
+def load_dataframe_sort(filename, columns_to_mean, sort_by=None, rename_columns=None, columns=None, generations=None):
+    """
+    Load a csv file, a History directory or a pickled DataFrame (old populations
+    files), and add mean scores. For histories, only the given columns
+    (with columns_to_mean) and generations are read.
+    """
     if Path(filename).suffix == '.csv':
         df = pd.read_csv(filename)
+    elif Path(filename).is_dir():
+        if columns is not None:
+            columns = list(dict.fromkeys(list(columns) + list(columns_to_mean)))
+        df = History(filename).read(columns, generations)
     else:
         df = pd.read_pickle(filename)
         df = df.apply(pd.to_numeric)
@@ -0,0 +1,89 @@
+"""
+Reference directions
+
+Reference directions for NSGA3/UNSGA3, cached on disk in cache_dir()/refdirs,
+keyed by method, number of objectives, number of directions and seed, so that
+the (slow, for many objectives) Riesz-energy optimization only runs once.
+
+Methods:
+    - energy: pymoo's Riesz s-energy directions (default)
+    - das-dennis: a max-min spread subset of Das-Dennis directions, fast even
+      for many objectives
+    - auto: energy up to `threshold` objectives, das-dennis above
+"""
+
+import os
+import tempfile
+from math import comb
+
+import numpy as np
+
+from chromoo.log import Logger
+from chromoo.utils import cache_dir
+
+def sampled_das_dennis(n_obj, n_points, seed=None, max_candidates=20000):
+    """
+    Greedy max-min subset of n_points Das-Dennis directions, starting from the
+    axes. The number of partitions is the smallest one that gives enough
+    candidates, topped up with random directions if even that is too many.
+    """
+    from pymoo.factory import get_reference_directions
+
+    n_partitions = 1
+    while comb(n_obj + n_partitions - 1, n_partitions) < n_points and comb(n_obj + n_partitions, n_partitions + 1) <= max_candidates:
+        n_partitions += 1
+
+    candidates = get_reference_directions("das-dennis", n_obj, n_partitions=n_partitions)
+
+    rng = np.random.default_rng(seed)
+    if len(candidates) < n_points:
+        candidates = np.vstack([candidates, rng.dirichlet(np.ones(n_obj), size=10 * n_points)])
+
+    # The axes (first in the selection order) keep the extreme points of the front covered
+    selected = [ i for i in np.argsort(-candidates.max(axis=1), kind='stable')[:min(n_obj, n_points)] ]
+    distance = np.min([ np.linalg.norm(candidates - candidates[i], axis=1) for i in selected ], axis=0)
+
+    while len(selected) < n_points:
+        i = int(np.argmax(distance))
+        selected.append(i)
+        distance = np.minimum(distance, np.linalg.norm(candidates - candidates[i], axis=1))
+
+    return candidates[selected]
+
+def compute_reference_directions(method, n_obj, n_points, seed):
+    if method == 'energy':
+        from pymoo.factory import get_reference_directions
+        return get_reference_directions("energy", n_obj, n_points, seed=seed)
+    elif method == 'das-dennis':
+        return sampled_das_dennis(n_obj, n_points, seed=seed)
+    else:
+        raise ValueError(f"Invalid reference direction method: {method}")
+
+def reference_directions(method, n_obj, n_points, seed=204, threshold=10, cache=True):
+    """ Return (cached) reference directions of shape (n_points, n_obj) """
+    if method == 'auto':
+        method = 'energy' if n_obj <= threshold else 'das-dennis'
+
+    filename = cache_dir() / 'refdirs' / f'{method}_{n_obj}_{n_points}_{seed}.npy'
+
+    if cache:
+        try:
+            ref_dirs = np.load(filename)
+            Logger().info(f"Loaded reference directions from {filename}")
+            return ref_dirs
+        except (OSError, ValueError):
+            pass
+
+    Logger().info(f"Computing {n_points} {method} reference directions for {n_obj} objectives.")
+    ref_dirs = compute_reference_directions(method, n_obj, n_points, seed)
+
+    if cache:
+        try:
+            filename.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=filename.parent, suffix='.npy', delete=False) as fp:
+                np.save(fp, ref_dirs)
+            os.replace(fp.name, filename)
+        except OSError as err:
+            Logger().warn(f"Could not cache reference directions: {err}")
+
+    return ref_dirs
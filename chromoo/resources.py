@@ -0,0 +1,55 @@
+"""
+Resources
+
+Split of the cores between worker processes and CADET threads.
+
+Without `adaptive` (the default), the simulations keep the threads of the
+template. With it, every task gets a single thread as long as there are at
+least as many tasks to start as idle workers, since processes parallelize
+better than CADET's threads. With fewer (small populations, or the last
+tasks of a generation), the cores that would stay idle go to the tasks being
+started: each gets
+
+    threads = (cores - threads of the running tasks) // tasks starting now
+
+(at least 1, at most `max_threads`), written to input.solver.nthreads of
+its simulation file. A running simulation keeps its threads, so the cores
+freed as a generation drains go to the simulations started after.
+
+With `pin`, every simulation also runs on its own CPUs, as many as its
+threads where possible (see affinity.py).
+"""
+
+import os
+
+def available_cores() -> int:
+    """ Number of cores this process may run on """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+class ResourceAllocator:
+
+    def __init__(self, adaptive=False, cores=0, max_threads=0, pin=False):
+        self.adaptive = adaptive
+        self.cores = cores or available_cores()
+        self.max_threads = max_threads or self.cores
+        self.pin = pin
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault('pin', False)
+
+    def threads(self, starting, idle, in_use):
+        """
+        CADET threads for each of the tasks starting now, given the idle
+        workers and the threads in use by the running tasks. None to keep the
+        threads of the simulation.
+        """
+        if not self.adaptive:
+            return None
+        if starting >= idle:
+            return 1
+        free = self.cores - in_use
+        return min(max(free // max(starting, 1), 1), self.max_threads)
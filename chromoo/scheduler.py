@@ -0,0 +1,97 @@
+"""
+Scheduler
+
+Dispatch order and chunking of the tasks of a batch (see WorkerPool.run()).
+
+Dispatching in array order leaves long idle tails whenever expensive
+simulations land last. Instead, the cadet-cli time of every individual is
+predicted from its parameters in the optimizer's (transformed) space, and
+tasks are dispatched longest-expected-first.
+
+The RuntimePredictor is a ridge regression of log(cadet-cli time) on
+[1, x, x^2], refit on the last `window` successful evaluations of every
+simulation variant (fidelity level) whenever new ones were observed. Until
+`min_samples` were observed, tasks keep their order and aren't chunked.
+
+With `chunking`, the shorter tasks are bundled (guided self-scheduling): the
+next chunk takes tasks in dispatch order while their predicted time stays
+below the predicted remaining work / (`chunk_factor` x nproc), at least one
+task and at most `max_chunk`. Long tasks thus go out one by one, and the tail
+in shrinking chunks, which saves dispatch round trips for short simulations.
+"""
+
+from collections import deque
+
+import numpy as np
+
+class RuntimePredictor:
+    """ Ridge regression of log runtimes on [1, x, x^2], per variant """
+
+    def __init__(self, min_samples=10, window=2000, ridge=1e-3):
+        self.min_samples = min_samples
+        self.window = window
+        self.ridge = ridge
+        self.samples = {}
+        self.coefs = {}
+
+    @staticmethod
+    def features(X):
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        return np.hstack([ np.ones((len(X), 1)), X, X**2 ])
+
+    def observe(self, variant, x, seconds):
+        """ Record the cadet-cli time of a successful evaluation """
+        if seconds > 0:
+            self.samples.setdefault(variant, deque(maxlen=self.window)).append((np.asarray(x, dtype=float), seconds))
+            self.coefs.pop(variant, None)
+
+    def fit(self, variant=None):
+        """ Coefficients for the variant, None if there are too few samples """
+        samples = self.samples.get(variant, ())
+        if len(samples) < max(self.min_samples, 1):
+            return None
+        if variant not in self.coefs:
+            A = self.features([ x for x, _ in samples ])
+            y = np.log([ s for _, s in samples ])
+            penalty = self.ridge * len(A) * np.eye(A.shape[1])
+            penalty[0, 0] = 0.0
+            self.coefs[variant] = np.linalg.solve(A.T @ A + penalty, A.T @ y)
+        return self.coefs[variant]
+
+    def predict(self, X, variant=None):
+        """ Expected cadet-cli times for the rows of X, None if there are too few samples """
+        coef = self.fit(variant)
+        if coef is None:
+            return None
+        return np.exp(self.features(X) @ coef)
+
+class Scheduler:
+
+    def __init__(self, order='longest_first', chunking=False, chunk_factor=2.0, max_chunk=8, min_samples=10, window=2000):
+        self.order = order
+        self.chunking = chunking
+        self.chunk_factor = chunk_factor
+        self.max_chunk = max_chunk
+        self.predictor = RuntimePredictor(min_samples=min_samples, window=window)
+
+    def plan(self, indices, features, variant=None):
+        """ Return (indices in dispatch order, predicted time per index), no predictions until the predictor is trained """
+        predicted = self.predictor.predict(features, variant) if len(indices) else None
+        if predicted is None:
+            return list(indices), {}
+        expected = dict(zip(indices, predicted))
+        if self.order == 'longest_first':
+            # stable, so that equal predictions keep their order
+            indices = [ indices[i] for i in np.argsort(-predicted, kind='stable') ]
+        return list(indices), expected
+
+    def chunk(self, pending:deque, expected, nproc) -> int:
+        """ Number of tasks from the front of pending to dispatch together, 1 without predictions """
+        if not self.chunking or not pending or not expected:
+            return 1
+        target = sum(expected[index] for index in pending) / (self.chunk_factor * nproc)
+        size, work = 1, expected[pending[0]]
+        while size < min(len(pending), self.max_chunk) and work + expected[pending[size]] <= target:
+            work += expected[pending[size]]
+            size += 1
+        return size
@@ -1,22 +1,25 @@
 import numpy as np
 
-def sse(y0, y):
+# All scores reduce along the time axis, which is axis 0 for a single
+# simulation, or axis 1 for a stacked population of simulations (pop, nts, ...)
+
+def sse(y0, y, axis=0):
     """
     Sum of squares of errors
     """
-    return np.sum((y0 - y)**2, axis=0)
+    return np.sum((y0 - y)**2, axis=axis)
 
-def rmse(y0, y): 
-    return np.sqrt(np.average((y0 - y)**2, axis=0))
+def rmse(y0, y, axis=0): 
+    return np.sqrt(np.average((y0 - y)**2, axis=axis))
 
-def nrmse(y0, y): 
-    return np.sqrt(np.average((y0 - y)**2, axis=0)) / (np.max(y0, axis=0) - np.min(y0, axis=0)) 
+def nrmse(y0, y, axis=0): 
+    return np.sqrt(np.average((y0 - y)**2, axis=axis)) / (np.max(y0, axis=axis) - np.min(y0, axis=axis)) 
 
-def logsse(y0, y): 
-    return np.log10(np.sum((y0 - y)**2, axis=0))
+def logsse(y0, y, axis=0): 
+    return np.log10(np.sum((y0 - y)**2, axis=axis))
 
-def logrmse(y0, y):
-    return np.log10(np.sqrt(np.average((y0 - y)**2, axis=0)))
+def logrmse(y0, y, axis=0):
+    return np.log10(np.sqrt(np.average((y0 - y)**2, axis=axis)))
 
 scores_dict = {
     'sse': sse,
@@ -26,6 +29,5 @@ scores_dict = {
     'logsse': logsse
 }
 
-def evaluate_scores(y0, y, score_type): 
-    return scores_dict[score_type](y0, y)
-
+def evaluate_scores(y0, y, score_type, axis=0): 
+    return scores_dict[score_type](y0, y, axis=axis)
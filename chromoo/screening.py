@@ -0,0 +1,213 @@
+"""
+Screening
+
+Sobol sensitivity screening of the configured parameters (`chromoo screen`).
+
+A Saltelli/Sobol design is sampled in the transformed [0,1] parameter space
+and evaluated on the worker pool. Results are streamed to a CSV file as they
+complete, so an interrupted screening resumes where it stopped. First and
+total order indices are computed per objective, and parameters whose total
+order index stays below a threshold for all objectives are fixed in a reduced
+config (under `fixed_parameters`).
+"""
+
+import csv
+import re
+import shutil
+from pathlib import Path
+
+import numpy as np
+from ruamel.yaml import YAML
+
+from SALib.sample import sobol as sobol_sample
+from SALib.analyze import sobol as sobol_analyze
+
+from chromoo.failurePolicy import FailurePolicy
+from chromoo.log import Logger
+from chromoo.parameter import ParameterPlan
+from chromoo.resources import ResourceAllocator
+from chromoo.scheduler import Scheduler
+from chromoo.timeBudget import TimeBudget
+from chromoo.transforms import transform_array
+from chromoo.workerPool import WorkerPool
+
+def guess_indent(text) -> tuple:
+    """ The (mapping, sequence, offset) indentation of a yaml document for YAML.indent(), ruamel's defaults where it can't tell """
+    mapping, sequence, offset = None, None, None
+    parent = None
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            continue
+        indent = len(line) - len(line.lstrip(' '))
+        if parent is not None and indent > parent:
+            if stripped.startswith('- ') and sequence is None:
+                offset = indent - parent
+                sequence = indent + len(stripped) - len(stripped[1:].lstrip(' ')) - parent
+            elif not stripped.startswith('- ') and mapping is None:
+                mapping = indent - parent
+        # Indentation of the last key without a value on its line
+        parent = indent if re.fullmatch(r'[^\s#-][^#]*:\s*(#.*)?', stripped) else None
+    return mapping or 2, sequence or 2, offset or 0
+
+class SobolScreening:
+
+    def __init__(self, config, n_samples=64, threshold=0.05, results='screening.csv', seed=1):
+        self.config = config
+        self.n_samples = n_samples
+        self.threshold = threshold
+        self.results = Path(results)
+        self.seed = seed
+
+        self.logger = Logger()
+
+        self.problem = {
+            'num_vars': config.n_par,
+            'names': config.parameter_names,
+            'bounds': [[0.0, 1.0]] * config.n_par,
+        }
+
+    def sample(self):
+        """ Saltelli/Sobol design in the transformed [0,1] space, without second order terms """
+        return sobol_sample.sample(self.problem, self.n_samples, calc_second_order=False, seed=self.seed)
+
+    def denormalize(self, X):
+        """ Map [0,1] samples to parameter values, honoring the configured parameter transform """
+        mins, maxs = np.array(self.config.par_min_values), np.array(self.config.par_max_values)
+        if self.config.parameter_transform == 'none':
+            return X * (maxs - mins) + mins
+        return transform_array(X, mins, maxs, self.config.parameter_transform, mode='inverse')
+
+    def load_results(self, n_samples) -> dict:
+        """ Read previously streamed results as {index: F}, ignoring files from a different design """
+        results = {}
+        if not self.results.exists():
+            return results
+
+        with open(self.results) as fp:
+            reader = csv.reader(fp)
+            header = next(reader, None)
+            if header != self.header(n_samples):
+                self.logger.warn(f"{self.results} belongs to a different screening design, starting over.")
+                return {}
+            for row in reader:
+                if len(row) == 1 + self.config.n_obj:
+                    results[int(row[0])] = np.array(row[1:], dtype=float)
+
+        return results
+
+    def header(self, n_samples):
+        return [ f'index/{n_samples}/{self.seed}' ] + self.config.objective_names
+
+    def run(self) -> np.ndarray:
+        """ Evaluate the design, resuming from previously streamed results. Returns Y of shape (n_samples, n_obj) """
+        X = self.sample()
+        results = self.load_results(len(X))
+        missing = [ i for i in range(len(X)) if i not in results ]
+
+        self.logger.info(f"Screening {self.config.n_par} parameters with {len(X)} samples: {len(results)} done, {len(missing)} to go.")
+
+        if missing:
+            pool = WorkerPool(
+                    self.config.nproc,
+                    self.config.simulation,
+                    ParameterPlan(self.config.parameters),
+                    self.config.objectives,
+                    tempdir=Path(self.config.temp_dir),
+                    store=self.config.store_temp,
+                    patch_template=self.config.patch_template,
+                    failures=FailurePolicy(**self.config.failures),
+                    budget=TimeBudget(**self.config.timeout),
+                    scheduler=Scheduler(**self.config.scheduler),
+                    resources=ResourceAllocator(**self.config.resources))
+            Path(self.config.temp_dir).mkdir(parents=True, exist_ok=True)
+
+            new_file = not results
+            try:
+                with pool, open(self.results, 'w' if new_file else 'a', newline='') as fp:
+                    writer = csv.writer(fp)
+                    if new_file:
+                        writer.writerow(self.header(len(X)))
+                    for count, (index, F) in enumerate(pool.imap(self.denormalize(X[missing]), indices=missing, features=X[missing]), start=1):
+                        writer.writerow([index, *F])
+                        fp.flush()
+                        results[index] = F
+                        if count % max(1, len(missing) // 10) == 0:
+                            self.logger.info(f"Screening: {count}/{len(missing)} evaluations done.")
+            finally:
+                # The pool is closed, nothing writes to the temp dir anymore
+                if not self.config.store_temp:
+                    shutil.rmtree(self.config.temp_dir, ignore_errors=True)
+
+        return np.array([ results[i] for i in range(len(X)) ])
+
+    def analyze(self, Y) -> dict:
+        """ First and total order indices for every objective, as {objective: SALib result} """
+        failed = FailurePolicy.failed(Y)
+        if np.any(failed):
+            self.logger.warn(f"{np.sum(failed)} of {len(Y)} screening evaluations failed, using the median score for them.")
+            Y = np.where(failed[:, np.newaxis], np.nanmedian(Y, axis=0), Y)
+        return {
+            name: sobol_analyze.analyze(self.problem, Y[:, i], calc_second_order=False, seed=self.seed)
+            for i, name in enumerate(self.config.objective_names)
+        }
+
+    def insensitive(self, indices) -> list:
+        """ Parameters whose total order index is below the threshold for every component and objective """
+        # NaN indices (e.g. from failed evaluations) never count as insensitive
+        ST = np.array([ result['ST'] for result in indices.values() ], dtype=float)
+        below = np.all(~np.isnan(ST) & (ST < self.threshold), axis=0)
+
+        fixed = []
+        offset = 0
+        for p in self.config.parameters:
+            if np.all(below[offset:offset + p.length]):
+                fixed.append(p)
+            offset += p.length
+        return fixed
+
+    def nominal(self, parameter):
+        """ Nominal value of a parameter: the template value if within bounds, otherwise the middle of the (transformed) range """
+        offset = sum(p.length for p in self.config.parameters[:self.config.parameters.index(parameter)])
+        values = self.denormalize(np.full((1, self.config.n_par), 0.5))[0][offset:offset + parameter.length]
+
+        current = np.asarray(self.config.simulation.get(parameter.path), dtype=float).ravel()
+        if parameter.type == 'element':
+            current = current[parameter.index]
+
+        if current.size == parameter.length and np.all(current >= np.array(parameter.min_value)) and np.all(current <= np.array(parameter.max_value)):
+            values = current
+
+        return [ float(v) for v in values ]
+
+    def write_indices(self, indices, filename='screening_indices.csv'):
+        with open(filename, 'w', newline='') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(['objective', 'parameter', 'S1', 'S1_conf', 'ST', 'ST_conf'])
+            for objective, result in indices.items():
+                for i, name in enumerate(self.config.parameter_names):
+                    writer.writerow([objective, name, result['S1'][i], result['S1_conf'][i], result['ST'][i], result['ST_conf'][i]])
+
+    def write_reduced_config(self, config_file, fixed, filename):
+        """ Copy config_file, moving the fixed parameters to fixed_parameters at their nominal values """
+        text = Path(config_file).read_text()
+        yaml = YAML()
+        # Keep the indentation of the user's file
+        mapping, sequence, offset = guess_indent(text)
+        yaml.indent(mapping=mapping, sequence=sequence, offset=offset)
+        config = yaml.load(text)
+
+        names = [ p.name for p in fixed ]
+        entries = [ entry for entry in config['parameters'] if entry['name'] in names ]
+
+        config['parameters'] = [ entry for entry in config['parameters'] if entry['name'] not in names ]
+        config.setdefault('fixed_parameters', [])
+
+        for entry, p in zip(entries, fixed):
+            values = self.nominal(p)
+            value = values[0] if len(values) == 1 and not isinstance(entry['min_value'], list) else values
+            entry['min_value'] = value
+            entry['max_value'] = value
+            config['fixed_parameters'].append(entry)
+
+        yaml.dump(config, Path(filename))
@@ -0,0 +1,119 @@
+"""
+SharedData
+
+Read-only data published once by the parent process in a single
+multiprocessing.shared_memory block, and attached zero-copy by the workers.
+
+Used by the WorkerPool for the objective reference arrays (x0, y0) and the
+pickled simulation template, so that neither travels through the task pipes.
+"""
+
+import copy
+import pickle
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+def attach_shm(name:str) -> shared_memory.SharedMemory:
+    """
+    Attach to an existing shared memory block without registering it with
+    this process' resource tracker, which would otherwise unlink the block
+    when a (spawned) worker exits. Only the owner unlinks it.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python >= 3.13
+    except TypeError:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+class SharedArrays:
+    """
+    A dict of numpy arrays stored back to back in one shared memory block.
+    Only the (small) layout is pickled, see attach().
+    """
+    ALIGN = 64
+
+    def __init__(self, arrays:dict):
+        self.layout = {}
+        offset = 0
+        for key, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            self.layout[key] = (offset, array.shape, array.dtype.str)
+            offset += -(-array.nbytes // self.ALIGN) * self.ALIGN
+
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        self.name = self.shm.name
+
+        for key, array in arrays.items():
+            self._view(self.shm, key)[...] = array
+
+    def _view(self, shm, key) -> np.ndarray:
+        offset, shape, dtype = self.layout[key]
+        return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+
+    def attach(self) -> dict:
+        """ Return read-only views of the arrays. Call in the worker process. """
+        self.shm = attach_shm(self.name)
+        arrays = {}
+        for key in self.layout:
+            view = self._view(self.shm, key)
+            view.flags.writeable = False
+            arrays[key] = view
+        return arrays
+
+    def close(self):
+        """ Release and remove the shared memory block. Call in the owner process. """
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['shm'] = None
+        return state
+
+class SharedWorkerData:
+    """
+    Simulation template (and variants of it) and objectives for the evaluation workers.
+
+    The objectives are sent without their reference arrays, and the
+    simulation only as a pickled blob in shared memory. Workers rebuild both
+    with load().
+    """
+    def __init__(self, sim, objectives, variants=None):
+        arrays = { 'sim': np.frombuffer(pickle.dumps(sim), dtype=np.uint8) }
+        self.variant_keys = list(variants or {})
+        for key in self.variant_keys:
+            arrays[f'variant.{key}'] = np.frombuffer(pickle.dumps(variants[key]), dtype=np.uint8)
+        for index, obj in enumerate(objectives):
+            arrays[f'{index}.x0'] = obj.x0
+            arrays[f'{index}.y0'] = obj.y0
+        self.arrays = SharedArrays(arrays)
+
+        # Objectives are frozen dataclasses; strip the reference data without re-reading it
+        self.objectives = []
+        for obj in objectives:
+            stripped = copy.copy(obj)
+            object.__setattr__(stripped, 'x0', None)
+            object.__setattr__(stripped, 'y0', None)
+            self.objectives.append(stripped)
+
+    def load(self):
+        """ Return (sim, objectives, variants) in the worker process, with reference arrays as shared views """
+        arrays = self.arrays.attach()
+        sim = pickle.loads(arrays['sim'])
+        variants = { key: pickle.loads(arrays[f'variant.{key}']) for key in self.variant_keys }
+
+        for index, obj in enumerate(self.objectives):
+            object.__setattr__(obj, 'x0', arrays[f'{index}.x0'])
+            object.__setattr__(obj, 'y0', arrays[f'{index}.y0'])
+
+        return sim, self.objectives, variants
+
+    def close(self):
+        self.arrays.close()
@@ -0,0 +1,175 @@
+"""
+SteadyStateDriver
+
+Asynchronous, steady-state execution of a pymoo genetic algorithm (NSGA3/UNSGA3).
+
+Instead of evaluating a full generation with a barrier at the end, a new
+candidate is generated and dispatched as soon as a worker becomes free.
+Completed evaluations are collected into small batches (algorithm.n_offsprings),
+and survival is run on the current population plus each completed batch.
+New candidates are unique among the population and the candidates that are
+still being evaluated or waiting for their batch.
+
+Every pop_size completed evaluations count as one generation (n_gen): the
+callback, termination criteria and on_advance (checkpoints) only run at
+these steps, so n_max_gen means the same as in generational mode.
+"""
+
+import queue
+
+import numpy as np
+
+from pymoo.core.population import Population
+from pymoo.core.evaluator import set_cv
+
+from chromoo.log import Logger
+
+class SteadyStateDriver:
+
+    def __init__(self, algorithm):
+        self.algorithm = algorithm
+        self.problem = algorithm.problem
+        self.logger = Logger()
+
+        self._completed = queue.Queue()
+        self._pending = {}
+        self._next_id = 0
+
+        # Completed, but not yet told to the algorithm
+        self._done_X = []
+        self._done_F = []
+
+        # Evaluations told since the last generation
+        self._since_generation = 0
+
+    @property
+    def batch_size(self):
+        return max(1, self.algorithm.n_offsprings or 1)
+
+    @property
+    def generation_size(self):
+        return max(1, self.algorithm.pop_size or 1)
+
+    def ask(self):
+        """ Generate a single new candidate from the current population (in the optimizer's space) """
+        algo = self.algorithm
+
+        # Mating only avoids duplicates of the population, not of the candidates in flight
+        waiting = list(self._pending.values()) + self._done_X
+        waiting = Population.new("X", np.array(waiting)) if waiting else None
+
+        for _ in range(10):
+            off = algo.mating.do(self.problem, algo.pop, 1, algorithm=algo)
+            if len(off) > 0 and waiting is not None:
+                off = algo.eliminate_duplicates.do(off, waiting)
+            if len(off) > 0:
+                return off[0].X
+        return None
+
+    def dispatch(self, X):
+        """ Submit a candidate to the worker pool """
+        task_id = self._next_id
+        self._next_id += 1
+        self._pending[task_id] = X
+
+        x = self.problem.denormalize(X)
+
+        memo = self.problem.memo
+        if memo is not None:
+            F = memo.get(x)
+            if F is not None:
+                self._completed.put((task_id, F, None))
+                return
+
+        self.problem.pool.submit(
+                x,
+                index=task_id,
+                callback=lambda result: self._completed.put((*result, None)),
+                error_callback=lambda err, task_id=task_id: self._completed.put((task_id, None, err)))
+
+    def tell(self, Xs, Fs) -> bool:
+        """
+        Run survival on the current population merged with a batch of completed
+        evaluations. Returns True if this completed a generation.
+        """
+        algo = self.algorithm
+
+        F, G = self.problem.penalize(np.array(Fs, dtype=float))
+        off = Population.new("X", np.array(Xs))
+        off.set("F", F)
+        if G is not None:
+            off.set("G", G)
+        off.set("n_gen", algo.n_gen)
+        set_cv(off)
+        for ind in off:
+            ind.evaluated = {"F", "G", "CV", "feasible"}
+
+        algo.evaluator.n_eval += len(off)
+        self._since_generation += len(off)
+
+        if self._since_generation >= self.generation_size:
+            self._since_generation = 0
+            algo.advance(infills=off)
+            return True
+
+        # Survival only, without a new generation, callback or termination check
+        algo.off = off
+        algo._advance(infills=off)
+        algo._set_optimum()
+        return False
+
+    def fill(self):
+        """ Keep every worker busy with a fresh candidate """
+        while len(self._pending) < self.problem.pool.nproc:
+            X = self.ask()
+            if X is None:
+                self.logger.warn("Mating could not produce a new unique candidate!")
+                break
+            self.dispatch(X)
+
+    def run(self, on_advance=None):
+        """
+        Run the algorithm until termination.
+        on_advance(algorithm) is called after every generation (e.g. to save a checkpoint).
+        """
+        algo = self.algorithm
+
+        # The initial population is evaluated as a regular (synchronous) generation
+        if not algo.is_initialized:
+            algo.next()
+            if on_advance:
+                on_advance(algo)
+
+        try:
+            while algo.has_next():
+                self.fill()
+
+                if not self._pending:
+                    algo.termination.force_termination = True
+                    break
+
+                task_id, F, err = self._completed.get()
+                X = self._pending.pop(task_id)
+
+                if err is not None:
+                    raise err
+
+                if self.problem.memo is not None and not self.problem.failures.failed(F)[0]:
+                    self.problem.memo.put(self.problem.denormalize(X), F)
+
+                self._done_X.append(X)
+                self._done_F.append(F)
+
+                if len(self._done_X) >= self.batch_size:
+                    generation = self.tell(self._done_X, self._done_F)
+                    self._done_X, self._done_F = [], []
+                    if generation:
+                        self.problem.log_memo()
+                        if on_advance:
+                            on_advance(algo)
+        finally:
+            # Discard evaluations that are still in flight when we're done
+            if self._pending:
+                self.logger.note(f"Discarding {len(self._pending)} in-flight evaluations.")
+                self.problem.pool.terminate()
+                self._pending.clear()
@@ -0,0 +1,150 @@
+"""
+Surrogate
+
+Optional surrogate-assisted pre-screening of offspring (generational mode).
+
+A Gaussian process per objective is fit on all true evaluations so far, in the
+normalized [0,1] parameter space. For every new batch of offspring, only the
+most promising (non-dominated w.r.t. the lower confidence bound) and the most
+uncertain individuals are simulated. The others get predicted scores and are
+tagged as 'predicted' in the population.
+"""
+
+import time
+from math import ceil
+
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve, LinAlgError
+
+from pymoo.util.nds.non_dominated_sorting import NonDominatedSorting
+
+from chromoo.log import Logger
+
+def sqdist(A, B):
+    """ Pairwise squared euclidean distances between the rows of A and B """
+    return np.maximum(np.sum(A**2, axis=1)[:, np.newaxis] + np.sum(B**2, axis=1)[np.newaxis] - 2 * A @ B.T, 0)
+
+class GaussianProcess:
+    """
+    GP regression with an RBF kernel for every column of Y, sharing the kernel
+    (length scale from the median heuristic). Targets are standardized, and
+    fit in log10 space if they are all positive (as most scores are).
+    """
+    def __init__(self, noise=1e-6):
+        self.noise = noise
+
+    def fit(self, X, Y):
+        self.X = X
+        self.log = bool(np.all(Y > 0))
+        Y = np.log10(Y) if self.log else Y
+
+        self.mean = Y.mean(axis=0)
+        self.std = Y.std(axis=0)
+        self.std[self.std == 0] = 1.0
+        Ys = (Y - self.mean) / self.std
+
+        d2 = sqdist(X, X)
+        self.length_scale = np.sqrt(np.median(d2[d2 > 0]) / 2) if np.any(d2 > 0) else 1.0
+
+        K = np.exp(-d2 / (2 * self.length_scale**2))
+        noise = self.noise
+        while True:
+            try:
+                self.factor = cho_factor(K + noise * np.eye(len(X)), lower=True)
+                break
+            except LinAlgError:
+                noise *= 10
+
+        self.alpha = cho_solve(self.factor, Ys)
+        return self
+
+    def predict(self, X):
+        """ Return mean and standard deviation of the prediction, both of shape (len(X), n_obj) """
+        Ks = np.exp(-sqdist(X, self.X) / (2 * self.length_scale**2))
+        mean = Ks @ self.alpha
+        var = np.maximum(1.0 - np.sum(Ks.T * cho_solve(self.factor, Ks.T), axis=0), 0)
+        std = np.sqrt(var)[:, np.newaxis] * np.ones_like(mean)
+
+        mean = mean * self.std + self.mean
+        std = std * self.std
+
+        if self.log:
+            # Delta method for the spread in linear space
+            mean = np.power(10, mean)
+            std = mean * np.log(10) * std
+
+        return mean, std
+
+class SurrogateScreen:
+    """
+    Decides which offspring to simulate, and predicts scores for the rest.
+        - fraction: fraction of every batch that is simulated (top-k by LCB rank)
+        - n_uncertain: additionally simulate the most uncertain individuals
+        - min_samples: simulate everything until this many true evaluations are known
+        - max_samples: fit on at most this many (most recent) evaluations
+        - kappa: weight of the standard deviation in the lower confidence bound
+    """
+    def __init__(self, xl, xu, fraction=0.5, n_uncertain=1, min_samples=20, max_samples=500, kappa=1.0):
+        self.xl = np.asarray(xl, dtype=float)
+        self.xu = np.asarray(xu, dtype=float)
+        self.fraction = fraction
+        self.n_uncertain = n_uncertain
+        self.min_samples = min_samples
+        self.max_samples = max_samples
+        self.kappa = kappa
+
+        self.X = np.empty((0, len(self.xl)))
+        self.F = None
+
+        self.model = None
+        self.fit_time = 0.0
+
+    def normalize(self, X):
+        return (np.asarray(X, dtype=float) - self.xl) / (self.xu - self.xl)
+
+    def screen(self, X):
+        """
+        Return (simulate, F_predicted): a boolean mask of the individuals to
+        simulate, and predicted scores for all individuals (None if untrained)
+        """
+        if len(self.X) < self.min_samples:
+            return np.ones(len(X), dtype=bool), None
+
+        start = time.perf_counter()
+        self.model = GaussianProcess().fit(self.X[-self.max_samples:], self.F[-self.max_samples:])
+        self.fit_time = time.perf_counter() - start
+
+        mean, std = self.model.predict(self.normalize(X))
+
+        # Most promising first: by non-dominated rank of the lower confidence bound, then by uncertainty
+        rank = np.empty(len(X), dtype=int)
+        for i, front in enumerate(NonDominatedSorting().do(mean - self.kappa * std)):
+            rank[front] = i
+        order = np.lexsort((-std.mean(axis=1), rank))
+
+        simulate = np.zeros(len(X), dtype=bool)
+        simulate[order[:ceil(self.fraction * len(X))]] = True
+
+        uncertain = [ i for i in np.argsort(-std.mean(axis=1)) if not simulate[i] ][:self.n_uncertain]
+        simulate[uncertain] = True
+
+        return simulate, mean
+
+    def reset(self):
+        """ Forget all training data, e.g. when the scores change meaning (fidelity level) """
+        self.X = np.empty((0, len(self.xl)))
+        self.F = None
+
+    def update(self, X, F):
+        """ Add true evaluations to the training data """
+        F = np.atleast_2d(np.asarray(F, dtype=float))
+        self.X = np.vstack([self.X, self.normalize(X)])
+        self.F = F if self.F is None else np.vstack([self.F, F])
+
+    def log(self, simulate, F_true, F_predicted):
+        """ Log the simulated fraction, the surrogate error on the simulated individuals, and the fitting time """
+        message = f"Surrogate: simulated {np.sum(simulate)}/{len(simulate)} ({np.mean(simulate):.0%})"
+        if F_predicted is not None:
+            error = np.median(np.abs(F_predicted[simulate] - F_true) / np.maximum(np.abs(F_true), 1e-300))
+            message += f", median relative error {error:.3g}, fit time {self.fit_time:.3f} s"
+        Logger().info(message + ".")
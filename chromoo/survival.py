@@ -0,0 +1,197 @@
+"""
+Survival
+
+Reference direction survival (NSGA3/UNSGA3) for many objectives.
+
+pymoo's survival sorts with a pure python fast non-dominated sort, computes
+perpendicular distances through a (pop, ref_dirs, n_obj) tensor and runs the
+niching loop one survivor at a time. FastReferenceDirectionSurvival does the
+same selection with:
+    - a vectorized dominance matrix, peeled front by front
+    - niche association through projections, (pop, ref_dirs) memory only
+    - niching as one sort by niche level (niche count + position in niche)
+
+Both survivals time themselves (see TimedSurvival), so the time per
+generation spent in survival can be compared to the evaluation time, and
+leave individuals with surrogate-predicted scores out of the normalization
+(see MaskedNormalization), so that optimistic predictions can't move the
+ideal, worst or extreme points.
+"""
+
+import time
+
+import numpy as np
+
+from pymoo.algorithms.moo.nsga3 import ReferenceDirectionSurvival, HyperplaneNormalization, calc_niche_count
+from pymoo.util.misc import intersect
+
+def dominance_matrix(F):
+    """ D[i,j] is True if F[i] dominates F[j]. One (n, n) pass per objective, without a (n, n, n_obj) temporary. """
+    n = len(F)
+    no_worse = np.ones((n, n), dtype=bool)
+    better = np.zeros((n, n), dtype=bool)
+    for column in F.T:
+        a, b = column[:, np.newaxis], column[np.newaxis]
+        no_worse &= a <= b
+        better |= a < b
+    return no_worse & better
+
+def non_dominated_fronts(F, n_stop_if_ranked=None):
+    """ Return (fronts, rank) like pymoo's NonDominatedSorting().do(F, return_rank=True, n_stop_if_ranked=...) """
+    n = len(F)
+    n_stop_if_ranked = n if n_stop_if_ranked is None else n_stop_if_ranked
+
+    D = dominance_matrix(np.asarray(F, dtype=float))
+    n_dominating = D.sum(axis=0)
+    rank = np.full(n, int(1e16), dtype=int)
+
+    fronts = []
+    n_ranked = 0
+    remaining = np.ones(n, dtype=bool)
+    while n_ranked < min(n, n_stop_if_ranked):
+        front = np.flatnonzero(remaining & (n_dominating == 0))
+        fronts.append(front)
+        rank[front] = len(fronts) - 1
+        remaining[front] = False
+        n_dominating -= D[front].sum(axis=0)
+        n_ranked += len(front)
+
+    return fronts, rank
+
+def associate_to_niches(F, ref_dirs, ideal_point, nadir_point):
+    """ Like pymoo's associate_to_niches, via the projections on the (normalized) reference directions """
+    denom = nadir_point - ideal_point
+    denom[denom == 0] = 1e-12
+
+    N = (F - ideal_point) / denom
+    U = ref_dirs / np.linalg.norm(ref_dirs, axis=1)[:, np.newaxis]
+
+    projection = N @ U.T
+    dist_matrix = np.sqrt(np.maximum(np.sum(N**2, axis=1)[:, np.newaxis] - projection**2, 0))
+
+    niche_of_individuals = np.argmin(dist_matrix, axis=1)
+    dist_to_niche = dist_matrix[np.arange(len(F)), niche_of_individuals]
+
+    return niche_of_individuals, dist_to_niche, dist_matrix
+
+def niching(n_remaining, niche_count, niche_of_individuals, dist_to_niche):
+    """
+    Select n_remaining individuals like pymoo's niching(). That loop picks one
+    individual per least crowded niche per round, so the k-th pick from a niche
+    happens at level niche_count + k: the closest individual first for empty
+    niches, random ones otherwise. Ties between niches are broken randomly.
+    """
+    n = len(niche_of_individuals)
+
+    key = np.random.random(n)
+    by_distance = np.lexsort((np.random.random(n), dist_to_niche, niche_of_individuals))
+    first = by_distance[np.r_[True, np.diff(niche_of_individuals[by_distance]) != 0]]
+    key[first[niche_count[niche_of_individuals[first]] == 0]] = -1.0
+
+    order = np.lexsort((key, niche_of_individuals))
+    niches = niche_of_individuals[order]
+    starts = np.flatnonzero(np.r_[True, np.diff(niches) != 0])
+    position = np.arange(n) - np.repeat(starts, np.diff(np.r_[starts, n]))
+
+    level = np.empty(n, dtype=int)
+    level[order] = niche_count[niches] + position
+
+    return np.lexsort((np.random.random(n), level))[:n_remaining]
+
+class MaskedNormalization(HyperplaneNormalization):
+    """ Hyperplane normalization that is only updated from the rows of F in mask (set before every update) """
+
+    mask = None
+
+    def update(self, F, nds=None):
+        mask, self.mask = self.mask, None
+        if mask is None or mask.all() or (not mask.any() and self.nadir_point is None):
+            return super().update(F, nds)
+        if not mask.any():
+            # Nothing to learn from, keep the last normalization
+            return
+
+        nds = np.arange(len(F)) if nds is None else np.asarray(nds)
+        nds = (np.cumsum(mask) - 1)[nds[mask[nds]]]
+        super().update(F[mask], nds if len(nds) else None)
+
+def predicted(pop) -> np.ndarray:
+    """ Mask of the individuals with predicted scores, see ChromooProblem._evaluate() """
+    return np.array([ bool(np.any(ind.get('predicted'))) for ind in pop ], dtype=bool)
+
+class SimulatedNormalization:
+    """ Mixin that keeps predicted individuals out of the normalization """
+    def __init__(self, ref_dirs, *args, **kwargs):
+        super().__init__(ref_dirs, *args, **kwargs)
+        self.norm = MaskedNormalization(ref_dirs.shape[1])
+
+    def mask_predicted(self, pop):
+        """ Call before the normalization is updated from pop """
+        if isinstance(self.norm, MaskedNormalization):
+            self.norm.mask = ~predicted(pop)
+
+    def _do(self, problem, pop, n_survive, *args, **kwargs):
+        self.mask_predicted(pop)
+        return super()._do(problem, pop, n_survive, *args, **kwargs)
+
+class TimedSurvival:
+    """ Mixin that records the wall time of every survival call """
+    def do(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().do(*args, **kwargs)
+        finally:
+            if not hasattr(self, 'timings'):
+                self.timings = []
+            self.timings.append(time.perf_counter() - start)
+
+class TimedReferenceDirectionSurvival(TimedSurvival, SimulatedNormalization, ReferenceDirectionSurvival):
+    """ pymoo's reference direction survival """
+
+class FastReferenceDirectionSurvival(TimedSurvival, SimulatedNormalization, ReferenceDirectionSurvival):
+    """ Reference direction survival with vectorized sorting, association and niching """
+
+    def _do(self, problem, pop, n_survive, D=None, **kwargs):
+        F = pop.get("F")
+
+        fronts, rank = non_dominated_fronts(F, n_stop_if_ranked=n_survive)
+        non_dominated = fronts[0]
+
+        self.mask_predicted(pop)
+        self.norm.update(F, nds=non_dominated)
+        ideal, nadir = self.norm.ideal_point, self.norm.nadir_point
+
+        # Consider only the population up to the splitting front, renumbered in order
+        I = np.concatenate(fronts)
+        pop, rank, F = pop[I], rank[I], F[I]
+        sizes = [ len(front) for front in fronts ]
+        fronts = np.split(np.arange(len(I)), np.cumsum(sizes)[:-1])
+        last_front = fronts[-1]
+
+        niche_of_individuals, dist_to_niche, dist_matrix = associate_to_niches(F, self.ref_dirs, ideal, nadir)
+
+        pop.set('rank', rank,
+                'niche', niche_of_individuals,
+                'dist_to_niche', dist_to_niche)
+
+        closest = np.unique(dist_matrix[:, np.unique(niche_of_individuals)].argmin(axis=0))
+        self.opt = pop[intersect(fronts[0], closest)]
+
+        if len(pop) > n_survive:
+            if len(fronts) == 1:
+                until_last_front = np.array([], dtype=int)
+                niche_count = np.zeros(len(self.ref_dirs), dtype=int)
+            else:
+                until_last_front = np.concatenate(fronts[:-1])
+                niche_count = calc_niche_count(len(self.ref_dirs), niche_of_individuals[until_last_front])
+
+            S = niching(n_survive - len(until_last_front), niche_count, niche_of_individuals[last_front], dist_to_niche[last_front])
+
+            pop = pop[np.concatenate((until_last_front, last_front[S]))]
+
+        return pop
+
+def get_survival(name, ref_dirs):
+    if name == 'fast':
+        return FastReferenceDirectionSurvival(ref_dirs)
+    return TimedReferenceDirectionSurvival(ref_dirs)
@@ -0,0 +1,68 @@
+"""
+TimeBudget
+
+Wall-clock budgets for cadet-cli, so that a straggler (e.g. very low
+dispersion, extreme flowrates) can't stall a whole generation.
+
+The budget of a simulation is
+    - `seconds`, if set (> 0)
+    - `factor` x the `percentile` of the recently observed cadet-cli times
+      (the last `window` successful simulations), if `factor` is set (> 0)
+      and at least `min_samples` were observed
+    - the smaller of the two if both apply, None (no limit) if neither does
+
+Runtimes are kept per simulation variant (fidelity level), since these take
+very different times. A simulation that exceeds its budget is killed with its
+whole process group and handled by the FailurePolicy (retried with relaxed
+tolerances, then penalized).
+
+With `speculate`, once all tasks of a batch are dispatched and a worker is
+idle, a simulation that has been running for longer than `speculate_factor` x
+the percentile runtime gets a duplicate with relaxed tolerances (the first
+retry of the FailurePolicy) on the idle worker. Whichever finishes first is
+used, the other result is discarded.
+"""
+
+from collections import deque
+
+import numpy as np
+
+class TimeBudget:
+
+    def __init__(self, seconds=0.0, factor=0.0, percentile=95.0, min_samples=10, window=200, speculate=False, speculate_factor=1.5):
+        self.seconds = seconds
+        self.factor = factor
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self.speculate = speculate
+        self.speculate_factor = speculate_factor
+        self.runtimes = {}
+
+    def observe(self, variant, seconds):
+        """ Record the cadet-cli time of a successful simulation """
+        self.runtimes.setdefault(variant, deque(maxlen=self.window)).append(seconds)
+
+    def expected(self, variant=None):
+        """ The percentile of the observed runtimes, None if there are too few """
+        runtimes = self.runtimes.get(variant, ())
+        if len(runtimes) < max(self.min_samples, 1):
+            return None
+        return float(np.percentile(runtimes, self.percentile))
+
+    def budget(self, variant=None):
+        """ Time budget in seconds for a simulation, None for no limit """
+        budgets = []
+        if self.seconds > 0:
+            budgets.append(self.seconds)
+        expected = self.expected(variant)
+        if self.factor > 0 and expected is not None:
+            budgets.append(self.factor * expected)
+        return min(budgets) if budgets else None
+
+    def speculate_after(self, variant=None):
+        """ Running time after which a simulation may be duplicated on an idle worker, None if not (yet) """
+        expected = self.expected(variant)
+        if not self.speculate or expected is None:
+            return None
+        return self.speculate_factor * expected
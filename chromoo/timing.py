@@ -0,0 +1,160 @@
+"""
+Timing
+
+Per-evaluation phase timings, aggregated per generation.
+
+Every evaluation records the wall time of its phases in a Timings object,
+along with the worker PID, its CPU slot (with resources.pin, see affinity.py)
+and the parameter vector:
+    - copy: copying the simulation tree for the evaluation
+    - update: writing the parameter values into the tree
+    - save: writing the h5 file (full save, or patching the template)
+    - cadet: cadet-cli wall time
+    - load: reading the outputs
+    - post: post_* routines (and prolongation at lower fidelity)
+    - process: Objective.process()
+    - transfer: from the end of the worker task to its receipt in the parent
+    - score: scoring (the batch scoring time, split evenly)
+
+EvaluationMetrics collects them (from any thread), and per generation writes
+one JSON line per evaluation to metrics.jsonl and logs the median and 90th
+percentile of every phase.
+
+It also collects the schedule of every batch the WorkerPool ran: its makespan
+(wall time from the first dispatch to the last result) and the worker time of
+its tasks, and logs the makespan and the fraction of idle cores (1 - worker
+time / (nproc x makespan)) per generation. With pinning, the evaluations and
+cadet-cli times per CPU slot are logged too, to compare the slots.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from chromoo.log import Logger
+
+PHASES = ['copy', 'update', 'save', 'cadet', 'load', 'post', 'process', 'transfer', 'score']
+
+class Timings:
+    """ Wall times of the phases of one evaluation """
+
+    def __init__(self, x=None):
+        self.pid = os.getpid()
+        self.slot = None
+        self.x = None if x is None else [ float(v) for v in x ]
+        self.phases = {}
+        self.sent = None
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def send(self):
+        """ Mark the end of the worker side, see receive() """
+        self.sent = time.time()
+
+    def receive(self):
+        """ Record the transfer time from the worker to the parent """
+        if self.sent is not None:
+            self.add('transfer', max(time.time() - self.sent, 0.0))
+            self.sent = None
+
+    @property
+    def total(self):
+        return sum(self.phases.values())
+
+    @property
+    def worker(self):
+        """ Time spent in the worker """
+        return sum(seconds for phase, seconds in self.phases.items() if phase not in ('transfer', 'score'))
+
+    def row(self, generation) -> dict:
+        return { 'generation': generation, 'pid': self.pid, 'slot': self.slot, **{ phase: self.phases.get(phase, 0.0) for phase in PHASES }, 'total': self.total, 'x': self.x }
+
+class EvaluationMetrics:
+    """ Thread-safe collector of Timings, see the module docstring """
+
+    def __init__(self, filename='metrics.jsonl'):
+        self.filename = filename
+        self.pending = []
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def record(self, timings:Timings):
+        with self.lock:
+            self.pending.append(timings)
+
+    def record_batch(self, makespan, busy, nproc):
+        """ Record the makespan of a batch, and the worker time of its tasks """
+        with self.lock:
+            self.batches.append((makespan, busy, nproc))
+
+    def collect(self, generation) -> list:
+        """ Return the rows of all evaluations since the last call, and log their summary """
+        with self.lock:
+            pending, self.pending = self.pending, []
+            batches, self.batches = self.batches, []
+
+        rows = [ timings.row(generation) for timings in pending ]
+        if rows:
+            Logger().info(self.summary(rows))
+        if any(row['slot'] is not None for row in rows):
+            Logger().info(self.slots(rows))
+        if batches:
+            Logger().info(self.schedule(batches))
+        return rows
+
+    @staticmethod
+    def summary(rows) -> str:
+        """ Median and 90th percentile of every phase that took any time """
+        parts = []
+        for phase in PHASES + ['total']:
+            values = np.array([ row[phase] for row in rows ])
+            if np.any(values > 0):
+                p50, p90 = np.percentile(values, [50, 90])
+                parts.append(f"{phase} {p50:.3g}/{p90:.3g}")
+        return f"Timings over {len(rows)} evaluations (median/p90 s): " + ", ".join(parts)
+
+    @staticmethod
+    def slots(rows) -> str:
+        """ Evaluations and median cadet-cli time per CPU slot """
+        slots = {}
+        for row in rows:
+            if row['slot'] is not None:
+                slots.setdefault(row['slot'], []).append(row['cadet'])
+        return "Per slot (evaluations, median cadet s): " + ", ".join(f"{slot}: {len(cadet)}, {np.median(cadet):.3g}" for slot, cadet in sorted(slots.items()))
+
+    @staticmethod
+    def schedule(batches) -> str:
+        """ Total makespan and idle core fraction of (makespan, busy, nproc) batches """
+        makespan = sum(m for m, _, _ in batches)
+        capacity = sum(m * n for m, _, n in batches)
+        idle = 1 - sum(b for _, b, _ in batches) / capacity if capacity > 0 else 0.0
+        return f"Schedule of {len(batches)} batch(es): makespan {makespan:.3g} s, idle cores {max(idle, 0.0):.1%}"
+
+    def write(self, rows):
+        """ Append rows to the metrics file """
+        with open(self.filename, 'a') as fp:
+            fp.writelines(json.dumps(row) + '\n' for row in rows)
+
+    def __getstate__(self):
+        # Locks can't be pickled
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault('batches', [])
+        self.lock = threading.Lock()
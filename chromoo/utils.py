@@ -2,6 +2,13 @@ from functools import reduce
 from matplotlib import pyplot as plt
 from typing import TypeVar, Callable, Any, Optional, overload
 import itertools as it
+from pathlib import Path
+import glob
+import hashlib
+import re
+import tempfile
+import shutil
+import os
 
 import numpy as np
 
@@ -49,19 +56,59 @@ def deep_get(input_dict:dict, keys:str, vartype:Optional[Callable[[Any], T]] = N
 
     return value
 
+def cache_dir() -> Path:
+    """ Directory for cached files """
+    return Path(os.environ.get('CHROMOO_CACHE_DIR', Path.home() / '.cache' / 'chromoo'))
+
+def loadtxt_cached(data_path, delimiter=None) -> np.ndarray:
+    """
+        np.loadtxt() with a binary cache: the parsed array is stored in a
+        .npy file in cache_dir()/loadtxt, named after the file and its path,
+        and keyed by the file's size, modification time and the delimiter.
+        Later loads memory-map the cached array instead of parsing the text.
+        Returned arrays are read-only.
+    """
+    data_path = Path(data_path).resolve()
+    stat = data_path.stat()
+    stem = f"{data_path.name}.{hashlib.sha1(str(data_path).encode()).hexdigest()[:8]}"
+    key = hashlib.sha1(f"{data_path}|{stat.st_size}|{stat.st_mtime_ns}|{delimiter}".encode()).hexdigest()[:16]
+    cached = cache_dir() / 'loadtxt' / f"{stem}.{key}.npy"
+
+    try:
+        return np.load(cached, mmap_mode='r')
+    except (OSError, ValueError):
+        pass
+
+    arr = np.loadtxt(data_path, delimiter=delimiter)
+
+    try:
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        # Remove the caches of older versions of the same file (exactly one key after the stem)
+        stale = re.compile(re.escape(stem) + r'\.[0-9a-f]{16}\.npy')
+        for old in cached.parent.glob(f"{glob.escape(stem)}.*.npy"):
+            if old != cached and stale.fullmatch(old.name):
+                old.unlink(missing_ok=True)
+        # Write atomically, so that concurrent readers never see a partial file
+        with tempfile.NamedTemporaryFile(dir=cached.parent, suffix='.npy', delete=False) as fp:
+            np.save(fp, arr)
+        os.replace(fp.name, cached)
+        return np.load(cached, mmap_mode='r')
+    except OSError:
+        return arr
+
 def readChromatogram(data_path, delimiter=','):
     """
         Read chromatogram files in csv, or space-delimited format
         Return two vectors: time, concentration
     """
-    arr = np.loadtxt(data_path, delimiter=delimiter).T
+    arr = loadtxt_cached(data_path, delimiter=delimiter).T
     return arr[0], arr[1]
 
 def readArray(data_path):
     """
         Read a text file with one value per line into a list
     """
-    return np.loadtxt(data_path)
+    return loadtxt_cached(data_path)
 
 def plotter(sim, objectives):
     """
@@ -92,3 +139,21 @@ def pairwise(iterable):
     a, b = it.tee(iterable)
     next(b, None)
     return zip(a, b)
+
+# ioctl request to share extents between files (reflink) on btrfs/xfs
+FICLONE = 0x40049409
+
+def clone_file(src, dst):
+    """
+        Copy src to dst as cheaply as the filesystem allows: a copy-on-write
+        reflink where supported, otherwise an in-kernel copy.
+    """
+    try:
+        import fcntl
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return
+    except (ImportError, OSError):
+        pass
+
+    shutil.copyfile(src, dst)
@@ -0,0 +1,466 @@
+"""
+WorkerPool
+
+Long-lived pool of evaluation workers, created once per run and shared across
+generations. Each worker receives the simulation template, parameters and
+objectives exactly once (through the pool initializer). The simulation and
+the objective reference arrays are published in shared memory (see
+SharedWorkerData), so that individual tasks only carry (index, x).
+
+Workers only run the simulations and return the processed objective arrays;
+the scores are computed in the parent process, for all results of a map() at
+once (see evaluate_population()).
+
+Failed simulations are retried in the worker and logged by the parent
+according to the FailurePolicy. Evaluations that fail for good get NaN
+scores, so that the rest of the batch survives (see failurePolicy.py).
+
+The parent dispatches the tasks itself, at most one per idle worker, so that
+every task gets the current time budget (see timeBudget.py) and stragglers
+can get a speculative duplicate on an idle worker. Tasks are dispatched in
+the order (and chunks) planned by the Scheduler, longest expected first, and
+with the number of CADET threads from the ResourceAllocator, pinned to CPU
+slots with resources.pin (see affinity.py).
+"""
+
+import multiprocessing as mp
+import queue
+import random
+import signal
+import string
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+
+from chromoo.log import Logger
+from chromoo.affinity import CpuSlots
+from chromoo.cadetSimulation import new_run_and_process
+from chromoo.failurePolicy import FailurePolicy
+from chromoo.objective import evaluate_population
+from chromoo.resources import ResourceAllocator
+from chromoo.scheduler import Scheduler
+from chromoo.sharedData import SharedWorkerData
+from chromoo.timeBudget import TimeBudget
+from chromoo.timing import Timings
+
+# Per-process worker state, populated once by init_worker()
+_worker = {}
+
+def init_worker(shared, parameters, tempdir, store, templates, failures):
+    """ Pool initializer: attach to the shared simulation template and objectives """
+    _worker['sim'], _worker['objectives'], _worker['variants'] = shared.load()
+    # Once, so that the evaluations only need to read their outputs
+    for sim in [ _worker['sim'], *_worker['variants'].values() ]:
+        sim.normalize_inputs()
+    _worker['parameters'] = parameters
+    _worker['tempdir'] = Path(tempdir)
+    _worker['store'] = store
+    _worker['templates'] = templates
+    _worker['failures'] = failures
+
+    # Pool.terminate() sends SIGTERM. Exit through python, so that a running
+    # cadet-cli (in its own process group) is killed as well.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+
+def cancel_marker(tempdir, token) -> Path:
+    """ File whose existence cancels the tasks with this token (see WorkerPool.run()) """
+    return Path(tempdir) / f'.cancel-{token}'
+
+def evaluate_worker(task):
+    """ 
+    Run and process a single (index, x, variant, timeout, first_attempt, token, threads, pin) task using the preloaded worker state.
+    variant selects a variant of the simulation (e.g. a fidelity level), None for the simulation itself.
+    timeout is the time budget of cadet-cli in seconds (None for no limit), first_attempt > 0 starts
+    with relaxed tolerances (see FailurePolicy). If token is given, cadet-cli is killed once the
+    cancel_marker() of the token exists. threads overrides input.solver.nthreads, unless None.
+    pin is (slot, CPUs) to run on (cadet-cli inherits the affinity), None to leave it.
+    """
+    index, x, variant, timeout, first_attempt, token, threads, pin = task
+    timings = Timings(x)
+    if pin is not None:
+        timings.slot, cpus = pin
+        os.sched_setaffinity(0, cpus)
+    cancelled = None if token is None else cancel_marker(_worker['tempdir'], token).exists
+    run = lambda sim, patch_paths: new_run_and_process(
+            x,
+            sim=sim,
+            parameters=_worker['parameters'],
+            objectives=_worker['objectives'],
+            name=None,
+            tempdir=_worker['tempdir'],
+            store=_worker['store'],
+            template=_worker['templates'].get(variant),
+            full_sim=None if variant is None else _worker['sim'],
+            timings=timings,
+            patch_paths=patch_paths,
+            timeout=timeout,
+            cancelled=cancelled,
+            nthreads=threads,
+            normalized=True)
+    sim = _worker['sim'] if variant is None else _worker['variants'][variant]
+    processed, failures = _worker['failures'].evaluate(x, sim, run, first_attempt)
+    timings.send()
+    return index, processed, timings, failures
+
+def evaluate_chunk(tasks):
+    """ Run several tasks one after the other, see evaluate_worker() """
+    results = [ evaluate_worker(task) for task in tasks ]
+    # All results are sent back together, waiting for the rest of the chunk isn't transfer time
+    for _, _, timings, _ in results:
+        timings.send()
+    return results
+
+class WorkerPool:
+    """
+    Wrapper around multiprocessing.Pool that is started lazily and reused
+    until close() is called. The underlying pool is dropped when pickled
+    (e.g. in checkpoints), and recreated on first use after unpickling.
+    """
+    def __init__(self, nproc, sim, parameters, objectives, tempdir=Path('temp'), store=False, patch_template=True, variants=None, metrics=None, failures=None, budget=None, scheduler=None, resources=None):
+        self.nproc = nproc
+        self.metrics = metrics
+        self.failures = failures if failures is not None else FailurePolicy()
+        self.budget = budget if budget is not None else TimeBudget()
+        self.scheduler = scheduler if scheduler is not None else Scheduler()
+        self.resources = resources if resources is not None else ResourceAllocator()
+        self.sim = sim
+        self.variants = variants or {}
+        self.parameters = parameters
+        self.objectives = objectives
+        self.tempdir = Path(tempdir)
+        self.store = store
+        self.patch_template = patch_template
+
+        self.templates = {}
+        self.shared = None
+        self._pool = None
+
+        # Tasks in the workers, including discarded duplicates of earlier batches, and their CADET threads
+        self.in_flight = 0
+        self.threads_in_use = 0
+        self.lock = threading.Lock()
+
+        # CPU slots of the tasks with resources.pin, see CpuSlots
+        self.slots = None
+
+    def write_templates(self):
+        """ 
+        Write the simulation templates (including variants) once, so workers
+        only need to patch the parameter datasets. Returns {variant: filename}.
+        """
+        if not self.patch_template:
+            return {}
+
+        for variant, sim in [ (None, self.sim), *self.variants.items() ]:
+            suffix = ''.join(random.choices(string.ascii_uppercase + string.ascii_lowercase + string.digits, k=6))
+            self.templates[variant] = self.tempdir.joinpath(f'template{suffix}.h5')
+
+            # Write from a copy to leave the filename of the shared simulation untouched
+            type(sim)(sim.root).save_template(self.templates[variant])
+
+        return self.templates
+
+    def start(self):
+        """ Start the worker processes if they aren't running already """
+        if self._pool is None:
+            Logger().info(f"Starting worker pool with {self.nproc} processes.")
+            self.shared = SharedWorkerData(self.sim, self.objectives, self.variants)
+            self._pool = mp.Pool(
+                    self.nproc,
+                    initializer=init_worker,
+                    initargs=(self.shared, self.parameters, self.tempdir, self.store, self.write_templates(), self.failures))
+            self.in_flight = 0
+            self.threads_in_use = 0
+            if self.resources.pin:
+                self.slots = CpuSlots(self.nproc, self.resources.cores)
+                Logger().info(f"Pinning evaluations to CPU slots {self.slots.describe()}")
+        return self._pool
+
+    def task(self, index, x, variant=None, first_attempt=0, token=None, threads=None, pin=None):
+        """ A task for evaluate_worker(), with the current time budget """
+        return (index, x, variant, self.budget.budget(variant), first_attempt, token, threads, pin)
+
+    def allocate(self, starting):
+        """
+        CADET threads and CPU slots for a task, started along with starting - 1
+        others (see ResourceAllocator and CpuSlots). Returns (threads, slot ids, pin),
+        pin is (first slot, CPUs) for evaluate_worker().
+        """
+        threads = self.resources.threads(max(starting, 1), self.idle, self.threads_in_use)
+        if self.slots is None:
+            return threads, [], None
+
+        ids, cpus = self.slots.acquire(threads)
+        if threads is not None:
+            threads = min(threads, len(cpus))
+        return threads, ids, (ids[0] if ids else None, cpus)
+
+    def apply(self, func, task, callback=None, error_callback=None, threads=None, slots=()):
+        """ Submit func(task) to a worker, returns an AsyncResult. callback receives the raw worker result. """
+        def done(result, handler):
+            with self.lock:
+                self.in_flight -= 1
+                self.threads_in_use -= threads or 1
+            if slots:
+                self.slots.release(slots)
+            if handler:
+                handler(result)
+
+        pool = self.start()
+        with self.lock:
+            self.in_flight += 1
+            self.threads_in_use += threads or 1
+        return pool.apply_async(func, (task,),
+                callback=lambda result: done(result, callback),
+                error_callback=lambda err: done(err, error_callback))
+
+    def dispatch(self, index, x, variant=None, first_attempt=0, callback=None, error_callback=None, token=None, starting=None):
+        """ Submit a single task, see apply(). starting is the number of tasks being started now, defaults to the idle workers. """
+        threads, slots, pin = self.allocate(self.idle if starting is None else starting)
+        return self.apply(evaluate_worker, self.task(index, x, variant, first_attempt, token, threads, pin), callback, error_callback, threads, slots)
+
+    @property
+    def idle(self):
+        """ Number of idle workers """
+        return max(self.nproc - self.in_flight, 0)
+
+    def receive(self, result, variant=None, record_failures=True):
+        """ 
+        Unpack a worker result, recording its timings, runtime and failures.
+        Returns (index, processed, timings), processed is None if it failed.
+        """
+        index, processed, timings, failures = result
+        timings.receive()
+        if self.metrics is not None:
+            self.metrics.record(timings)
+        if processed is not None and not failures:
+            self.budget.observe(variant, timings.phases.get('cadet', 0.0))
+        if record_failures:
+            self.failures.record(failures, processed is not None)
+        return index, processed, timings
+
+    def run(self, X, indices=None, variant=None, features=None, chunked=False):
+        """
+        Evaluate every row of X, yielding (index, processed, timings) in order
+        of completion. Tasks are dispatched as workers become idle, longest
+        expected runtime first, the runtimes predicted from the rows of
+        features (X in the optimizer's space, defaults to X). With chunked,
+        short tasks may be dispatched together (see Scheduler).
+
+        With speculation (see TimeBudget), a task that runs for too long while
+        a worker is idle gets a duplicate starting with relaxed tolerances, and
+        the first successful result wins. The other copy is then cancelled. If
+        one copy fails, the other one is waited for, and the evaluation only
+        fails if both did. Tasks aren't chunked then, since a chunked task
+        can't be told from a straggler.
+        """
+        indices = list(range(len(X)) if indices is None else indices)
+        rows = dict(zip(indices, X))
+        features = dict(zip(indices, X if features is None else features))
+        order, expected = self.scheduler.plan(indices, [ features[index] for index in indices ], variant)
+        pending = deque(order)
+        running = {}
+        duplicated = set()
+        # Failed attempts of the duplicated tasks whose first copy failed, while the other one runs
+        failed_copies = {}
+        done = queue.Queue()
+        chunked = chunked and not self.budget.speculate
+
+        def put_all(results):
+            for result in results:
+                done.put(result)
+
+        # Worker time of all tasks, for the idle fraction of the batch
+        started = time.monotonic()
+        busy = 0.0
+
+        # Tasks can only be cancelled (and thus duplicated) if they poll for it
+        tokens = { index: uuid.uuid4().hex for index in indices } if self.budget.speculate else {}
+        poll = 0.5 if self.budget.speculate else None
+
+        while pending or running:
+            while pending and (self.idle > 0 or not running):
+                size = self.scheduler.chunk(pending, expected, self.nproc) if chunked else 1
+                if size == 1:
+                    index = pending.popleft()
+                    self.dispatch(index, rows[index], variant, callback=done.put, error_callback=done.put, token=tokens.get(index), starting=len(pending) + 1)
+                    running[index] = time.monotonic()
+                else:
+                    chunk = [ pending.popleft() for _ in range(size) ]
+                    threads, slots, pin = self.allocate(len(pending) + 1)
+                    self.apply(evaluate_chunk, [ self.task(index, rows[index], variant, threads=threads, pin=pin) for index in chunk ], callback=put_all, error_callback=done.put, threads=threads, slots=slots)
+                    running.update(dict.fromkeys(chunk, time.monotonic()))
+
+            try:
+                result = done.get(timeout=poll)
+            except queue.Empty:
+                self.speculate(rows, running, duplicated, pending, variant, tokens, done)
+                continue
+
+            if isinstance(result, BaseException):
+                raise result
+
+            busy += result[2].worker
+
+            # The slower one of a duplicated pair is discarded
+            if result[0] not in running:
+                self.receive(result, variant, record_failures=False)
+                cancel_marker(self.tempdir, tokens[result[0]]).unlink(missing_ok=True)
+                continue
+
+            copies = result[0] in duplicated
+            index, processed, timings = self.receive(result, variant, record_failures=not copies)
+            if processed is not None and not result[3]:
+                self.scheduler.predictor.observe(variant, features[index], timings.phases.get('cadet', 0.0))
+
+            if copies:
+                first_failed = index in failed_copies
+                if processed is None and not first_failed:
+                    # The other copy may still succeed
+                    failed_copies[index] = list(result[3] or [])
+                    continue
+                self.failures.record(failed_copies.pop(index, []) + list(result[3] or []), processed is not None)
+                if not first_failed:
+                    cancel_marker(self.tempdir, tokens[index]).touch()
+
+            del running[index]
+            yield index, processed, timings
+
+        if self.metrics is not None and indices:
+            self.metrics.record_batch(time.monotonic() - started, busy, self.nproc)
+
+    def speculate(self, rows, running, duplicated, pending, variant, tokens, done):
+        """ Duplicate the tasks that have been running for too long onto idle workers, once all tasks are dispatched """
+        speculate_after = self.budget.speculate_after(variant)
+        if speculate_after is None or pending:
+            return
+
+        now = time.monotonic()
+        for index, started in sorted(running.items(), key=lambda item: item[1]):
+            if self.idle == 0:
+                break
+            if index not in duplicated and now - started > speculate_after:
+                Logger().info(f"Evaluation {index} has been running for {now - started:.1f} s, starting a duplicate with relaxed tolerances.")
+                self.dispatch(index, rows[index], variant, first_attempt=1, callback=done.put, error_callback=done.put, token=tokens[index])
+                duplicated.add(index)
+
+    def score(self, processed, timings):
+        """
+        Score a batch of processed results, splitting the scoring time evenly over the evaluations.
+        Failed evaluations (None) get NaN scores.
+        """
+        start = time.perf_counter()
+        succeeded = [ i for i, p in enumerate(processed) if p is not None ]
+        F = np.full((len(processed), sum(obj.n_obj for obj in self.objectives)), np.nan)
+        if succeeded:
+            F[succeeded] = evaluate_population(self.objectives, [ processed[i] for i in succeeded ])
+        for t in timings:
+            t.add('score', (time.perf_counter() - start) / len(timings))
+        return F
+
+    def map(self, X, variant=None, features=None):
+        """ 
+        Evaluate every row of X, preserving order, see run(). 
+        Returns the scores F of shape (len(X), n_obj), NaN for failed evaluations.
+        """
+        processed = [None] * len(X)
+        timings = []
+        for index, processed[index], t in self.run(X, variant=variant, features=features, chunked=True):
+            timings.append(t)
+
+        if len(X) > 1 and all(p is None for p in processed):
+            raise RuntimeError(f"All {len(X)} simulations failed, see {self.failures.log}")
+
+        return self.score(processed, timings)
+
+    def imap(self, X, indices=None, variant=None, features=None):
+        """ Evaluate every row of X, yielding (index, F) in order of completion, see run() """
+        for index, processed, t in self.run(X, indices, variant, features):
+            yield index, self.score([processed], [t])[0]
+
+    def submit(self, x, index=0, callback=None, error_callback=None, variant=None):
+        """
+        Evaluate a single individual asynchronously, returns an AsyncResult.
+        callback receives (index, F).
+        """
+        def score(result):
+            try:
+                index, processed, t = self.receive(result, variant)
+                F = self.score([processed], [t])[0]
+            except Exception as err:
+                if error_callback:
+                    error_callback(err)
+                return
+            if callback:
+                callback((index, F))
+
+        return self.dispatch(index, x, variant, callback=score, error_callback=error_callback)
+
+    def close(self):
+        """ Shut down the worker processes cleanly, waiting for outstanding tasks """
+        if self._pool is not None and self.in_flight > 0:
+            # Only discarded duplicates can be left over
+            Logger().note(f"Terminating {self.in_flight} discarded evaluations.")
+            return self.terminate()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+        self.remove_shared()
+
+    def terminate(self):
+        """ Shut down the worker processes immediately, discarding outstanding tasks """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self.remove_shared()
+
+    def remove_shared(self):
+        """ Remove the shared memory block and the template file """
+        if self.shared is not None:
+            self.shared.close()
+            self.shared = None
+        self.remove_template()
+
+    def remove_template(self):
+        for marker in self.tempdir.glob('.cancel-*'):
+            marker.unlink(missing_ok=True)
+        if not self.store:
+            for template in self.templates.values():
+                try:
+                    os.remove(template)
+                except FileNotFoundError:
+                    pass
+        self.templates = {}
+
+    @property
+    def running(self):
+        return self._pool is not None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        state['shared'] = None
+        state['in_flight'] = 0
+        state['threads_in_use'] = 0
+        state['slots'] = None
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
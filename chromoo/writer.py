@@ -0,0 +1,103 @@
+"""
+Writer
+
+Persistent background thread for the per-generation outputs (history blocks,
+opts.csv, best_combined_per_gen.csv rows, checkpoints), so that the next
+generation's evaluations start while they are written.
+
+Tasks are run in submission order. A task submitted with a key replaces a
+pending (not yet started) task with the same key, e.g. an opts.csv that
+hasn't been written yet is outdated by the next one. Tasks without a key
+(appends) always run. The queue is bounded: submit() blocks while it is full,
+so a slow disk throttles the optimizer instead of piling up memory.
+
+flush() waits for all pending tasks. close() flushes and stops the thread, and
+is also registered with atexit.
+"""
+
+import atexit
+import itertools
+import threading
+from collections import OrderedDict
+
+from chromoo.log import Logger
+
+class BackgroundWriter:
+
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+
+        self.tasks = OrderedDict()
+        self.condition = threading.Condition()
+        self.counter = itertools.count()
+        self.busy = False
+        self.closed = False
+
+        self.n_written = 0
+        self.n_coalesced = 0
+
+        self.thread = threading.Thread(target=self.run, name='chromoo-writer', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def submit(self, key, func, *args, **kwargs):
+        """ Run func(*args, **kwargs) in the background, replacing a pending task with the same key (if not None) """
+        with self.condition:
+            if self.closed:
+                raise RuntimeError("BackgroundWriter is closed")
+
+            if key is None:
+                key = ('task', next(self.counter))
+            elif key in self.tasks:
+                # Re-queued at the end, after the tasks it may depend on
+                del self.tasks[key]
+                self.n_coalesced += 1
+
+            while len(self.tasks) >= self.maxsize:
+                self.condition.wait()
+
+            self.tasks[key] = (func, args, kwargs)
+            self.condition.notify_all()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.tasks and not self.closed:
+                    self.condition.wait()
+                if not self.tasks:
+                    return
+                key, (func, args, kwargs) = self.tasks.popitem(last=False)
+                self.busy = True
+                self.condition.notify_all()
+
+            try:
+                func(*args, **kwargs)
+            except Exception as err:
+                Logger().warn(f"Background write ({key}) failed: {err}")
+            finally:
+                with self.condition:
+                    self.busy = False
+                    self.n_written += 1
+                    self.condition.notify_all()
+
+    def flush(self):
+        """ Wait until all submitted tasks are done """
+        with self.condition:
+            while self.tasks or self.busy:
+                self.condition.wait()
+
+    def close(self):
+        """ Flush and stop the writer thread """
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,57 @@
+"""
+Benchmark the default (pymoo) and fast (chromoo.survival) NSGA3 survival.
+
+Runs survival on synthetic merged populations (2 x pop_size individuals on a
+noisy concave front) and prints the time per generation spent in survival,
+next to the evaluation time of one generation for a given simulation time.
+
+    python scripts/benchmark_survival.py --pop-sizes 100 400 --n-objs 5 20 50 --sim-time 10 --nproc 16
+"""
+
+import argparse
+import time
+from math import ceil
+
+import numpy as np
+
+from pymoo.core.population import Population
+from pymoo.core.problem import Problem
+
+from chromoo.refdirs import reference_directions
+from chromoo.survival import get_survival
+
+def merged_population(pop_size, n_obj, rng):
+    F = np.abs(rng.normal(size=(2 * pop_size, n_obj)))
+    F = F / np.linalg.norm(F, axis=1)[:, np.newaxis] * rng.uniform(1.0, 1.5, size=(2 * pop_size, 1))
+    return Population.new(X=np.zeros((2 * pop_size, 1)), F=F, CV=np.zeros((2 * pop_size, 1)), feasible=np.ones((2 * pop_size, 1), dtype=bool))
+
+def time_survival(name, ref_dirs, pop_size, n_obj, generations, seed):
+    problem = Problem(n_var=1, n_obj=n_obj, n_constr=0, xl=0, xu=1)
+    survival = get_survival(name, ref_dirs)
+    rng = np.random.default_rng(seed)
+    np.random.seed(seed)
+    for _ in range(generations):
+        survival.do(problem, merged_population(pop_size, n_obj, rng), n_survive=pop_size)
+    return np.median(survival.timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pop-sizes', type=int, nargs='+', default=[100, 400])
+    parser.add_argument('--n-objs', type=int, nargs='+', default=[3, 10, 30])
+    parser.add_argument('--generations', type=int, default=5)
+    parser.add_argument('--sim-time', type=float, default=10.0, help='seconds per simulation')
+    parser.add_argument('--nproc', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'pop_size':>8} {'n_obj':>5} {'default [s]':>12} {'fast [s]':>10} {'speedup':>8} {'evaluation [s]':>15} {'fast share':>10}")
+    for pop_size in args.pop_sizes:
+        evaluation = ceil(pop_size / args.nproc) * args.sim_time
+        for n_obj in args.n_objs:
+            ref_dirs = reference_directions('auto', n_obj, pop_size)
+            default = time_survival('default', ref_dirs, pop_size, n_obj, args.generations, args.seed)
+            fast = time_survival('fast', ref_dirs, pop_size, n_obj, args.generations, args.seed)
+            print(f"{pop_size:>8} {n_obj:>5} {default:>12.4f} {fast:>10.4f} {default/fast:>7.1f}x {evaluation:>15.1f} {fast/(fast + evaluation):>10.2%}")
+
+if __name__ == '__main__':
+    main()
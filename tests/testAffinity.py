@@ -0,0 +1,62 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from chromoo.affinity import CpuSlots, format_cpulist, numa_nodes, parse_cpulist, partition
+
+class TestAffinity(unittest.TestCase):
+
+    def test_cpulist(self):
+        self.assertEqual(parse_cpulist('0-3,8-9,12\n'), [0, 1, 2, 3, 8, 9, 12])
+        self.assertEqual(format_cpulist([12, 0, 1, 2, 3, 8, 9]), '0-3,8-9,12')
+        self.assertEqual(parse_cpulist(''), [])
+
+    def test_numa_nodes(self):
+        with tempfile.TemporaryDirectory() as root:
+            for node, cpulist in [('node0', '0-3'), ('node1', '4-7'), ('node10', '')]:
+                (Path(root) / node).mkdir()
+                (Path(root) / node / 'cpulist').write_text(cpulist)
+            self.assertEqual(numa_nodes(allowed=range(2, 10), root=Path(root)), [[2, 3], [4, 5, 6, 7], [8, 9]])
+            # Without sysfs, one node
+            self.assertEqual(numa_nodes(allowed=[1, 0], root=Path(root) / 'missing'), [[0, 1]])
+
+    def test_partition(self):
+        nodes = [list(range(0, 8)), list(range(8, 16))]
+
+        slots = partition(nodes, 4)
+        self.assertEqual(slots, [(0, [0, 1, 2, 3]), (0, [4, 5, 6, 7]), (1, [8, 9, 10, 11]), (1, [12, 13, 14, 15])])
+
+        # Uneven splits stay disjoint and within their node
+        slots = partition(nodes, 3)
+        cpus = [ cpu for _, share in slots for cpu in share ]
+        self.assertEqual(len(cpus), len(set(cpus)))
+        self.assertEqual(sorted(cpus), list(range(16)))
+        for node, share in slots:
+            self.assertTrue(set(share) <= set(nodes[node]))
+
+        # Fewer slots than nodes: whole nodes
+        self.assertEqual(partition(nodes + [[16, 17]], 2), [(0, nodes[0] + [16, 17]), (1, nodes[1])])
+
+        # More slots than CPUs: shared CPUs
+        self.assertEqual(partition([[0, 1]], 4), [(0, [0]), (0, [1]), (0, [0]), (0, [1])])
+
+    def test_slots(self):
+        # Four slots on two nodes, whatever this machine has
+        slots = CpuSlots(1)
+        slots.slots = [(0, [0, 1]), (0, [2, 3]), (1, [4, 5]), (1, [6, 7])]
+        slots.all = list(range(8))
+        slots.free = [0, 1, 2, 3]
+
+        ids, cpus = slots.acquire()
+        self.assertEqual((ids, cpus), ([0], [0, 1]))
+
+        # More threads take more slots, of the same node first
+        ids, cpus = slots.acquire(threads=4)
+        self.assertEqual((ids, cpus), ([1, 2], [2, 3, 4, 5]))
+
+        slots.acquire()
+        # Nothing free: all CPUs, no ids to release
+        self.assertEqual(slots.acquire(), ([], list(range(8))))
+
+        slots.release([1, 2])
+        self.assertEqual(slots.free, [1, 2])
@@ -1,5 +1,25 @@
 import unittest
-from chromoo.cadetSimulation import CadetSimulation
+from chromoo.cadetSimulation import CadetSimulation, h5_path, parameter_paths, required_output_paths
+from chromoo.objective import Objective
+from chromoo.parameter import Parameter, ParameterPlan
+from chromoo.utils import clone_file
+from pathlib import Path
+from unittest import mock
+import errno
+import h5py
+import numpy as np
+import tempfile
+
+EXAMPLE = Path(__file__).resolve().parent.parent / 'examples' / '10k-mono-1d-p2' / '10k-mono.mono1d.yaml'
+
+def assert_tree_equal(test, a, b, path='root'):
+    """ Compare two simulation trees as loaded from h5 files """
+    test.assertEqual(sorted(a.keys()), sorted(b.keys()), path)
+    for key in a:
+        if isinstance(a[key], dict):
+            assert_tree_equal(test, a[key], b[key], f'{path}.{key}')
+        else:
+            np.testing.assert_array_equal(a[key], b[key], err_msg=f'{path}.{key}')
 
 class TestCadetSimulation(unittest.TestCase):
 
@@ -37,3 +57,118 @@ class TestCadetSimulation(unittest.TestCase):
         data = sim.get('output.solution.unit_002.solution_bulk')
         sim.post_internal_mass(2)
         data = sim.get('output.post.unit_002.post_bulk_mass')
+
+    def test_update_parameters(self): 
+        sim = CadetSimulation()
+        sim.root.input.model.unit_002.col_dispersion = 1e-7
+        sim.root.input.model.connections.switch_000.connections = np.arange(14.0)
+        parameters = [
+            Parameter('col_dispersion', 'input.model.unit_002.col_dispersion', 1e-8, 1e-6, 'scalar'),
+            Parameter('flowrate', 'input.model.connections.switch_000.connections', 0.0, 1.0, 'element', index=[6], copy_to_path='input.model.connections.switch_000.connections', copy_to_index=[[13]]),
+        ]
+        plan = ParameterPlan(parameters)
+        plan.validate(sim.root)
+        sim.update_parameters(np.array([2e-7, 0.5]), plan)
+        self.assertEqual(sim.get('input.model.unit_002.col_dispersion'), [2e-7])
+        connections = sim.get('input.model.connections.switch_000.connections')
+        self.assertEqual(connections[6], 0.5)
+        self.assertEqual(connections[13], 0.5)
+        self.assertEqual(connections[7], 7.0)
+
+        with self.assertRaises(ValueError): 
+            ParameterPlan([Parameter('bad', 'input.model.unit_009.col_dispersion', 0.0, 1.0, 'scalar')]).validate(sim.root)
+        with self.assertRaises(ValueError): 
+            ParameterPlan([Parameter('typo', 'input.model.unit_002.col_dispersoin', 0.0, 1.0, 'scalar')]).validate(sim.root)
+        with self.assertRaises(ValueError): 
+            ParameterPlan([Parameter('group', 'input.model.unit_002', 0.0, 1.0, 'scalar')]).validate(sim.root)
+        with self.assertRaises(ValueError): 
+            ParameterPlan([Parameter('vector', 'input.model.unit_002.col_porosity', 0.0, 1.0, 'vector')]).validate(sim.root)
+
+    def parameters(self):
+        return [
+            Parameter('col_dispersion', 'input.model.unit_002.col_dispersion', 1e-8, 1e-6, 'scalar'),
+            Parameter('flowrate', 'input.model.connections.switch_000.connections', 0.0, 1.0, 'element', index=[6], copy_to_path='input.model.connections.switch_000.connections', copy_to_index=[[13]]),
+        ]
+
+    def test_patch_from_template(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            template = CadetSimulation()
+            template.load_file(str(EXAMPLE))
+            template.save_template(Path(tempdir) / 'template.h5')
+
+            sim = CadetSimulation()
+            sim.load_file(str(EXAMPLE))
+            sim.update_parameters(np.array([3e-7, 0.25]), ParameterPlan(self.parameters()))
+            sim.root.input.solver.time_integrator.reltol = 1e-6
+
+            # The patched template reads back like a full save
+            sim.filename = Path(tempdir) / 'patched.h5'
+            sim.patch_from_template(template.filename, parameter_paths(self.parameters()) + ['input.solver.time_integrator.reltol'])
+            sim.filename = Path(tempdir) / 'saved.h5'
+            sim.save()
+
+            patched, saved = CadetSimulation(), CadetSimulation()
+            patched.load_file(str(Path(tempdir) / 'patched.h5'))
+            saved.load_file(str(Path(tempdir) / 'saved.h5'))
+            assert_tree_equal(self, patched.root, saved.root)
+            self.assertEqual(patched.get('input.model.unit_002.col_dispersion'), 3e-7)
+            self.assertEqual(patched.get('input.model.connections.switch_000.connections')[13], 0.25)
+
+    def test_clone_file_fallback(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            src, dst = Path(tempdir) / 'src.h5', Path(tempdir) / 'dst.h5'
+            src.write_bytes(np.arange(1000).tobytes())
+            # Filesystems without reflinks fail the FICLONE ioctl
+            with mock.patch('fcntl.ioctl', side_effect=OSError(errno.EOPNOTSUPP, 'Operation not supported')) as ioctl:
+                clone_file(src, dst)
+            ioctl.assert_called_once()
+            self.assertEqual(dst.read_bytes(), src.read_bytes())
+
+    def test_load_outputs(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            sim = CadetSimulation()
+            sim.load_file(str(EXAMPLE))
+            sim.filename = Path(tempdir) / 'sim.h5'
+            sim.save()
+
+            # Outputs as cadet-cli writes them
+            outputs = {
+                'output.solution.solution_times': np.linspace(0, 10, 11),
+                'output.solution.unit_003.solution_outlet_comp_000': np.linspace(0, 1, 11),
+                'output.solution.unit_002.solution_bulk': np.ones((11, 4, 1)),
+                'output.solution.unit_002.solution_particle': np.ones((11, 4, 3, 1)),
+            }
+            with h5py.File(sim.filename, 'r+') as h5file:
+                for path, value in outputs.items():
+                    h5file[h5_path(path)] = value
+
+            full = CadetSimulation()
+            full.load_file(str(sim.filename))
+
+            # Only the requested outputs, the inputs read back from the file
+            sim.load_outputs(['output.solution.unit_003.solution_outlet_*', 'output.solution.unit_002.solution_bulk', 'output.solution.unit_009.solution_bulk'])
+            self.assertEqual(sorted(sim.root.output.solution.keys()), ['unit_002', 'unit_003'])
+            self.assertEqual(list(sim.root.output.solution.unit_002.keys()), ['solution_bulk'])
+            np.testing.assert_array_equal(sim.get('output.solution.unit_003.solution_outlet_comp_000'), outputs['output.solution.unit_003.solution_outlet_comp_000'])
+            assert_tree_equal(self, sim.root.input, full.root.input)
+
+            # Normalized inputs are kept from memory
+            sim.normalize_inputs()
+            inputs = sim.root.input
+            sim.load_outputs(['output.solution.unit_002.solution_bulk'], keep_inputs=True)
+            self.assertIs(sim.root.input, inputs)
+            assert_tree_equal(self, sim.root.input, full.root.input)
+            self.assertNotIn('unit_003', sim.root.output.solution)
+
+    def test_required_output_paths(self):
+        objectives = [
+            Objective('outlet', '', 'output.solution.unit_003.solution_outlet_comp_000', ignore_reference=True),
+            Objective('bulk', '', 'output.post.unit_002.post_mass_bulk', ignore_reference=True),
+            Objective('solid', '', 'output.post.unit_002.post_mass_solid', ignore_reference=True),
+        ]
+        self.assertEqual(sorted(required_output_paths(objectives)), [
+            'output.solution.unit_002.solution_bulk',
+            'output.solution.unit_002.solution_solid',
+            'output.solution.unit_003.solution_outlet_comp_000',
+        ])
+        self.assertEqual(CadetSimulation.post_mass_bulk.requires, ('solution_bulk',))
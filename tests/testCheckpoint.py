@@ -0,0 +1,82 @@
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from chromoo.checkpoint import Checkpointer, dumps, loads, load_checkpoint
+
+class FakeAlgorithm:
+    def __init__(self, problem=None, callback=None):
+        self.problem = problem
+        self.callback = callback
+        self.n_gen = 7
+        self.pop = np.arange(12.0).reshape(4, 3)
+
+class FakeProblem:
+    def __init__(self, nproc=4):
+        self.nproc = nproc
+        self.state = None
+
+    def checkpoint_state(self):
+        return {'runtimes': [1.0, 2.0]}
+
+    def restore_state(self, state):
+        self.state = state
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tempdir.name)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_dumps_detaches(self):
+        problem, callback = FakeProblem(), object()
+        algorithm = FakeAlgorithm(problem, callback)
+        state, legacy = loads(dumps(algorithm, problem))
+
+        self.assertFalse(legacy)
+        self.assertIsNone(state['algorithm'].problem)
+        self.assertIsNone(state['algorithm'].callback)
+        self.assertEqual(state['problem'], {'runtimes': [1.0, 2.0]})
+        # The live algorithm keeps its problem and callback
+        self.assertIs(algorithm.problem, problem)
+        self.assertIs(algorithm.callback, callback)
+
+    def test_round_trip(self):
+        for compression in ['none', 'gzip', 'lzma']:
+            filename = self.directory / f'checkpoint.{compression}.pkl'
+            np.random.seed(3)
+            random.seed(3)
+            with Checkpointer(filename, compression) as checkpointer:
+                checkpointer.save(FakeAlgorithm(FakeProblem()), FakeProblem())
+            expected = (np.random.random(), random.random())
+
+            problem, callback = FakeProblem(nproc=2), object()
+            algorithm = load_checkpoint(filename, problem, callback)
+
+            self.assertIs(algorithm.problem, problem)
+            self.assertIs(algorithm.callback, callback)
+            self.assertEqual(algorithm.n_gen, 7)
+            np.testing.assert_array_equal(algorithm.pop, np.arange(12.0).reshape(4, 3))
+            self.assertEqual(problem.state, {'runtimes': [1.0, 2.0]})
+            # Random number generators continue where the checkpoint left off
+            self.assertEqual((np.random.random(), random.random()), expected)
+            self.assertEqual([ path.name for path in self.directory.glob('.*.tmp') ], [])
+
+    def test_legacy_npy(self):
+        filename = self.directory / 'checkpoint.npy'
+        np.save(filename, FakeAlgorithm(FakeProblem(nproc=8), None), allow_pickle=True)
+
+        callback = object()
+        algorithm = load_checkpoint(filename, FakeProblem(nproc=2), callback)
+
+        # Old checkpoints keep their pickled problem, with the configured nproc
+        self.assertEqual(algorithm.problem.nproc, 2)
+        self.assertIsNone(algorithm.problem.state)
+        self.assertIs(algorithm.callback, callback)
+        self.assertEqual(algorithm.n_gen, 7)
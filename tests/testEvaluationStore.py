@@ -0,0 +1,81 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+from addict import Dict
+
+from chromoo.cadetSimulation import CadetSimulation
+from chromoo.evaluationStore import EvaluationStore, template_hash
+from chromoo.parameter import Parameter
+
+class FakeObjective:
+    name = 'obj'
+    path = 'output.solution.unit_002.solution_outlet'
+    score = 'sse'
+    take = None
+    combine_data_axis = None
+    sum_data_axis = None
+    combine_scores_axis = None
+    x0 = np.linspace(0, 1, 5)
+    y0 = np.linspace(1, 2, 5)
+
+class TestEvaluationStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.sim = CadetSimulation()
+        self.sim.root.input.model.unit_002.col_dispersion = 1e-7
+        self.sim.root.input.model.connections.switch_000.connections = np.arange(14.0)
+        self.sim.root.input.solver.nthreads = 1
+        self.parameters = [ Parameter('col_dispersion', 'input.model.unit_002.col_dispersion', 1e-8, 1e-6, 'scalar') ]
+        self.objectives = [ FakeObjective() ]
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def store(self, parameters=None, sim=None, name='store.sqlite'):
+        return EvaluationStore(Path(self.tempdir.name) / name, sim or self.sim, parameters or self.parameters, self.objectives)
+
+    def test_put_get(self):
+        store = self.store()
+        store.put([2e-7], [1.0, 2.0])
+        np.testing.assert_array_equal(store.get([2e-7]), [1.0, 2.0])
+        self.assertIsNone(store.get([3e-7]))
+        self.assertEqual((store.hits, store.misses), (1, 1))
+        self.assertEqual(len(store), 1)
+        store.close()
+
+        # Persistent across instances
+        np.testing.assert_array_equal(self.store().get([2e-7]), [1.0, 2.0])
+
+    def test_namespace_parameters(self):
+        element = Parameter('flowrate', 'input.model.connections.switch_000.connections', 0.0, 1.0, 'element', index=[6])
+        moved = Parameter('flowrate', 'input.model.connections.switch_000.connections', 0.0, 1.0, 'element', index=[7])
+        copied = Parameter('flowrate', 'input.model.connections.switch_000.connections', 0.0, 1.0, 'element', index=[6],
+                copy_to_path='input.model.connections.switch_000.connections', copy_to_index=[[13]])
+        vector = Parameter('flowrate', 'input.model.connections.switch_000.connections', 0.0, 1.0, 'vector')
+        namespaces = { self.store([p]).namespace for p in [element, moved, copied, vector] }
+        self.assertEqual(len(namespaces), 4)
+
+        # Names and bounds don't change where x goes
+        renamed = Parameter('rate', 'input.model.connections.switch_000.connections', 0.0, 2.0, 'element', index=[6])
+        self.assertEqual(self.store([element]).namespace, self.store([renamed]).namespace)
+
+    def test_namespace_template(self):
+        namespace = self.store().namespace
+        hashed = template_hash(self.sim)
+
+        self.sim.root.input.solver.nthreads = 4
+        self.assertEqual(template_hash(self.sim), hashed)
+        self.assertEqual(self.store().namespace, namespace)
+
+        self.sim.root.input.model.unit_002.col_porosity = 0.4
+        self.assertNotEqual(template_hash(self.sim), hashed)
+        self.assertNotEqual(self.store().namespace, namespace)
+
+    def test_separate_namespaces(self):
+        self.store().put([2e-7], [1.0])
+        other = Dict(self.sim.root)
+        other.input.model.unit_002.col_porosity = 0.4
+        self.assertIsNone(self.store(sim=CadetSimulation(other)).get([2e-7]))
@@ -0,0 +1,56 @@
+import unittest
+
+import numpy as np
+
+from chromoo.cadetSimulation import CadetSimulation
+from chromoo.fidelity import FidelityLevel, coarsen, prolong_outputs
+
+class TestFidelity(unittest.TestCase):
+
+    def simulation(self, ncol, nrad=None):
+        sim = CadetSimulation()
+        disc = sim.root.input.model.unit_002.discretization
+        disc.ncol = ncol
+        if nrad:
+            disc.nrad = nrad
+            disc.radial_disc_type = b'EQUIDISTANT'
+        return sim
+
+    def test_coarsen(self):
+        full = self.simulation(40)
+        full.root.input.solver.time_integrator.abstol = 1e-8
+        coarse = coarsen(full, FidelityLevel(ncol=0.25, abstol=1e-6))
+        self.assertEqual(coarse.root.input.model.unit_002.discretization.ncol, 10)
+        self.assertEqual(coarse.root.input.solver.time_integrator.abstol, 1e-6)
+        self.assertEqual(full.root.input.model.unit_002.discretization.ncol, 40)
+        self.assertEqual(full.root.input.solver.time_integrator.abstol, 1e-8)
+
+    def test_prolong_intensive(self):
+        full, coarse = self.simulation(20), self.simulation(5)
+        centers = (np.arange(5) + 0.5) / 5
+        coarse.root.output.solution.unit_002.solution_bulk = np.tile(2.0 * centers + 1.0, (3, 1))
+        coarse.root.output.solution.unit_002.solution_outlet = np.ones(3)
+
+        prolong_outputs(coarse, full, ['output.solution.unit_002.solution_bulk', 'output.solution.unit_002.solution_outlet'])
+
+        bulk = coarse.get('output.solution.unit_002.solution_bulk')
+        self.assertEqual(bulk.shape, (3, 20))
+        # Linear profiles are kept between the outermost coarse cell centers, and held constant beyond
+        full_centers = (np.arange(20) + 0.5) / 20
+        expected = 2.0 * np.clip(full_centers, centers[0], centers[-1]) + 1.0
+        np.testing.assert_allclose(bulk[0], expected)
+        np.testing.assert_array_equal(coarse.get('output.solution.unit_002.solution_outlet'), np.ones(3))
+
+    def test_prolong_extensive_2d(self):
+        full, coarse = self.simulation(12, nrad=6), self.simulation(4, nrad=3)
+        # Uniform mass density: every cell holds mass proportional to its volume
+        volumes = np.outer(np.full(4, 1/4), np.diff(np.linspace(0, 1, 4)**2))
+        coarse.root.output.solution.unit_002.post_mass_comp_000 = np.stack([ 5.0 * volumes ] * 2)
+
+        prolong_outputs(coarse, full, ['output.solution.unit_002.post_mass_comp_000'])
+
+        mass = coarse.get('output.solution.unit_002.post_mass_comp_000')
+        self.assertEqual(mass.shape, (2, 12, 6))
+        full_volumes = np.outer(np.full(12, 1/12), np.diff(np.linspace(0, 1, 7)**2))
+        np.testing.assert_allclose(mass[0], 5.0 * full_volumes)
+        np.testing.assert_allclose(mass.sum(axis=(1, 2)), [5.0, 5.0])
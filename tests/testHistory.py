@@ -0,0 +1,72 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from chromoo.history import History
+
+class TestHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tempdir.name) / 'history'
+        self.columns = ['axial', 'outlet']
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def block(self, generation, rows=3):
+        return np.column_stack([ np.full(rows, generation, dtype=float), np.arange(rows, dtype=float) ])
+
+    def test_append_read(self):
+        history = History(self.directory, self.columns)
+        for generation in range(1, 4):
+            history.append(generation, self.block(generation))
+
+        self.assertEqual(history.generations(), [1, 2, 3])
+        df = History(self.directory).read()
+        self.assertEqual(list(df.columns), ['generation'] + self.columns)
+        self.assertEqual(len(df), 9)
+        np.testing.assert_array_equal(df['generation'], df['axial'])
+
+        df = History(self.directory).read(['outlet'], generations=[2], with_generation=False)
+        self.assertEqual(list(df.columns), ['outlet'])
+        np.testing.assert_array_equal(df['outlet'], [0.0, 1.0, 2.0])
+
+        with self.assertRaises(ValueError):
+            history.append(4, np.zeros((3, 3)))
+
+    def test_truncate_on_resume(self):
+        history = History(self.directory, self.columns)
+        for generation in range(1, 5):
+            history.append(generation, self.block(generation))
+
+        # Resuming from a checkpoint of generation 2 appends generation 3 again
+        resumed = History(self.directory, self.columns)
+        resumed.truncate(2)
+        resumed.append(3, self.block(30, rows=2))
+
+        self.assertEqual(resumed.generations(), [1, 2, 3])
+        self.assertFalse((self.directory / History.block_name(4)).exists())
+        np.testing.assert_array_equal(resumed.read(generations=[3])['axial'], [30.0, 30.0])
+
+        # Appending an already stored generation drops it and the later ones, too
+        resumed.append(2, self.block(20))
+        self.assertEqual(resumed.generations(), [1, 2])
+        self.assertFalse((self.directory / History.block_name(3)).exists())
+
+    def test_index_is_source_of_truth(self):
+        history = History(self.directory, self.columns)
+        history.append(1, self.block(1))
+        # A block written without its index entry (e.g. killed in between) is ignored
+        np.save(self.directory / History.block_name(2), self.block(2))
+        self.assertEqual(History(self.directory).generations(), [1])
+        self.assertEqual(len(History(self.directory).read()), 3)
+
+    def test_other_columns_discarded(self):
+        History(self.directory, self.columns).append(1, self.block(1))
+        history = History(self.directory, ['axial', 'outlet', 'fidelity'])
+        self.assertEqual(history.generations(), [])
+        self.assertEqual(json.loads((self.directory / 'columns.json').read_text()), ['axial', 'outlet', 'fidelity'])
@@ -0,0 +1,75 @@
+import unittest
+
+import numpy as np
+
+from chromoo.cadetSimulation import CadetSimulation
+from chromoo.objective import Objective, evaluate_population
+from chromoo.scores import scores_dict
+
+PATH = 'output.solution.unit_002.solution_bulk'
+
+def individual_scores(obj, sim):
+    """ Scores of one simulation as they were computed before batch scoring: time along axis 0 """
+    scores = scores_dict[obj.score](obj.y0, obj.process(sim))
+    if obj.combine_scores_axis is not None:
+        scores = np.average(scores, axis=obj.combine_scores_axis)
+    return np.ravel(scores)
+
+class TestObjective(unittest.TestCase):
+
+    def setUp(self):
+        # Bulk data of shape (nts, ncol, nrad) for a small population
+        rng = np.random.default_rng(3)
+        self.sims = []
+        for _ in range(5):
+            sim = CadetSimulation()
+            sim.root.output.solution.unit_002.solution_bulk = rng.uniform(0.1, 1.0, (20, 4, 3))
+            self.sims.append(sim)
+        self.rng = rng
+
+    def objective(self, reference_shape, **kwargs):
+        y0 = self.rng.uniform(0.1, 1.0, reference_shape)
+        return Objective('bulk', '', PATH, shape=reference_shape, y0=y0, ignore_reference=True, **kwargs)
+
+    def assert_equivalent(self, objectives):
+        processed = [ [ obj.process(sim) for obj in objectives ] for sim in self.sims ]
+        F = evaluate_population(objectives, processed)
+
+        expected = np.array([ np.hstack([ individual_scores(obj, sim) for obj in objectives ]) for sim in self.sims ])
+        self.assertEqual(F.shape, expected.shape)
+        np.testing.assert_allclose(F, expected, rtol=1e-12)
+
+        # Objective.evaluate() scores a single simulation
+        for sim, f in zip(self.sims, F):
+            np.testing.assert_allclose(np.hstack([ obj.evaluate(sim) for obj in objectives ]), f, rtol=1e-12)
+
+    def test_scores(self):
+        for score in scores_dict:
+            with self.subTest(score=score):
+                self.assert_equivalent([ self.objective((20, 4, 3), score=score) ])
+
+    def test_combine_data_axis(self):
+        for axis in [1, 2]:
+            with self.subTest(axis=axis):
+                shape = (20, 3) if axis == 1 else (20, 4)
+                self.assert_equivalent([ self.objective(shape, combine_data_axis=axis, score='rmse') ])
+
+    def test_sum_data_axis(self):
+        for axis in [1, 2]:
+            with self.subTest(axis=axis):
+                shape = (20, 3) if axis == 1 else (20, 4)
+                self.assert_equivalent([ self.objective(shape, sum_data_axis=axis, score='sse') ])
+
+    def test_combine_scores_axis(self):
+        for axis in [0, 1, -1]:
+            with self.subTest(axis=axis):
+                self.assert_equivalent([ self.objective((20, 4, 3), combine_scores_axis=axis, score='nrmse') ])
+
+    def test_combined_options(self):
+        # Radial profile averaged along the column, scores averaged over the radial zones
+        objectives = [
+            self.objective((20, 3), combine_data_axis=1, combine_scores_axis=0, score='logsse'),
+            self.objective((20, 4), sum_data_axis=2, score='logrmse'),
+            self.objective((20, 4), take=(2, 1), score='sse'),
+        ]
+        self.assert_equivalent(objectives)
@@ -0,0 +1,56 @@
+import unittest
+from collections import deque
+
+import numpy as np
+
+from chromoo.scheduler import RuntimePredictor, Scheduler
+
+class TestScheduler(unittest.TestCase):
+
+    def trained(self, **kwargs):
+        scheduler = Scheduler(min_samples=5, **kwargs)
+        for x in np.linspace(0, 1, 20):
+            scheduler.predictor.observe(None, [x], np.exp(1.0 + 2.0 * x))
+        return scheduler
+
+    def test_predictor(self):
+        predictor = RuntimePredictor(min_samples=5)
+        self.assertIsNone(predictor.predict([[0.5]]))
+        for x in np.linspace(0, 1, 10):
+            predictor.observe(None, [x], np.exp(1.0 + 2.0 * x))
+        # Failed (zero time) evaluations aren't observed
+        predictor.observe(None, [0.5], 0.0)
+        self.assertEqual(len(predictor.samples[None]), 10)
+        np.testing.assert_allclose(predictor.predict([[0.25], [0.75]]), np.exp([1.5, 2.5]), rtol=0.05)
+        # Other variants (fidelity levels) are trained separately
+        self.assertIsNone(predictor.predict([[0.5]], variant=0))
+
+    def test_plan(self):
+        indices = [10, 11, 12, 13]
+        features = [[0.1], [0.9], [0.5], [0.7]]
+
+        order, expected = Scheduler(min_samples=5).plan(indices, features)
+        self.assertEqual((order, expected), (indices, {}))
+
+        order, expected = self.trained().plan(indices, features)
+        self.assertEqual(order, [11, 13, 12, 10])
+        self.assertEqual(set(expected), set(indices))
+
+        order, _ = self.trained(order='fifo').plan(indices, features)
+        self.assertEqual(order, indices)
+
+    def test_chunk(self):
+        scheduler = Scheduler(chunking=True, chunk_factor=2.0, max_chunk=3)
+        # Without predictions, tasks go one by one
+        self.assertEqual(scheduler.chunk(deque([0, 1, 2]), {}, 2), 1)
+        self.assertEqual(Scheduler(chunking=False).chunk(deque([0, 1]), {0: 1.0, 1: 1.0}, 2), 1)
+
+        expected = { 0: 8.0, 1: 1.0, 2: 1.0, 3: 1.0, 4: 1.0, 5: 1.0, 6: 1.0, 7: 1.0, 8: 1.0 }
+        # Target: 16 / (2 x 2) = 4, a long task goes alone
+        self.assertEqual(scheduler.chunk(deque(range(9)), expected, 2), 1)
+        # Target: 8 / 4 = 2, two short tasks
+        self.assertEqual(scheduler.chunk(deque(range(1, 9)), expected, 2), 2)
+        # Target: 8 / 2 = 4, at most max_chunk
+        self.assertEqual(scheduler.chunk(deque(range(1, 9)), expected, 1), 3)
+        # Small remainders go one by one
+        self.assertEqual(scheduler.chunk(deque([7, 8]), expected, 2), 1)
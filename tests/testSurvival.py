@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+
+from pymoo.algorithms.moo import nsga3
+from pymoo.core.population import Population
+from pymoo.core.problem import Problem
+from pymoo.util.nds.non_dominated_sorting import NonDominatedSorting
+from pymoo.util.reference_direction import UniformReferenceDirectionFactory
+
+from chromoo.survival import associate_to_niches, get_survival, non_dominated_fronts
+
+class TestSurvival(unittest.TestCase):
+
+    def populations(self):
+        random = np.random.RandomState(42)
+        yield random.random_sample((50, 2))
+        yield random.random_sample((120, 3))
+        # Ties and duplicates
+        yield random.randint(0, 4, size=(80, 3)).astype(float)
+        yield np.ones((5, 2))
+
+    def test_non_dominated_fronts(self):
+        for F in self.populations():
+            for n_stop in [None, len(F) // 2]:
+                kwargs = {} if n_stop is None else {'n_stop_if_ranked': n_stop}
+                fronts, rank = NonDominatedSorting().do(F, return_rank=True, **kwargs)
+                fast_fronts, fast_rank = non_dominated_fronts(F, n_stop)
+
+                self.assertEqual(len(fast_fronts), len(fronts))
+                for front, fast_front in zip(fronts, fast_fronts):
+                    self.assertEqual(sorted(front), sorted(fast_front))
+                np.testing.assert_array_equal(fast_rank, rank)
+
+    def test_associate_to_niches(self):
+        ref_dirs = UniformReferenceDirectionFactory(3, n_partitions=6).do()
+        F = np.random.RandomState(1).random_sample((60, 3))
+        ideal, nadir = F.min(axis=0), F.max(axis=0)
+
+        niches, distances, matrix = nsga3.associate_to_niches(F, ref_dirs, ideal, nadir)
+        fast_niches, fast_distances, fast_matrix = associate_to_niches(F, ref_dirs, ideal.copy(), nadir.copy())
+
+        np.testing.assert_array_equal(fast_niches, niches)
+        np.testing.assert_allclose(fast_distances, distances, atol=1e-12)
+        np.testing.assert_allclose(fast_matrix, matrix, atol=1e-12)
+
+    def test_survivors(self):
+        ref_dirs = UniformReferenceDirectionFactory(3, n_partitions=6).do()
+        problem = Problem(n_var=2, n_obj=3)
+        F = np.random.RandomState(7).random_sample((56, 3))
+        n_survive = 28
+
+        _, rank = NonDominatedSorting().do(F, return_rank=True)
+        survivors = {}
+        for name in ['default', 'fast']:
+            pop = Population.new(X=np.arange(len(F))[:, np.newaxis], F=F)
+            survivors[name] = get_survival(name, ref_dirs).do(problem, pop, n_survive=n_survive).get('X')[:, 0].astype(int)
+            self.assertEqual(len(survivors[name]), n_survive)
+            self.assertEqual(len(set(survivors[name])), n_survive)
+
+        # Niching picks randomly within the last front, the fronts before it survive in both
+        last = max(rank[survivors['default']])
+        self.assertEqual(last, max(rank[survivors['fast']]))
+        for name in survivors:
+            self.assertEqual(set(survivors[name][rank[survivors[name]] < last]), set(np.flatnonzero(rank < last)))
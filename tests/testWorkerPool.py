@@ -0,0 +1,170 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from addict import Dict
+from cadet import Cadet
+
+from chromoo import ChromooProblem, ConfigHandler
+from chromoo.cadetSimulation import new_run_and_eval
+from chromoo.failurePolicy import EvaluationFailure
+
+ROOT = Path(__file__).resolve().parent.parent
+EXAMPLE = ROOT / 'examples' / '10k-mono-1d-p2'
+
+class TestWorkerPool(unittest.TestCase):
+    """ Evaluations through the worker pool, with the synthetic cadet-cli of the benchmarks """
+
+    def setUp(self):
+        self.tempdir = Path(tempfile.mkdtemp())
+        # Loading a simulation may look cadet-cli up on the PATH again
+        self.env = mock.patch.dict(os.environ, {
+            'PATH': f"{ROOT / 'benchmarks'}{os.pathsep}{os.environ.get('PATH', '')}",
+            'CHROMOO_CACHE_DIR': str(self.tempdir / 'cache'),
+            'CHROMOO_FAKE_CADET_SLEEP': '0.05',
+        })
+        self.env.start()
+        self.cadet_path = Cadet.cadet_path
+
+        config = ConfigHandler()
+        config.config = Dict({
+            'filename': str(EXAMPLE / '10k-mono.mono1d.yaml'),
+            'parameters': [ { 'name': 'col_dispersion', 'type': 'scalar', 'path': 'input.model.unit_002.col_dispersion', 'min_value': 1.0e-12, 'max_value': 1.0e-4 } ],
+            'objectives': [ { 'name': 'outlet', 'filename': str(EXAMPLE / 'chromatogram-corrected.csv'), 'path': 'output.solution.unit_003.solution_outlet_comp_000' } ],
+            'transforms': { 'parameters': 'lognorm' },
+        })
+        config.load()
+        config.construct_simulation()
+        self.config = config
+        Cadet.cadet_path = str(ROOT / 'benchmarks' / 'cadet-cli')
+
+        self.X = np.random.default_rng(7).random((8, 1))
+
+    def tearDown(self):
+        Cadet.cadet_path = self.cadet_path
+        self.env.stop()
+        shutil.rmtree(self.tempdir)
+
+    def problem(self, nproc=2, failures=None, timeout=None):
+        failures = { 'log': str(self.tempdir / 'failures.jsonl'), **(failures or {}) }
+        return ChromooProblem(self.config.simulation, self.config.parameters, self.config.objectives, nproc=nproc, tempdir=self.tempdir / 'temp', transform=self.config.parameter_transform, failures=failures, timeout=timeout)
+
+    def simulate(self, X, **kwargs):
+        """ Scores of X and the pool's failure log entries """
+        problem = self.problem(**kwargs)
+        try:
+            F = problem.simulate(X)
+        finally:
+            problem.close()
+        log = self.tempdir / 'failures.jsonl'
+        entries = [ json.loads(line) for line in log.read_text().splitlines() ] if log.exists() else []
+        log.unlink(missing_ok=True)
+        self.assertEqual(list((self.tempdir / 'temp').glob('.cancel-*')), [])
+        return F, problem, entries
+
+    def reference(self):
+        """ Scores of self.X without failures """
+        F, _, entries = self.simulate(self.X)
+        self.assertEqual(entries, [])
+        self.assertFalse(np.isnan(F).any())
+        return F
+
+    def test_scores(self):
+        F = self.reference()
+
+        # Same scores as single evaluations outside the pool
+        problem = self.problem()
+        for x, f in zip(problem.denormalize(self.X[:2]), F):
+            np.testing.assert_allclose(new_run_and_eval(x, self.config.simulation, problem.plan, self.config.objectives, tempdir=self.tempdir / 'temp'), f)
+        problem.close()
+
+    def test_failures(self):
+        F_ok = self.reference()
+
+        # Synthetic failures of a deterministic subset of the parameter sets
+        os.environ['CHROMOO_FAKE_CADET_FAIL'] = '0.5'
+        F, problem, entries = self.simulate(self.X, failures={ 'retries': 1 })
+        failed = problem.failures.failed(F)
+        self.assertTrue(0 < failed.sum() < len(F))
+        np.testing.assert_array_equal(F[~failed], F_ok[~failed])
+
+        # Every attempt is logged, the retry with relaxed tolerances
+        self.assertEqual(len(entries), 2 * failed.sum())
+        self.assertEqual(sorted(set(entry['attempt'] for entry in entries)), [0, 1])
+        self.assertFalse(any(entry['succeeded'] for entry in entries))
+
+        # Marked infeasible by default, only penalized with mode: penalty
+        F_penalized, G = problem.penalize(F)
+        np.testing.assert_array_equal(F_penalized[failed], problem.failures.penalty)
+        np.testing.assert_array_equal(F_penalized[~failed], F_ok[~failed])
+        np.testing.assert_array_equal(G[:, 0], failed.astype(float))
+
+        _, problem, _ = self.simulate(self.X[:1], failures={ 'mode': 'penalty' })
+        self.assertEqual(problem.n_constr, 0)
+        self.assertIsNone(problem.penalize(F)[1])
+
+    def test_relaxed_retry(self):
+        F_ok = self.reference()
+
+        # Failing parameter sets succeed once the reltol (1e-10 in the template) is relaxed
+        os.environ['CHROMOO_FAKE_CADET_FAIL'] = '0.5'
+        os.environ['CHROMOO_FAKE_CADET_FAIL_RELTOL'] = '5e-10'
+        F, _, entries = self.simulate(self.X, failures={ 'retries': 1 })
+        np.testing.assert_array_equal(F, F_ok)
+        self.assertTrue(entries)
+        self.assertTrue(all(entry['succeeded'] and entry['attempt'] == 0 for entry in entries))
+
+    def test_abort(self):
+        os.environ['CHROMOO_FAKE_CADET_FAIL'] = '0.5'
+        with self.assertRaises(EvaluationFailure):
+            self.simulate(self.X, failures={ 'retries': 0, 'mode': 'abort' })
+
+    def straggler(self, timeout):
+        """ Scores of a batch with one hanging simulation after a warmup batch, (F, F without failures, failure log entries, seconds) """
+        F_ok = self.reference()
+
+        os.environ['CHROMOO_FAKE_CADET_FAIL'] = '0.5'
+        F, problem, _ = self.simulate(self.X, failures={ 'retries': 0 })
+        failed = problem.failures.failed(F)
+        X = np.vstack([ self.X[failed][:1], self.X[~failed][:3] ])
+
+        os.environ['CHROMOO_FAKE_CADET_FAIL_MODE'] = 'hang'
+        problem = self.problem(failures={ 'retries': 1 }, timeout={ 'speculate': True, 'min_samples': 3, **timeout })
+        try:
+            problem.simulate(self.X[~failed])
+            start = time.monotonic()
+            F = problem.simulate(X)
+            seconds = time.monotonic() - start
+        finally:
+            problem.close()
+
+        self.assertEqual(list((self.tempdir / 'temp').glob('.cancel-*')), [])
+        self.assertEqual(subprocess.run(['pgrep', '-f', str(self.tempdir)], capture_output=True).stdout, b'')
+
+        log = self.tempdir / 'failures.jsonl'
+        entries = [ json.loads(line) for line in log.read_text().splitlines() ] if log.exists() else []
+        return F, np.vstack([ F_ok[failed][:1], F_ok[~failed][:3] ]), entries, seconds
+
+    def test_straggler_duplicate(self):
+        # The duplicate starts with relaxed tolerances and succeeds, the hanging copy is cancelled
+        os.environ['CHROMOO_FAKE_CADET_FAIL_RELTOL'] = '5e-10'
+        F, F_ok, entries, seconds = self.straggler({ 'seconds': 60 })
+        np.testing.assert_array_equal(F, F_ok)
+        self.assertEqual(entries, [])
+        self.assertLess(seconds, 30)
+
+    def test_straggler_both_fail(self):
+        # Both copies hang until killed by the time budget: the first failure is held until the other copy failed as well
+        F, F_ok, entries, seconds = self.straggler({ 'seconds': 2 })
+        self.assertTrue(np.isnan(F[0]).all())
+        np.testing.assert_array_equal(F[1:], F_ok[1:])
+        self.assertEqual(sorted(entry['attempt'] for entry in entries), [0, 1, 1])
+        self.assertTrue(all(entry['error'] == 'SimulationTimeout' and not entry['succeeded'] for entry in entries))
+        self.assertLess(seconds, 30)
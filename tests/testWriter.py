@@ -0,0 +1,70 @@
+import threading
+import unittest
+
+from chromoo.writer import BackgroundWriter
+
+class TestWriter(unittest.TestCase):
+
+    def blocked(self):
+        """ A writer whose thread waits on an event, so that submitted tasks stay pending """
+        writer = BackgroundWriter()
+        started, release = threading.Event(), threading.Event()
+        writer.submit(None, lambda: (started.set(), release.wait()))
+        started.wait()
+        return writer, release
+
+    def test_order(self):
+        written = []
+        with BackgroundWriter() as writer:
+            for i in range(20):
+                writer.submit(None, written.append, i)
+        self.assertEqual(written, list(range(20)))
+        self.assertEqual(writer.n_written, 20)
+
+    def test_coalescing(self):
+        written = []
+        writer, release = self.blocked()
+        writer.submit(None, written.append, 'row 1')
+        writer.submit('opts', written.append, 'opts 1')
+        writer.submit(None, written.append, 'row 2')
+        writer.submit('opts', written.append, 'opts 2')
+        release.set()
+        writer.close()
+
+        # Only the newest pending task of a key runs, after the tasks submitted before it
+        self.assertEqual(written, ['row 1', 'row 2', 'opts 2'])
+        self.assertEqual(writer.n_coalesced, 1)
+
+    def test_started_task_not_replaced(self):
+        written = []
+        writer = BackgroundWriter()
+        started, release = threading.Event(), threading.Event()
+        writer.submit('opts', lambda: (started.set(), release.wait(), written.append('opts 1')))
+        started.wait()
+        writer.submit('opts', written.append, 'opts 2')
+        release.set()
+        writer.close()
+        self.assertEqual(written, ['opts 1', 'opts 2'])
+        self.assertEqual(writer.n_coalesced, 0)
+
+    def test_bounded_and_failures(self):
+        written = []
+        writer, release = self.blocked()
+        writer.maxsize = 2
+        writer.submit(None, written.append, 1)
+        writer.submit(None, lambda: 1 / 0)
+
+        # A full queue blocks the submitter until the writer catches up
+        submitter = threading.Thread(target=writer.submit, args=(None, written.append, 2))
+        submitter.start()
+        submitter.join(0.2)
+        self.assertTrue(submitter.is_alive())
+
+        release.set()
+        submitter.join()
+        writer.flush()
+        # A failing task doesn't stop the writer
+        self.assertEqual(written, [1, 2])
+        writer.close()
+        with self.assertRaises(RuntimeError):
+            writer.submit(None, written.append, 3)